@@ -0,0 +1,94 @@
+import os
+import re
+import hmac
+from functools import wraps
+from flask import Blueprint, jsonify, request
+from dotenv import load_dotenv
+import profiler
+import catalog_memory
+from xml_utils import fragment_cache
+from db import query_stats, DB_SLOW_QUERY_MS
+
+load_dotenv()
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+bp = Blueprint("admin", __name__)
+
+def admin_required(fn):
+    """Require the X-Admin-Token header to match ADMIN_TOKEN.
+
+    Admin endpoints are disabled entirely (404) while ADMIN_TOKEN is unset.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ADMIN_TOKEN:
+            return jsonify({'error': 'Not found'}), 404
+        token = request.headers.get('X-Admin-Token', '')
+        if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({'error': 'Invalid admin token'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
+
+@bp.route('/profile', methods=['GET'])
+@admin_required
+def profile_status():
+    """Show the profiling switch and the stored profiles."""
+    return jsonify(profiler.status())
+
+@bp.route('/profile', methods=['POST'])
+@admin_required
+def arm_profile():
+    """Profile the next matching requests.
+
+    JSON body: {"pattern": "^/api/books$", "count": 10, "ttl": 300}
+    `pattern` is a regex matched against the route rule.
+    """
+    data = request.get_json(silent=True) or {}
+    pattern = data.get('pattern')
+    if not pattern:
+        return jsonify({'error': 'pattern is required'}), 400
+    try:
+        profiler.arm(pattern, data.get('count', 10), data.get('ttl', 300))
+    except (re.error, TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify(profiler.status()), 200
+
+@bp.route('/profile', methods=['DELETE'])
+@admin_required
+def disarm_profile():
+    """Turn the profiling switch off."""
+    profiler.disarm()
+    return jsonify(profiler.status()), 200
+
+@bp.route('/queries', methods=['GET'])
+@admin_required
+def query_stats_report():
+    """Per-fingerprint SQL statistics, slowest total time first.
+
+    Query params: limit (default 50)
+    """
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'slow_threshold_ms': DB_SLOW_QUERY_MS,
+        'queries': query_stats.snapshot()[:limit],
+    })
+
+@bp.route('/queries/slow', methods=['GET'])
+@admin_required
+def slow_queries():
+    """Most recent statements over DB_SLOW_QUERY_MS, with their EXPLAIN plans."""
+    return jsonify({'slow_threshold_ms': DB_SLOW_QUERY_MS, 'entries': list(query_stats.slow)[::-1]})
+
+@bp.route('/queries', methods=['DELETE'])
+@admin_required
+def reset_query_stats():
+    """Clear the collected SQL statistics."""
+    query_stats.reset()
+    return jsonify({'message': 'Query stats reset'}), 200
+
+@bp.route('/catalog', methods=['GET'])
+@admin_required
+def catalog_memory_stats():
+    """Rows, memory per column and age of the in-memory catalog, plus XML fragment cache stats."""
+    return jsonify(dict(catalog_memory.stats(), fragment_cache=fragment_cache.stats()))
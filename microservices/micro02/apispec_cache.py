@@ -0,0 +1,136 @@
+"""
+Serve /apispec.json as a cached static payload.
+
+The spec is read from APISPEC_PATH when it was generated at build time
+(`python apispec_cache.py`), otherwise it is generated once per process on the
+first request. Either way it is served as pre-encoded bytes with an ETag, so
+Flasgger never re-parses the view docstrings on the request path.
+
+The prebuilt file records a fingerprint of the view docstrings it was built
+from. If the routes or docstrings changed since, the file is ignored (with a
+warning) and the spec is generated live, or, with SWAGGER_UI=false, the stale
+file is still served. Rebuild the file on every deploy.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from flask import Response, request
+from dotenv import load_dotenv
+
+load_dotenv()
+
+APISPEC_PATH = os.getenv(
+    "APISPEC_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "apispec.json")
+)
+APISPEC_MAX_AGE = int(os.getenv("APISPEC_MAX_AGE", "300"))
+FINGERPRINT_KEY = "x-source-fingerprint"
+
+_payload = None
+_etag = None
+_lock = threading.Lock()
+
+
+def _set_payload(payload):
+    global _payload, _etag
+    _etag = hashlib.sha256(payload).hexdigest()[:32]
+    _payload = payload
+
+
+def encode_spec(spec):
+    """Serialize a spec dict to the bytes served by /apispec.json."""
+    return json.dumps(spec, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def source_fingerprint(app):
+    """Hash the endpoints and view docstrings the spec is generated from."""
+    digest = hashlib.sha256()
+    for endpoint in sorted(app.view_functions):
+        if endpoint in ("static", "apispec") or endpoint.startswith("flasgger."):
+            continue
+        digest.update(endpoint.encode("utf-8") + b"\0")
+        digest.update((app.view_functions[endpoint].__doc__ or "").encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+def _load_payload(app, build_spec):
+    if os.path.exists(APISPEC_PATH):
+        with open(APISPEC_PATH, "rb") as f:
+            payload = f.read()
+        try:
+            fingerprint = json.loads(payload).get(FINGERPRINT_KEY)
+        except ValueError:
+            fingerprint = None
+        if fingerprint == source_fingerprint(app):
+            _set_payload(payload)
+            return
+        print(f"Warning: {APISPEC_PATH} does not match the current views; "
+              f"rebuild it with python apispec_cache.py")
+        if build_spec is None:
+            _set_payload(payload)
+            return
+
+    if build_spec is not None:
+        _set_payload(encode_spec(build_spec()))
+
+
+def register_cached_apispec(app, build_spec):
+    """Serve /apispec.json from a cached payload.
+
+    Args:
+        app: Flask application
+        build_spec: callable returning the spec dict, used when no prebuilt
+            file exists at APISPEC_PATH or it is stale (None if the spec
+            cannot be built)
+    """
+    def apispec():
+        # Loaded on the first request, once every route has been registered
+        if _payload is None:
+            with _lock:
+                if _payload is None:
+                    _load_payload(app, build_spec)
+            if _payload is None:
+                return Response(status=404)
+
+        if _etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(_payload, mimetype="application/json")
+        response.set_etag(_etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = APISPEC_MAX_AGE
+        return response
+
+    if "flasgger.apispec" in app.view_functions:
+        app.view_functions["flasgger.apispec"] = apispec
+    else:
+        app.add_url_rule("/apispec.json", "apispec", apispec)
+
+
+def build_spec_file(path=APISPEC_PATH):
+    """Generate the spec from the app's docstrings and write it to `path`."""
+    import main
+
+    swagger = main.swagger
+    if swagger is None:
+        # SWAGGER_UI=false: attach a Flasgger instance just for this build
+        from flasgger import Swagger
+        swagger = Swagger(main.app, config=main.swagger_config, template=main.swagger_template)
+
+    with main.app.test_request_context():
+        spec = dict(swagger.get_apispecs("apispec"))
+    spec[FINGERPRINT_KEY] = source_fingerprint(main.app)
+    payload = encode_spec(spec)
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(payload)
+    os.replace(tmp_path, path)
+    return path
+
+
+if __name__ == "__main__":
+    import sys
+    print(f"Wrote {build_spec_file(*sys.argv[1:2])}")
@@ -0,0 +1,578 @@
+"""
+Async serving mode for the Books API.
+
+Serves the same /auth and /api/books routes and XML contract as main.py, but
+on an asyncio event loop with aiomysql and redis.asyncio, so a single process
+can keep thousands of requests in flight while they wait on MariaDB or Redis.
+Tokens are interchangeable with the Flask app (same secret, claims and Redis
+allowlist keys).
+
+Run with: uvicorn async_app:app --host 0.0.0.0 --port 5001
+"""
+
+import os
+import time
+import uuid
+import hashlib
+import tempfile
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+import jwt
+import aiomysql
+import pymysql
+import redis.asyncio as aioredis
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from xml_utils import books_to_xml, changes_to_xml, create_error_xml, create_success_xml
+from image_pipeline import IMAGE_MAX_BYTES, IMAGE_TMP_DIR, ImageTooLarge, submit_image_job
+import sync
+import change_stream
+import search
+
+load_dotenv()
+
+JWT_SECRET = os.getenv('JWT_SECRET', 'your-secret-key')
+JWT_ALGORITHM = 'HS256'
+ACCESS_EXPIRES = timedelta(minutes=int(os.getenv('JWT_ACCESS_MIN', 15)))
+REFRESH_EXPIRES = timedelta(days=int(os.getenv('JWT_REFRESH_DAYS', 30)))
+
+db_pool = None
+r = None
+
+
+def xml_response(xml, status=200):
+    return Response(xml, status_code=status, media_type='application/xml')
+
+
+def xml_error(message, status):
+    return xml_response(create_error_xml(message), status)
+
+
+async def render_books(rows):
+    """books_to_xml in a worker thread: minidom on a large list would block every request on the loop."""
+    return await run_in_threadpool(books_to_xml, rows)
+
+
+async def read_json(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    return data
+
+
+# --- Tokens (compatible with flask_jwt_extended) ---------------------------
+
+def allow_key(token_type, jti):
+    """Generate allowlist key for Redis."""
+    return f"allow:{token_type}:{jti}"
+
+def block_key(jti):
+    """Generate blocklist key for Redis."""
+    return f"block:{jti}"
+
+def ttl_from_exp(exp):
+    """Calculate TTL from expiration timestamp."""
+    return max(1, exp - int(time.time()))
+
+def encode_token(identity, token_type):
+    """Create a token with the same claims flask_jwt_extended produces."""
+    now = datetime.now(timezone.utc)
+    expires = ACCESS_EXPIRES if token_type == 'access' else REFRESH_EXPIRES
+    claims = {
+        'fresh': False,
+        'iat': now,
+        'jti': str(uuid.uuid4()),
+        'type': token_type,
+        'sub': identity,
+        'nbf': now,
+        'exp': now + expires,
+    }
+    return jwt.encode(claims, JWT_SECRET, algorithm=JWT_ALGORITHM), claims
+
+async def store_allow(claims, username):
+    """Store token in allowlist with TTL."""
+    jti = claims['jti']
+    exp = int(claims['exp'].timestamp())
+    key = allow_key(claims['type'], jti)
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.hset(key, mapping={"u": username, "t": claims['type'], "exp": exp})
+        pipe.expire(key, ttl_from_exp(exp))
+        await pipe.execute()
+    return jti
+
+async def is_revoked_or_unknown(jti):
+    """Check the blocklist and both allowlists in a single round trip."""
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.exists(block_key(jti))
+        pipe.exists(allow_key("access", jti))
+        pipe.exists(allow_key("refresh", jti))
+        blocked, access, refresh = await pipe.execute()
+    return blocked == 1 or not (access == 1 or refresh == 1)
+
+async def revoke(jti, exp):
+    """Revoke token by adding to blocklist and removing from allowlist."""
+    async with r.pipeline(transaction=False) as pipe:
+        pipe.setex(block_key(jti), ttl_from_exp(exp), "1")
+        pipe.delete(allow_key("access", jti), allow_key("refresh", jti))
+        await pipe.execute()
+
+
+def jwt_required(refresh=False):
+    """Async equivalent of flask_jwt_extended.jwt_required with the same error bodies."""
+    def decorator(fn):
+        @wraps(fn)
+        async def wrapper(request):
+            header = request.headers.get('Authorization')
+            if not header:
+                return JSONResponse({'msg': 'Missing Authorization Header'}, 401)
+            parts = header.split()
+            if len(parts) != 2 or parts[0] != 'Bearer':
+                return JSONResponse({'msg': "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'"}, 422)
+            try:
+                claims = jwt.decode(parts[1], JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            except jwt.ExpiredSignatureError:
+                return JSONResponse({'msg': 'Token has expired'}, 401)
+            except jwt.InvalidTokenError as e:
+                return JSONResponse({'msg': str(e)}, 422)
+
+            if refresh and claims.get('type') != 'refresh':
+                return JSONResponse({'msg': 'Only refresh tokens are allowed'}, 422)
+            if not refresh and claims.get('type') == 'refresh':
+                return JSONResponse({'msg': 'Only non-refresh tokens are allowed'}, 422)
+            if await is_revoked_or_unknown(claims['jti']):
+                return JSONResponse({'msg': 'Token has been revoked'}, 401)
+
+            request.state.jwt = claims
+            return await fn(request)
+        return wrapper
+    return decorator
+
+
+# --- Auth routes -----------------------------------------------------------
+
+async def register(request):
+    try:
+        data = await read_json(request)
+        username = data.get('username')
+        password = data.get('password')
+
+        if not username or not password:
+            return JSONResponse({'error': 'Username and password required'}, 400)
+
+        hashed_password = hashlib.sha256(password.encode()).hexdigest()
+
+        async with db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                try:
+                    await cursor.execute(
+                        "INSERT INTO usuarios (username, password) VALUES (%s, %s)",
+                        (username, hashed_password)
+                    )
+                    await conn.commit()
+                    return JSONResponse({'message': 'User registered successfully'}, 201)
+                except pymysql.IntegrityError:
+                    return JSONResponse({'error': 'Username already exists'}, 409)
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, 500)
+
+async def login(request):
+    try:
+        data = await read_json(request)
+        username = data.get('username')
+        password = data.get('password')
+
+        if not username or not password:
+            return JSONResponse({'error': 'Username and password required'}, 400)
+
+        async with db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    "SELECT id, password FROM usuarios WHERE username = %s",
+                    (username,)
+                )
+                user = await cursor.fetchone()
+
+        if not user or hashlib.sha256(password.encode()).hexdigest() != user['password']:
+            return JSONResponse({'error': 'Invalid credentials'}, 401)
+
+        access_token, access_claims = encode_token(username, 'access')
+        refresh_token, refresh_claims = encode_token(username, 'refresh')
+        await store_allow(access_claims, username)
+        await store_allow(refresh_claims, username)
+
+        return JSONResponse({
+            'access_token': access_token,
+            'refresh_token': refresh_token,
+            'username': username
+        }, 200)
+
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, 500)
+
+@jwt_required(refresh=True)
+async def refresh(request):
+    try:
+        current_user = request.state.jwt['sub']
+        access_token, claims = encode_token(current_user, 'access')
+        await store_allow(claims, current_user)
+        return JSONResponse({'access_token': access_token}, 200)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, 500)
+
+@jwt_required()
+async def logout(request):
+    try:
+        await revoke(request.state.jwt['jti'], request.state.jwt['exp'])
+        return JSONResponse({'message': 'Successfully logged out'}, 200)
+    except Exception as e:
+        return JSONResponse({'error': str(e)}, 500)
+
+
+# --- Book routes -----------------------------------------------------------
+
+async def fetch_all(query, args=None):
+    async with db_pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            await cursor.execute(query, args)
+            return await cursor.fetchall()
+
+@jwt_required()
+async def get_all_books(request):
+    try:
+        books = await fetch_all("SELECT * FROM libros ORDER BY titulo")
+        return xml_response(await render_books(books))
+    except Exception as e:
+        return xml_error(f"Error retrieving books: {str(e)}", 500)
+
+@jwt_required()
+async def get_book_by_isbn(request):
+    try:
+        isbn = request.query_params.get('isbn')
+        if not isbn:
+            return xml_error("ISBN parameter is required", 400)
+
+        books = await fetch_all("SELECT * FROM libros WHERE isbn = %s", (isbn,))
+        if books:
+            return xml_response(books_to_xml(books[:1]))
+        return xml_error("Book not found", 404)
+    except Exception as e:
+        return xml_error(f"Error retrieving book: {str(e)}", 500)
+
+@jwt_required()
+async def get_books_by_format(request):
+    try:
+        format_type = request.query_params.get('format')
+        if not format_type:
+            return xml_error("Format parameter is required", 400)
+
+        books = await fetch_all("SELECT * FROM libros WHERE formato = %s ORDER BY titulo", (format_type,))
+        return xml_response(await render_books(books))
+    except Exception as e:
+        return xml_error(f"Error retrieving books by format: {str(e)}", 500)
+
+@jwt_required()
+async def get_books_by_author(request):
+    try:
+        author_name = request.query_params.get('name')
+        if not author_name:
+            return xml_error("Name parameter is required", 400)
+
+        books = await fetch_all("SELECT * FROM libros WHERE autor LIKE %s ORDER BY titulo", (f"%{author_name}%",))
+        return xml_response(await render_books(books))
+    except Exception as e:
+        return xml_error(f"Error retrieving books by author: {str(e)}", 500)
+
+@jwt_required()
+async def search_books(request):
+    try:
+        try:
+            plan = search.plan(request.query_params)
+        except search.SearchError as e:
+            return xml_error(str(e), 400)
+
+        rows = await fetch_all(plan.sql, plan.params)
+        response = xml_response(await render_books(rows[:plan.limit]))
+        response.headers['X-Search-Plan'] = plan.index
+        next_cursor = plan.next_cursor(rows)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+    except Exception as e:
+        return xml_error(f"Error searching books: {str(e)}", 500)
+
+@jwt_required()
+async def get_book_changes(request):
+    try:
+        since = request.query_params.get('since')
+        async with db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                try:
+                    token, rows, deleted = await sync.changes_async(cursor, since)
+                except sync.InvalidToken as e:
+                    return xml_error(str(e), 400)
+                except sync.TokenExpired as e:
+                    return xml_error(f"{e}; sync again without 'since'", 410)
+
+        return xml_response(await run_in_threadpool(changes_to_xml, token, rows, deleted))
+    except Exception as e:
+        return xml_error(f"Error retrieving changes: {str(e)}", 500)
+
+async def publish_change(op, isbn):
+    """Async counterpart of change_stream.publish; never raises."""
+    if not change_stream.CHANGE_STREAM_ENABLED:
+        return
+    try:
+        await r.xadd(change_stream.CHANGE_STREAM_KEY, change_stream.event_fields(op, isbn),
+                     maxlen=change_stream.CHANGE_STREAM_MAXLEN, approximate=True)
+    except Exception as e:
+        print(f"Warning: Could not publish {op} event for ISBN {isbn}: {e}")
+
+async def run_tombstone_sql(cursor, query, args):
+    try:
+        await cursor.execute(query, args)
+    except pymysql.err.ProgrammingError as e:
+        if not sync.is_missing_table(e):
+            raise
+
+@jwt_required()
+async def create_book(request):
+    try:
+        data = await read_json(request)
+
+        for field in ['isbn', 'titulo', 'autor', 'formato', 'precio']:
+            if field not in data:
+                return xml_error(f"Field '{field}' is required", 400)
+
+        values = (
+            data['isbn'],
+            data['titulo'],
+            data['autor'],
+            data['formato'],
+            data['precio'],
+            data.get('descripcion', ''),
+        )
+
+        async with db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await conn.begin()
+                try:
+                    try:
+                        await cursor.execute("""
+                            INSERT INTO libros (isbn, titulo, autor, formato, precio, descripcion, imagen_url)
+                            VALUES (%s, %s, %s, %s, %s, %s, %s)
+                        """, values + (data.get('imagen_url') or '',))
+                    except pymysql.OperationalError as e:
+                        # If imagen_url column doesn't exist, insert without it
+                        if 'imagen_url' in str(e).lower():
+                            await cursor.execute("""
+                                INSERT INTO libros (isbn, titulo, autor, formato, precio, descripcion)
+                                VALUES (%s, %s, %s, %s, %s, %s)
+                            """, values)
+                        else:
+                            raise
+                    await run_tombstone_sql(cursor, sync.CLEAR_TOMBSTONE_SQL, (data['isbn'],))
+                    await conn.commit()
+                    await publish_change("create", data['isbn'])
+                except pymysql.IntegrityError:
+                    await conn.rollback()
+                    return xml_error("Book with this ISBN already exists", 409)
+
+        return xml_response(create_success_xml("Book created successfully"), 201)
+    except Exception as e:
+        return xml_error(f"Error creating book: {str(e)}", 500)
+
+@jwt_required()
+async def update_book(request):
+    try:
+        data = await read_json(request)
+
+        if 'isbn' not in data:
+            return xml_error("ISBN is required for update", 400)
+
+        update_fields = []
+        values = []
+        for field in ['titulo', 'autor', 'formato', 'precio', 'descripcion', 'imagen_url']:
+            if field in data:
+                update_fields.append(f"{field} = %s")
+                values.append(data.get(field, ''))
+
+        async with db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute("SELECT id FROM libros WHERE isbn = %s", (data['isbn'],))
+                if not await cursor.fetchone():
+                    return xml_error("Book not found", 404)
+
+                if not update_fields:
+                    return xml_error("No fields to update", 400)
+
+                try:
+                    await cursor.execute(
+                        f"UPDATE libros SET {', '.join(update_fields)} WHERE isbn = %s",
+                        values + [data['isbn']]
+                    )
+                except pymysql.OperationalError as e:
+                    # If imagen_url column doesn't exist, remove it from update
+                    if 'imagen_url' not in str(e).lower():
+                        raise
+                    kept = [i for i, f in enumerate(update_fields) if 'imagen_url' not in f]
+                    if not kept:
+                        return xml_error("No fields to update", 400)
+                    await cursor.execute(
+                        f"UPDATE libros SET {', '.join(update_fields[i] for i in kept)} WHERE isbn = %s",
+                        [values[i] for i in kept] + [data['isbn']]
+                    )
+                await conn.commit()
+                await publish_change("update", data['isbn'])
+
+        return xml_response(create_success_xml("Book updated successfully"), 200)
+    except Exception as e:
+        return xml_error(f"Error updating book: {str(e)}", 500)
+
+@jwt_required()
+async def delete_book(request):
+    try:
+        isbn = request.query_params.get('isbn')
+        if not isbn:
+            return xml_error("ISBN parameter is required", 400)
+
+        async with db_pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await conn.begin()
+                await cursor.execute("DELETE FROM libros WHERE isbn = %s", (isbn,))
+                if cursor.rowcount == 0:
+                    await conn.rollback()
+                    return xml_error("Book not found", 404)
+                await run_tombstone_sql(cursor, sync.RECORD_TOMBSTONE_SQL, (isbn,))
+                await run_tombstone_sql(cursor, sync.PURGE_TOMBSTONES_SQL, (sync.SYNC_RETENTION_DAYS,))
+                await conn.commit()
+                await publish_change("delete", isbn)
+
+        return xml_response(create_success_xml("Book deleted successfully"), 200)
+    except Exception as e:
+        return xml_error(f"Error deleting book: {str(e)}", 500)
+
+@jwt_required()
+async def upload_book_image(request):
+    try:
+        isbn = request.query_params.get('isbn')
+        if not isbn:
+            return xml_error("ISBN parameter is required", 400)
+
+        content_type = request.headers.get('content-type', '')
+        if not content_type.startswith('image/'):
+            return xml_error("Request body must be an image", 415)
+
+        if not await fetch_all("SELECT id FROM libros WHERE isbn = %s", (isbn,)):
+            return xml_error("Book not found", 404)
+
+        # Same spooling as image_pipeline.spool_upload, reading the body asynchronously
+        fd, tmp_path = tempfile.mkstemp(prefix="upload-", dir=IMAGE_TMP_DIR)
+        written = 0
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                async for chunk in request.stream():
+                    written += len(chunk)
+                    if written > IMAGE_MAX_BYTES:
+                        raise ImageTooLarge(f"Image exceeds {IMAGE_MAX_BYTES} bytes")
+                    tmp.write(chunk)
+            if written == 0:
+                raise ValueError("Empty image body")
+        except BaseException as e:
+            # Client disconnects and cancellation must not leave the file behind either
+            os.unlink(tmp_path)
+            if isinstance(e, ImageTooLarge):
+                return xml_error(str(e), 413)
+            if isinstance(e, ValueError):
+                return xml_error(str(e), 400)
+            raise
+
+        submit_image_job(isbn, tmp_path)
+        return xml_response(create_success_xml("Image accepted for processing"), 202)
+    except Exception as e:
+        return xml_error(f"Error uploading image: {str(e)}", 500)
+
+
+# --- Service routes --------------------------------------------------------
+
+async def health_check(request):
+    return JSONResponse({'status': 'OK', 'message': 'Microservice is running'})
+
+async def health(request):
+    return JSONResponse({'status': 'healthy'})
+
+async def ping(request):
+    return JSONResponse({'status': 'pong', 'message': 'Server is alive'})
+
+
+async def startup():
+    global db_pool, r
+    db_pool = await aiomysql.create_pool(
+        host=os.getenv("DB_HOST", "127.0.0.1"),
+        user=os.getenv("DB_USER", "root"),
+        password=os.getenv("DB_PASS", ""),
+        db=os.getenv("DB_NAME", "Libros"),
+        port=int(os.getenv("DB_PORT", "3306")),
+        charset=os.getenv("DB_CHARSET", "utf8mb4"),
+        cursorclass=aiomysql.DictCursor,
+        minsize=int(os.getenv("ASYNC_DB_POOL_MIN", "5")),
+        maxsize=int(os.getenv("ASYNC_DB_POOL_MAX", "50")),
+        # Reads must not leave a transaction open: the pool closes such connections on release.
+        # Writes that need several statements start one explicitly with conn.begin().
+        autocommit=True,
+    )
+    r = aioredis.Redis(
+        host=os.getenv("REDIS_HOST", "127.0.0.1"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        db=int(os.getenv("REDIS_DB", "0")),
+        decode_responses=True,
+        max_connections=int(os.getenv("ASYNC_REDIS_MAX_CONN", "200")),
+    )
+
+async def shutdown():
+    if db_pool is not None:
+        db_pool.close()
+        await db_pool.wait_closed()
+    if r is not None:
+        await r.aclose()
+
+
+routes = [
+    Route('/', health_check),
+    Route('/health', health),
+    Route('/ping', ping),
+    Route('/auth/register', register, methods=['POST']),
+    Route('/auth/login', login, methods=['POST']),
+    Route('/auth/refresh', refresh, methods=['POST']),
+    Route('/auth/logout', logout, methods=['POST']),
+    Route('/api/books', get_all_books, methods=['GET']),
+    Route('/api/books/ISBN', get_book_by_isbn, methods=['GET']),
+    Route('/api/books/format/', get_books_by_format, methods=['GET']),
+    Route('/api/books/autor/', get_books_by_author, methods=['GET']),
+    Route('/api/books/search', search_books, methods=['GET']),
+    Route('/api/books/changes', get_book_changes, methods=['GET']),
+    Route('/api/books/create', create_book, methods=['POST']),
+    Route('/api/books/update', update_book, methods=['PUT']),
+    Route('/api/books/delete', delete_book, methods=['DELETE']),
+    Route('/api/books/image', upload_book_image, methods=['POST']),
+]
+
+cors_origins = os.getenv('CORS_ORIGINS', 'http://127.0.0.1:8080,http://localhost:8080').split(',')
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=cors_origins, allow_credentials=True,
+                   allow_methods=['*'], allow_headers=['*'], expose_headers=['X-Next-Cursor'])
+    ],
+    on_startup=[startup],
+    on_shutdown=[shutdown],
+)
@@ -10,17 +10,35 @@ import time
 import pymysql
 import hashlib
 from db import get_conn
+import metrics
+from breaker import DependencyUnavailable, redis_breaker
 
 bp = Blueprint("auth", __name__)
 
+class InstrumentedRedis(redis.Redis):
+    """Redis client that reports command time to the metrics registry."""
+
+    def execute_command(self, *args, **options):
+        with redis_breaker.guard(), metrics.track("redis", str(args[0]).lower()):
+            return super().execute_command(*args, **options)
+
 # Redis connection
-r = redis.Redis(
+r = InstrumentedRedis(
     host=os.getenv("REDIS_HOST", "127.0.0.1"),
     port=int(os.getenv("REDIS_PORT", "6379")),
     db=int(os.getenv("REDIS_DB", "0")),
-    decode_responses=True
+    decode_responses=True,
+    socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "1")),
+    socket_timeout=float(os.getenv("REDIS_SOCKET_TIMEOUT", "1"))
 )
 
+def reset_redis_after_fork():
+    """Forget Redis connections inherited from the parent process.
+
+    reset() drops them without closing, so the parent's sockets stay usable.
+    """
+    r.connection_pool.reset()
+
 def allow_key(token_type, jti):
     """Generate allowlist key for Redis."""
     return f"allow:{token_type}:{jti}"
@@ -60,6 +78,12 @@ def revoke(jti, exp):
     r.delete(allow_key("access", jti))
     r.delete(allow_key("refresh", jti))
 
+def _internal_error(e):
+    """500 JSON error for a handler's unexpected exception; dependency outages propagate as 503."""
+    if isinstance(e, DependencyUnavailable):
+        raise e
+    return jsonify({'error': str(e)}), 500
+
 @bp.route('/register', methods=['POST'])
 def register():
     """Register a new user.
@@ -148,7 +172,7 @@ def register():
             conn.close()
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _internal_error(e)
 
 @bp.route('/login', methods=['POST'])
 def login():
@@ -258,7 +282,7 @@ def login():
             conn.close()
             
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _internal_error(e)
 
 @bp.route('/refresh', methods=['POST'])
 @jwt_required(refresh=True)
@@ -306,7 +330,7 @@ def refresh():
         }), 200
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _internal_error(e)
 
 @bp.route('/logout', methods=['POST'])
 @jwt_required()
@@ -351,10 +375,11 @@ def logout():
         return jsonify({'message': 'Successfully logged out'}), 200
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _internal_error(e)
 
 # JWT blocklist checker (to be used in main.py)
 def check_if_token_revoked(jwt_header, jwt_payload):
     """Check if token is revoked or not in allowlist."""
     jti = jwt_payload["jti"]
-    return is_revoked(jti) or (not in_allow(jti))
+    with metrics.phase("auth"):
+        return is_revoked(jti) or (not in_allow(jti))
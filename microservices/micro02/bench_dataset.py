@@ -0,0 +1,84 @@
+"""
+Measure how the catalog endpoints scale with the number of books.
+
+For each catalog size the script seeds synthetic books up to that size
+(seed_catalog.py, so each step only inserts the difference), waits for the
+server's caches to catch up, runs the read-only part of the Locust scenario
+(tasks tagged "catalog") and records latency and response size per
+endpoint. Sizes must grow; start from an unseeded catalog or pass --fresh.
+
+The API server, MariaDB and Redis must be running, and .env must point at
+the same database as the server. Run with:
+    python bench_dataset.py --sizes 1000 10000 100000 -u 50 -t 60s
+    python bench_dataset.py --fresh --user-pool users.csv
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import seed_catalog
+from compare_modes import run_locust
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="http://127.0.0.1:5000")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("-u", "--users", type=int, default=50)
+    parser.add_argument("-r", "--spawn-rate", type=int, default=10)
+    parser.add_argument("-t", "--run-time", default="60s")
+    parser.add_argument("--settle", type=float, default=10,
+                        help="seconds to wait after seeding (in-memory catalog, snapshots)")
+    parser.add_argument("--user-pool", default="", help="accounts from provision_users.py")
+    parser.add_argument("--fresh", action="store_true", help="delete previously seeded books first")
+    parser.add_argument("--out-dir", default="dataset_results")
+    args = parser.parse_args()
+
+    sizes = sorted(args.sizes)
+    if args.fresh:
+        print(f"Deleted {seed_catalog.remove()} seeded books")
+    seeded, _ = seed_catalog.catalog_size()
+    if seeded > sizes[0]:
+        print(f"{seeded} books are already seeded, more than the first size ({sizes[0]}); use --fresh",
+              file=sys.stderr)
+        sys.exit(1)
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    extra_args = ["--tags", "catalog", "--skip-seeding"]
+    if args.user_pool:
+        extra_args += ["--user-pool", args.user_pool]
+
+    results = []
+    for size in sizes:
+        seed_catalog.seed(size)
+        _, total = seed_catalog.catalog_size()
+        time.sleep(args.settle)
+        stats = run_locust(
+            args.host, args.users, args.spawn_rate, args.run_time,
+            os.path.join(args.out_dir, f"books_{size}"), ["BooksAPIUser"],
+            extra_args + ["--seed-books", str(size)]
+        )
+        results.append((size, total, stats))
+
+    header = f"{'Books':>9} {'Endpoint':<24} {'Requests':>9} {'RPS':>8} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} {'Avg KB':>10} {'Fail':>6}"
+    print()
+    print(header)
+    print("-" * len(header))
+    for size, total, stats in results:
+        for name, row in stats.items():
+            if name in ("Aggregated", "Login", "Refresh Token"):
+                continue
+            print(
+                f"{total:>9} {name[:24]:<24} {row['Request Count']:>9} "
+                f"{float(row['Requests/s']):>8.1f} {row['50%']:>7} {row['95%']:>7} {row['99%']:>7} "
+                f"{float(row['Average Content Size']) / 1024:>10.1f} {row['Failure Count']:>6}"
+            )
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Measure how throughput scales with gunicorn workers.
+
+For each worker count the script starts the API with gunicorn.conf.py,
+waits for /health, runs the same headless Locust scenario and stops the
+server. The table shows requests per second against one worker; on a
+CPU-bound workload efficiency stays near 100% until workers exceed the
+cores (or MariaDB/Redis saturate).
+
+MariaDB and Redis must be running (see README). Run with:
+    python bench_scaling.py -u 200 -r 50 -t 30s
+    python bench_scaling.py --workers 1 2 4 8 --threads 4 BooksAPIUser
+
+Locust itself needs CPU: run it on another machine (--host, with the
+server started there) or keep users high enough that the server, not the
+load generator, is the bottleneck.
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+from compare_modes import run_locust
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def default_worker_counts():
+    """1, 2, 4, ... up to the number of cores (the core count itself is always included)."""
+    cores = multiprocessing.cpu_count()
+    counts = []
+    n = 1
+    while n < cores:
+        counts.append(n)
+        n *= 2
+    counts.append(cores)
+    return counts
+
+
+def wait_until_up(host, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{host}/health", timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def start_server(port, workers, threads):
+    env = dict(os.environ,
+               GUNICORN_BIND=f"127.0.0.1:{port}",
+               GUNICORN_WORKERS=str(workers),
+               GUNICORN_THREADS=str(threads))
+    cmd = [sys.executable, "-m", "gunicorn", "-c", os.path.join(HERE, "gunicorn.conf.py")]
+    return subprocess.Popen(cmd, cwd=HERE, env=env)
+
+
+def stop_server(proc):
+    proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=default_worker_counts())
+    parser.add_argument("--threads", type=int, default=int(os.getenv("GUNICORN_THREADS", "4")))
+    parser.add_argument("--port", type=int, default=5002)
+    parser.add_argument("-u", "--users", type=int, default=200)
+    parser.add_argument("-r", "--spawn-rate", type=int, default=50)
+    parser.add_argument("-t", "--run-time", default="30s")
+    parser.add_argument("--out-dir", default="scaling_results")
+    parser.add_argument("user_classes", nargs="*", default=["BooksAPIUser"],
+                        help="Locust user classes to run (default: BooksAPIUser)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    host = f"http://127.0.0.1:{args.port}"
+    totals = {}
+    for workers in args.workers:
+        proc = start_server(args.port, workers, args.threads)
+        try:
+            if not wait_until_up(host):
+                print(f"Server with {workers} workers did not start; skipping", file=sys.stderr)
+                continue
+            stats = run_locust(
+                host, args.users, args.spawn_rate, args.run_time,
+                os.path.join(args.out_dir, f"workers_{workers}"), args.user_classes
+            )
+            totals[workers] = stats["Aggregated"]
+        finally:
+            stop_server(proc)
+
+    if not totals:
+        sys.exit(1)
+    base_workers = min(totals)
+    base_rps = float(totals[base_workers]["Requests/s"]) / base_workers
+    header = f"{'Workers':>7} {'RPS':>9} {'Speedup':>8} {'Efficiency':>10} {'p50':>6} {'p95':>6} {'Failures':>9}"
+    print()
+    print(f"{multiprocessing.cpu_count()} cores, {args.threads} threads per worker")
+    print(header)
+    print("-" * len(header))
+    for workers, row in sorted(totals.items()):
+        rps = float(row["Requests/s"])
+        speedup = rps / base_rps if base_rps else 0.0
+        print(
+            f"{workers:>7} {rps:>9.1f} {speedup:>7.2f}x {speedup / workers:>10.0%} "
+            f"{row['50%']:>6} {row['95%']:>6} {row['Failure Count']:>9}"
+        )
+
+
+if __name__ == "__main__":
+    main()
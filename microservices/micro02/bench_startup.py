@@ -0,0 +1,87 @@
+"""
+Cold-start benchmark: time to import the app and serve the first requests.
+
+Each run starts a fresh interpreter, imports main.py and issues the first
+/health and /apispec.json requests through the Flask test client (no DB or
+Redis needed). Reports the median over all runs.
+
+Run with: python bench_startup.py --runs 10 [--importtime]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+client = main.app.test_client()
+client.get('/health')
+t2 = time.perf_counter()
+client.get('/apispec.json')
+t3 = time.perf_counter()
+client.get('/apispec.json')
+t4 = time.perf_counter()
+print(json.dumps({
+    'import_ms': (t1 - t0) * 1000,
+    'first_health_ms': (t2 - t1) * 1000,
+    'first_apispec_ms': (t3 - t2) * 1000,
+    'cached_apispec_ms': (t4 - t3) * 1000,
+}))
+"""
+
+
+def run_once(env):
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=HERE, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def top_imports(env, limit):
+    """Return the slowest modules reported by `python -X importtime`."""
+    err = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=HERE, env=env,
+        capture_output=True, text=True, check=True
+    ).stderr
+    rows = []
+    for line in err.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--importtime", action="store_true", help="also list the slowest imports")
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    samples = [run_once(env) for _ in range(args.runs)]
+
+    print(f"{'Phase':<20} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+    for key in samples[0]:
+        values = [s[key] for s in samples]
+        print(f"{key:<20} {statistics.median(values):>10.1f} {min(values):>10.1f} {max(values):>10.1f}")
+
+    if args.importtime:
+        print()
+        print(f"{'cumulative us':>14}  module")
+        for cumulative, name in top_imports(env, args.top):
+            print(f"{cumulative:>14}  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,135 @@
-from flask import Blueprint, request, Response
+import os
+from functools import wraps
+from flask import Blueprint, g, request, Response, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import pymysql
+from dotenv import load_dotenv
+import db
 from db import get_conn
-from xml_utils import books_to_xml, create_error_xml, create_success_xml
-from firebase_storage import get_image_url_by_isbn
+from xml_utils import books_to_xml, changes_to_xml, create_error_xml, create_success_xml, fragment_cache
+from image_pipeline import ImageTooLarge, spool_upload, submit_image_job
+from breaker import DependencyUnavailable, StaleCache
+from coalesce import SingleFlight, request_key
+import write_batcher
+from write_batcher import WriteBatcher
+from auth import r
+import sync
+import change_stream
+import search
+import catalog_memory
+import snapshots
+
+load_dotenv()
+
+# Serve the last good catalog response while MariaDB is unavailable
+STALE_ON_DB_OUTAGE = os.getenv("STALE_ON_DB_OUTAGE", "false").lower() == "true"
+_stale_cache = StaleCache(
+    int(os.getenv("STALE_CACHE_MAX_ENTRIES", "256")),
+    float(os.getenv("STALE_MAX_AGE_SEC", "300"))
+)
+
+# Identical concurrent catalog reads share one query and one XML rendering
+_coalescer = SingleFlight(r)
+
+# Concurrent creates/updates share one commit when WRITE_BATCH=true
+_write_batcher = WriteBatcher(get_conn)
 
 bp = Blueprint("books", __name__)
 
+def serve_stale_on_outage(fn):
+    """Remember successful catalog reads and replay them while the DB breaker is open.
+
+    Stale responses carry a `Warning: 110 - "Response is Stale"` header.
+    Disabled unless STALE_ON_DB_OUTAGE=true.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not STALE_ON_DB_OUTAGE:
+            return fn(*args, **kwargs)
+        key = request.full_path
+        try:
+            result = fn(*args, **kwargs)
+        except DependencyUnavailable as e:
+            cached = _stale_cache.get(key) if e.dependency == "mariadb" else None
+            if cached is None:
+                raise
+            body, headers = cached
+            response = Response(body, mimetype='application/xml')
+            response.headers.extend(headers)
+            response.headers['Warning'] = '110 - "Response is Stale"'
+            return response
+        # File responses (snapshots) are streamed, not buffered
+        if isinstance(result, Response) and result.status_code == 200 and not result.direct_passthrough:
+            # Keep the API headers (X-Next-Cursor, X-Search-Plan) so paginated clients can carry on
+            headers = [(name, value) for name, value in result.headers if name.startswith('X-')]
+            _stale_cache.put(key, (result.get_data(), headers))
+        return result
+    return wrapper
+
+def _internal_error(message, e):
+    """500 XML error for a handler's unexpected exception.
+
+    Dependency outages are re-raised so main.py answers them with 503 and Retry-After.
+    """
+    if isinstance(e, DependencyUnavailable):
+        raise e
+    error_xml = create_error_xml(f"{message}: {str(e)}")
+    return Response(error_xml, mimetype='application/xml'), 500
+
+def _read_primary():
+    """Whether this user wrote recently and must read their own changes from the primary.
+
+    Such reads also skip replicas, the in-memory catalog and snapshots, which may lag.
+    """
+    if 'read_primary' not in g:
+        g.read_primary = db.is_sticky(get_jwt_identity())
+    return g.read_primary
+
+def _read_key():
+    """Coalescing key; reads pinned to the primary never share a replica's result."""
+    return request_key() + ("#primary" if _read_primary() else "")
+
+def _catalog_xml(sql, args=(), single=False, from_memory=None):
+    """Run a catalog read and render it as XML, shared with identical in-flight requests.
+
+    `from_memory(catalog)` answers the same read from the in-memory catalog
+    when it is enabled and fresh. With `single`, returns None when no row matches.
+    """
+    primary = _read_primary()
+    catalog = catalog_memory.get_catalog() if from_memory is not None and not primary else None
+    if catalog is not None:
+        rows = from_memory(catalog)
+        if single:
+            return books_to_xml(rows[:1]) if rows else None
+        return books_to_xml(rows)
+    
+    def load(cursor):
+        cursor.execute(sql, args)
+        if single:
+            book = cursor.fetchone()
+            return books_to_xml([book]) if book else None
+        return books_to_xml(cursor.fetchall())
+    return _coalescer.do(_read_key(), lambda: db.read(load, primary=primary))
+
+def _snapshot_response():
+    """Send the precompressed catalog snapshot, or None if there is none yet."""
+    snapshot = snapshots.choose(request.headers.get('Accept-Encoding'))
+    if snapshot is None:
+        return None
+    path, encoding, etag = snapshot
+    try:
+        response = send_file(os.path.abspath(path), mimetype='application/xml', etag=etag, conditional=True)
+    except OSError:
+        # Replaced by a newer snapshot between choosing and opening it
+        return None
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 @bp.route('/books', methods=['GET'])
 @jwt_required()
+@serve_stale_on_outage
 def get_all_books():
     """Get all books.
     ---
@@ -43,36 +164,31 @@ def get_all_books():
         description: Error interno del servidor
     """
     try:
-        conn = get_conn()
-        cursor = conn.cursor()
+        if snapshots.SNAPSHOTS and not _read_primary():
+            response = _snapshot_response()
+            if response is not None:
+                return response
         
-        try:
-            cursor.execute("SELECT * FROM libros ORDER BY titulo")
-            books = cursor.fetchall()
-            
-            # Skip Firebase image lookup for performance - images will be loaded client-side if needed
-            # This makes the API response much faster
-            # If you want to enable server-side image lookup, uncomment below:
-            # for book in books:
-            #     if 'isbn' in book and book['isbn']:
-            #         if 'imagen_url' not in book or not book.get('imagen_url'):
-            #             image_url = get_image_url_by_isbn(book['isbn'])
-            #             if image_url:
-            #                 book['imagen_url'] = image_url
-            
-            xml_response = books_to_xml(books)
-            return Response(xml_response, mimetype='application/xml')
-            
-        finally:
-            cursor.close()
-            conn.close()
+        # Skip Firebase image lookup for performance - images will be loaded client-side if needed
+        # This makes the API response much faster
+        # If you want to enable server-side image lookup, uncomment below:
+        # from firebase_storage import get_image_url_by_isbn
+        # for book in books:
+        #     if 'isbn' in book and book['isbn']:
+        #         if 'imagen_url' not in book or not book.get('imagen_url'):
+        #             image_url = get_image_url_by_isbn(book['isbn'])
+        #             if image_url:
+        #                 book['imagen_url'] = image_url
+        xml_response = _catalog_xml("SELECT * FROM libros ORDER BY titulo",
+                                    from_memory=lambda catalog: catalog.all())
+        return Response(xml_response, mimetype='application/xml')
             
     except Exception as e:
-        error_xml = create_error_xml(f"Error retrieving books: {str(e)}")
-        return Response(error_xml, mimetype='application/xml'), 500
+        return _internal_error("Error retrieving books", e)
 
 @bp.route('/books/ISBN', methods=['GET'])
 @jwt_required()
+@serve_stale_on_outage
 def get_book_by_isbn():
     """Get book by ISBN.
     ---
@@ -123,31 +239,21 @@ def get_book_by_isbn():
             error_xml = create_error_xml("ISBN parameter is required")
             return Response(error_xml, mimetype='application/xml'), 400
         
-        conn = get_conn()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("SELECT * FROM libros WHERE isbn = %s", (isbn,))
-            book = cursor.fetchone()
-            
-            if book:
-                # Skip Firebase lookup for performance - images loaded client-side
-                xml_response = books_to_xml([book])
-                return Response(xml_response, mimetype='application/xml')
-            else:
-                error_xml = create_error_xml("Book not found")
-                return Response(error_xml, mimetype='application/xml'), 404
-                
-        finally:
-            cursor.close()
-            conn.close()
+        # Skip Firebase lookup for performance - images loaded client-side
+        xml_response = _catalog_xml("SELECT * FROM libros WHERE isbn = %s", (isbn,), single=True,
+                                    from_memory=lambda catalog: catalog.by_isbn(isbn))
+        if xml_response is not None:
+            return Response(xml_response, mimetype='application/xml')
+        else:
+            error_xml = create_error_xml("Book not found")
+            return Response(error_xml, mimetype='application/xml'), 404
             
     except Exception as e:
-        error_xml = create_error_xml(f"Error retrieving book: {str(e)}")
-        return Response(error_xml, mimetype='application/xml'), 500
+        return _internal_error("Error retrieving book", e)
 
 @bp.route('/books/format/', methods=['GET'])
 @jwt_required()
+@serve_stale_on_outage
 def get_books_by_format():
     """Get books by format.
     ---
@@ -183,27 +289,17 @@ def get_books_by_format():
             error_xml = create_error_xml("Format parameter is required")
             return Response(error_xml, mimetype='application/xml'), 400
         
-        conn = get_conn()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute("SELECT * FROM libros WHERE formato = %s ORDER BY titulo", (format_type,))
-            books = cursor.fetchall()
-            
-            # Skip Firebase lookup for performance - images loaded client-side
-            xml_response = books_to_xml(books)
-            return Response(xml_response, mimetype='application/xml')
-            
-        finally:
-            cursor.close()
-            conn.close()
+        # Skip Firebase lookup for performance - images loaded client-side
+        xml_response = _catalog_xml("SELECT * FROM libros WHERE formato = %s ORDER BY titulo", (format_type,),
+                                    from_memory=lambda catalog: catalog.by_format(format_type))
+        return Response(xml_response, mimetype='application/xml')
             
     except Exception as e:
-        error_xml = create_error_xml(f"Error retrieving books by format: {str(e)}")
-        return Response(error_xml, mimetype='application/xml'), 500
+        return _internal_error("Error retrieving books by format", e)
 
 @bp.route('/books/autor/', methods=['GET'])
 @jwt_required()
+@serve_stale_on_outage
 def get_books_by_author():
     """Get books by author name.
     ---
@@ -238,24 +334,307 @@ def get_books_by_author():
             error_xml = create_error_xml("Name parameter is required")
             return Response(error_xml, mimetype='application/xml'), 400
         
+        # Skip Firebase lookup for performance - images loaded client-side
+        xml_response = _catalog_xml("SELECT * FROM libros WHERE autor LIKE %s ORDER BY titulo", (f"%{author_name}%",),
+                                    from_memory=lambda catalog: catalog.by_author(author_name))
+        return Response(xml_response, mimetype='application/xml')
+            
+    except Exception as e:
+        return _internal_error("Error retrieving books by author", e)
+
+@bp.route('/books/search', methods=['GET'])
+@jwt_required()
+@serve_stale_on_outage
+def search_books():
+    """Search books combining filters, with sorting and pagination.
+    ---
+    tags:
+      - Books
+    summary: Búsqueda combinada de libros
+    description: |
+      Combina filtros por formato, prefijo de autor, prefijo de título y rango de precio, ordena por título o precio y pagina con un cursor. Si hay más resultados, la cabecera `X-Next-Cursor` contiene el cursor de la página siguiente. Las combinaciones que obligarían a recorrer toda la tabla se rechazan con 400. Requiere autenticación JWT.
+    security:
+      - Bearer: []
+    parameters:
+      - in: query
+        name: format
+        type: string
+        required: false
+        enum: [Físico, Digital, Audiolibro]
+        description: Formato del libro
+      - in: query
+        name: author
+        type: string
+        required: false
+        description: Inicio del nombre del autor (mínimo 3 caracteres)
+        example: "Miguel"
+      - in: query
+        name: title
+        type: string
+        required: false
+        description: Inicio del título (mínimo 3 caracteres)
+        example: "El Q"
+      - in: query
+        name: min_price
+        type: number
+        required: false
+        description: Precio mínimo
+      - in: query
+        name: max_price
+        type: number
+        required: false
+        description: Precio máximo
+      - in: query
+        name: sort
+        type: string
+        required: false
+        enum: [titulo, -titulo, precio, -precio]
+        default: titulo
+        description: Campo de orden; prefijo "-" para orden descendente
+      - in: query
+        name: limit
+        type: integer
+        required: false
+        default: 20
+        description: Resultados por página (máximo 100)
+      - in: query
+        name: cursor
+        type: string
+        required: false
+        description: Valor de X-Next-Cursor de la página anterior
+    produces:
+      - application/xml
+    responses:
+      200:
+        description: Lista de libros en formato XML
+        headers:
+          X-Next-Cursor:
+            type: string
+            description: Cursor de la página siguiente (ausente en la última página)
+      400:
+        description: Parámetros inválidos o combinación no soportada por un índice
+      401:
+        description: No autenticado o token inválido
+      500:
+        description: Error interno del servidor
+    """
+    try:
+        try:
+            plan = search.plan(request.args)
+        except search.SearchError as e:
+            error_xml = create_error_xml(str(e))
+            return Response(error_xml, mimetype='application/xml'), 400
+        
+        def load(cursor):
+            cursor.execute(plan.sql, plan.params)
+            rows = cursor.fetchall()
+            return [books_to_xml(rows[:plan.limit]), plan.next_cursor(rows)]
+        
+        xml_response, next_cursor = _coalescer.do(
+            _read_key(), lambda: db.read(load, primary=_read_primary())
+        )
+        response = Response(xml_response, mimetype='application/xml')
+        response.headers['X-Search-Plan'] = plan.index
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+            
+    except Exception as e:
+        return _internal_error("Error searching books", e)
+
+@bp.route('/books/changes', methods=['GET'])
+@jwt_required()
+def get_book_changes():
+    """Get catalog changes since a sync token.
+    ---
+    tags:
+      - Books
+    summary: Sincronización incremental del catálogo
+    description: |
+      Retorna los libros creados o modificados y los ISBN eliminados desde el token `since`, junto con un nuevo token para la siguiente llamada. Sin `since` retorna el catálogo completo (sincronización inicial). Puede repetir algunos libros ya recibidos, por lo que el cliente debe aplicar los cambios por ISBN. Requiere autenticación JWT.
+    security:
+      - Bearer: []
+    parameters:
+      - in: query
+        name: since
+        type: string
+        required: false
+        description: Token devuelto por la llamada anterior
+        example: "v1.1760000000.123456"
+    produces:
+      - application/xml
+    responses:
+      200:
+        description: Cambios en formato XML
+        schema:
+          type: string
+          example: |
+            <?xml version="1.0" ?>
+            <cambios>
+              <token>v1.1760000042.654321</token>
+              <actualizados>
+                <libro>
+                  <id>1</id>
+                  <isbn>1234567890</isbn>
+                  <titulo>El Quijote</titulo>
+                  <precio>19.99</precio>
+                  <updated_at>2025-10-09 12:00:40.123456</updated_at>
+                </libro>
+              </actualizados>
+              <eliminados>
+                <isbn>9780000000001</isbn>
+              </eliminados>
+            </cambios>
+      400:
+        description: Token inválido
+      401:
+        description: No autenticado o token inválido
+      410:
+        description: Token demasiado antiguo, se requiere sincronización completa
+      500:
+        description: Error interno del servidor
+    """
+    try:
+        since = request.args.get('since')
+        if since:
+            try:
+                sync.decode_token(since)
+            except sync.InvalidToken as e:
+                error_xml = create_error_xml(str(e))
+                return Response(error_xml, mimetype='application/xml'), 400
+        
+        # Always the primary: a lagging replica could hand out a token past rows it has not applied yet
         conn = get_conn()
         cursor = conn.cursor()
         
         try:
-            cursor.execute("SELECT * FROM libros WHERE autor LIKE %s ORDER BY titulo", (f"%{author_name}%",))
-            books = cursor.fetchall()
-            
-            # Skip Firebase lookup for performance - images loaded client-side
-            xml_response = books_to_xml(books)
+            token, rows, deleted = sync.changes(cursor, since)
+            xml_response = changes_to_xml(token, rows, deleted)
             return Response(xml_response, mimetype='application/xml')
             
+        except sync.InvalidToken as e:
+            # A token later than the database clock
+            error_xml = create_error_xml(str(e))
+            return Response(error_xml, mimetype='application/xml'), 400
+        except sync.TokenExpired as e:
+            error_xml = create_error_xml(f"{e}; sync again without 'since'")
+            return Response(error_xml, mimetype='application/xml'), 410
         finally:
             cursor.close()
             conn.close()
             
     except Exception as e:
-        error_xml = create_error_xml(f"Error retrieving books by author: {str(e)}")
-        return Response(error_xml, mimetype='application/xml'), 500
+        return _internal_error("Error retrieving changes", e)
+
+def _run_write(fn):
+    """Run `fn(cursor)` in a transaction and commit, returning its result.
+
+    With WRITE_BATCH=true the transaction is shared with concurrent writes
+    (group commit); errors raised by `fn` still reach only this caller.
+    """
+    if write_batcher.WRITE_BATCH:
+        return _write_batcher.submit(fn)
+    conn = get_conn()
+    cursor = conn.cursor()
+    try:
+        result = fn(cursor)
+        conn.commit()
+        return result
+    finally:
+        cursor.close()
+        conn.close()
+
+def _insert_book(cursor, data):
+    """INSERT a new book; raises pymysql.IntegrityError if the ISBN exists."""
+    # Get image URL from Firebase Storage if not provided (skip if not configured)
+    imagen_url = data.get('imagen_url')
+    # Skip Firebase lookup for performance - images can be uploaded via frontend
+    # if not imagen_url:
+    #     imagen_url = get_image_url_by_isbn(data['isbn'])
+    
+    # Try to insert with imagen_url, fallback if column doesn't exist
+    try:
+        cursor.execute("""
+            INSERT INTO libros (isbn, titulo, autor, formato, precio, descripcion, imagen_url)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """, (
+            data['isbn'],
+            data['titulo'],
+            data['autor'],
+            data['formato'],
+            data['precio'],
+            data.get('descripcion', ''),
+            imagen_url or ''
+        ))
+    except pymysql.OperationalError as e:
+        # If imagen_url column doesn't exist, insert without it
+        if 'imagen_url' in str(e).lower():
+            cursor.execute("""
+                INSERT INTO libros (isbn, titulo, autor, formato, precio, descripcion)
+                VALUES (%s, %s, %s, %s, %s, %s)
+            """, (
+                data['isbn'],
+                data['titulo'],
+                data['autor'],
+                data['formato'],
+                data['precio'],
+                data.get('descripcion', '')
+            ))
+        else:
+            raise
+    
+    # A re-created ISBN is an upsert for sync clients, not a deletion
+    sync.clear_tombstone(cursor, data['isbn'])
+
+def _update_book(cursor, data):
+    """UPDATE the fields present in `data`. Returns (message, status) for a client error, else None."""
+    # Check if book exists
+    cursor.execute("SELECT id FROM libros WHERE isbn = %s", (data['isbn'],))
+    if not cursor.fetchone():
+        return "Book not found", 404
+    
+    # Update book
+    update_fields = []
+    values = []
+    
+    # Handle imagen_url - skip Firebase lookup for performance
+    imagen_url = data.get('imagen_url', '')
+    # Skip Firebase lookup - images can be uploaded via frontend
+    # if not imagen_url:
+    #     imagen_url = get_image_url_by_isbn(data['isbn'])
+    
+    for field in ['titulo', 'autor', 'formato', 'precio', 'descripcion', 'imagen_url']:
+        if field in data or (field == 'imagen_url' and imagen_url):
+            update_fields.append(f"{field} = %s")
+            if field == 'imagen_url' and field not in data:
+                values.append(imagen_url or '')
+            else:
+                values.append(data.get(field, ''))
+    
+    if not update_fields:
+        return "No fields to update", 400
+    
+    values.append(data['isbn'])
+    
+    # Try to update with imagen_url, fallback if column doesn't exist
+    try:
+        query = f"UPDATE libros SET {', '.join(update_fields)} WHERE isbn = %s"
+        cursor.execute(query, values)
+    except pymysql.OperationalError as e:
+        # If imagen_url column doesn't exist, remove it from update
+        if 'imagen_url' in str(e).lower():
+            update_fields_filtered = [f for f in update_fields if 'imagen_url' not in f]
+            values_filtered = [v for i, v in enumerate(values[:-1]) if 'imagen_url' not in update_fields[i]]
+            values_filtered.append(values[-1])  # Add ISBN back
+            
+            if update_fields_filtered:
+                query = f"UPDATE libros SET {', '.join(update_fields_filtered)} WHERE isbn = %s"
+                cursor.execute(query, values_filtered)
+            else:
+                return "No fields to update", 400
+        else:
+            raise
+    return None
 
 @bp.route('/books/create', methods=['POST'])
 @jwt_required()
@@ -342,62 +721,22 @@ def create_book():
                 error_xml = create_error_xml(f"Field '{field}' is required")
                 return Response(error_xml, mimetype='application/xml'), 400
         
-        conn = get_conn()
-        cursor = conn.cursor()
-        
         try:
-            # Get image URL from Firebase Storage if not provided (skip if not configured)
-            imagen_url = data.get('imagen_url')
-            # Skip Firebase lookup for performance - images can be uploaded via frontend
-            # if not imagen_url:
-            #     imagen_url = get_image_url_by_isbn(data['isbn'])
-            
-            # Try to insert with imagen_url, fallback if column doesn't exist
-            try:
-                cursor.execute("""
-                    INSERT INTO libros (isbn, titulo, autor, formato, precio, descripcion, imagen_url)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    data['isbn'],
-                    data['titulo'],
-                    data['autor'],
-                    data['formato'],
-                    data['precio'],
-                    data.get('descripcion', ''),
-                    imagen_url or ''
-                ))
-            except pymysql.OperationalError as e:
-                # If imagen_url column doesn't exist, insert without it
-                if 'imagen_url' in str(e).lower():
-                    cursor.execute("""
-                        INSERT INTO libros (isbn, titulo, autor, formato, precio, descripcion)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                    """, (
-                        data['isbn'],
-                        data['titulo'],
-                        data['autor'],
-                        data['formato'],
-                        data['precio'],
-                        data.get('descripcion', '')
-                    ))
-                else:
-                    raise
-            
-            conn.commit()
-            
-            success_xml = create_success_xml("Book created successfully")
-            return Response(success_xml, mimetype='application/xml'), 201
-            
+            _run_write(lambda cursor: _insert_book(cursor, data))
         except pymysql.IntegrityError:
             error_xml = create_error_xml("Book with this ISBN already exists")
             return Response(error_xml, mimetype='application/xml'), 409
-        finally:
-            cursor.close()
-            conn.close()
+        
+        db.stick_to_primary(get_jwt_identity())
+        change_stream.publish("create", data['isbn'])
+        catalog_memory.wake()
+        snapshots.wake()
+        
+        success_xml = create_success_xml("Book created successfully")
+        return Response(success_xml, mimetype='application/xml'), 201
             
     except Exception as e:
-        error_xml = create_error_xml(f"Error creating book: {str(e)}")
-        return Response(error_xml, mimetype='application/xml'), 500
+        return _internal_error("Error creating book", e)
 
 @bp.route('/books/update', methods=['PUT'])
 @jwt_required()
@@ -473,72 +812,22 @@ def update_book():
             error_xml = create_error_xml("ISBN is required for update")
             return Response(error_xml, mimetype='application/xml'), 400
         
-        conn = get_conn()
-        cursor = conn.cursor()
+        client_error = _run_write(lambda cursor: _update_book(cursor, data))
+        if client_error is not None:
+            message, status = client_error
+            error_xml = create_error_xml(message)
+            return Response(error_xml, mimetype='application/xml'), status
         
-        try:
-            # Check if book exists
-            cursor.execute("SELECT id FROM libros WHERE isbn = %s", (data['isbn'],))
-            if not cursor.fetchone():
-                error_xml = create_error_xml("Book not found")
-                return Response(error_xml, mimetype='application/xml'), 404
-            
-            # Update book
-            update_fields = []
-            values = []
-            
-            # Handle imagen_url - skip Firebase lookup for performance
-            imagen_url = data.get('imagen_url', '')
-            # Skip Firebase lookup - images can be uploaded via frontend
-            # if not imagen_url:
-            #     imagen_url = get_image_url_by_isbn(data['isbn'])
-            
-            for field in ['titulo', 'autor', 'formato', 'precio', 'descripcion', 'imagen_url']:
-                if field in data or (field == 'imagen_url' and imagen_url):
-                    update_fields.append(f"{field} = %s")
-                    if field == 'imagen_url' and field not in data:
-                        values.append(imagen_url or '')
-                    else:
-                        values.append(data.get(field, ''))
-            
-            if not update_fields:
-                error_xml = create_error_xml("No fields to update")
-                return Response(error_xml, mimetype='application/xml'), 400
-            
-            values.append(data['isbn'])
-            
-            # Try to update with imagen_url, fallback if column doesn't exist
-            try:
-                query = f"UPDATE libros SET {', '.join(update_fields)} WHERE isbn = %s"
-                cursor.execute(query, values)
-            except pymysql.OperationalError as e:
-                # If imagen_url column doesn't exist, remove it from update
-                if 'imagen_url' in str(e).lower():
-                    update_fields_filtered = [f for f in update_fields if 'imagen_url' not in f]
-                    values_filtered = [v for i, v in enumerate(values[:-1]) if 'imagen_url' not in update_fields[i]]
-                    values_filtered.append(values[-1])  # Add ISBN back
-                    
-                    if update_fields_filtered:
-                        query = f"UPDATE libros SET {', '.join(update_fields_filtered)} WHERE isbn = %s"
-                        cursor.execute(query, values_filtered)
-                    else:
-                        error_xml = create_error_xml("No fields to update")
-                        return Response(error_xml, mimetype='application/xml'), 400
-                else:
-                    raise
-            
-            conn.commit()
-            
-            success_xml = create_success_xml("Book updated successfully")
-            return Response(success_xml, mimetype='application/xml'), 200
-            
-        finally:
-            cursor.close()
-            conn.close()
+        db.stick_to_primary(get_jwt_identity())
+        change_stream.publish("update", data['isbn'])
+        catalog_memory.wake()
+        snapshots.wake()
+        
+        success_xml = create_success_xml("Book updated successfully")
+        return Response(success_xml, mimetype='application/xml'), 200
             
     except Exception as e:
-        error_xml = create_error_xml(f"Error updating book: {str(e)}")
-        return Response(error_xml, mimetype='application/xml'), 500
+        return _internal_error("Error updating book", e)
 
 @bp.route('/books/delete', methods=['DELETE'])
 @jwt_required()
@@ -588,12 +877,20 @@ def delete_book():
         
         try:
             cursor.execute("DELETE FROM libros WHERE isbn = %s", (isbn,))
-            conn.commit()
             
             if cursor.rowcount == 0:
+                conn.rollback()
                 error_xml = create_error_xml("Book not found")
                 return Response(error_xml, mimetype='application/xml'), 404
             
+            sync.record_tombstone(cursor, isbn)
+            conn.commit()
+            db.stick_to_primary(get_jwt_identity())
+            change_stream.publish("delete", isbn)
+            catalog_memory.wake()
+            snapshots.wake()
+            fragment_cache.invalidate_isbn(isbn)
+            
             success_xml = create_success_xml("Book deleted successfully")
             return Response(success_xml, mimetype='application/xml'), 200
             
@@ -602,7 +899,98 @@ def delete_book():
             conn.close()
             
     except Exception as e:
-        error_xml = create_error_xml(f"Error deleting book: {str(e)}")
-        return Response(error_xml, mimetype='application/xml'), 500
+        return _internal_error("Error deleting book", e)
+
 
 
+@bp.route('/books/image', methods=['POST'])
+@jwt_required()
+def upload_book_image():
+    """Upload a cover image for a book.
+    ---
+    tags:
+      - Books
+    summary: Subir la imagen de un libro
+    description: Recibe la imagen como cuerpo binario de la petición y la guarda en un archivo temporal sin cargarla en memoria. Un pool de workers genera en segundo plano las variantes thumb (150px), medium (600px) y original en WebP o JPEG, las almacena en books/{isbn}/{variante}.{ext} y registra sus URLs en el libro. Requiere autenticación JWT.
+    security:
+      - Bearer: []
+    consumes:
+      - image/jpeg
+      - image/png
+      - image/webp
+    parameters:
+      - in: query
+        name: isbn
+        type: string
+        required: true
+        description: ISBN del libro
+        example: "1234567890"
+      - in: body
+        name: body
+        description: Contenido binario de la imagen (máx. 5MB)
+        required: true
+        schema:
+          type: string
+          format: binary
+    produces:
+      - application/xml
+    responses:
+      202:
+        description: Imagen aceptada para procesamiento
+        schema:
+          type: string
+          example: |
+            <?xml version="1.0" ?>
+            <success>Image accepted for processing</success>
+      400:
+        description: Parámetro ISBN faltante o imagen vacía
+      401:
+        description: No autenticado o token inválido
+      404:
+        description: Libro no encontrado
+      413:
+        description: La imagen supera el tamaño máximo
+      415:
+        description: El cuerpo no es una imagen
+      500:
+        description: Error interno del servidor
+    """
+    try:
+        isbn = request.args.get('isbn')
+        if not isbn:
+            error_xml = create_error_xml("ISBN parameter is required")
+            return Response(error_xml, mimetype='application/xml'), 400
+        
+        if not request.mimetype.startswith('image/'):
+            error_xml = create_error_xml("Request body must be an image")
+            return Response(error_xml, mimetype='application/xml'), 415
+        
+        conn = get_conn()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute("SELECT id FROM libros WHERE isbn = %s", (isbn,))
+            if not cursor.fetchone():
+                error_xml = create_error_xml("Book not found")
+                return Response(error_xml, mimetype='application/xml'), 404
+        finally:
+            cursor.close()
+            conn.close()
+        
+        # Stream the body to disk before releasing the request thread
+        try:
+            tmp_path = spool_upload(request.stream)
+        except ImageTooLarge as e:
+            error_xml = create_error_xml(str(e))
+            return Response(error_xml, mimetype='application/xml'), 413
+        except ValueError as e:
+            error_xml = create_error_xml(str(e))
+            return Response(error_xml, mimetype='application/xml'), 400
+        
+        submit_image_job(isbn, tmp_path)
+        
+        success_xml = create_success_xml("Image accepted for processing")
+        return Response(success_xml, mimetype='application/xml'), 202
+            
+    except Exception as e:
+        return _internal_error("Error uploading image", e)
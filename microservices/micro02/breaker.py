@@ -0,0 +1,203 @@
+"""
+Circuit breakers for MariaDB, Redis and Firebase.
+
+Each dependency has one breaker per process. After BREAKER_FAILURE_THRESHOLD
+consecutive connection or timeout failures the breaker opens and calls fail
+immediately with DependencyUnavailable (rendered as a 503 XML error) instead
+of waiting on driver timeouts. After BREAKER_RESET_TIMEOUT seconds it goes
+half-open and lets BREAKER_HALF_OPEN_MAX trial calls through; a success
+closes it, a failure opens it again.
+
+Every setting can be overridden per dependency, e.g. BREAKER_REDIS_RESET_TIMEOUT.
+"""
+
+import os
+import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+BREAKER_STATE = metrics.Gauge(
+    "circuit_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open).",
+    ("dependency",)
+)
+BREAKER_REJECTIONS = metrics.Counter(
+    "circuit_breaker_rejections_total", "Calls rejected without reaching the dependency.",
+    ("dependency",)
+)
+
+
+def _setting(dependency, name, default):
+    value = os.getenv(f"BREAKER_{dependency.upper()}_{name}", os.getenv(f"BREAKER_{name}", default))
+    return float(value)
+
+
+class DependencyUnavailable(Exception):
+    """A dependency is down, timing out or shed by its circuit breaker."""
+
+    def __init__(self, dependency, message=None, retry_after=1):
+        super().__init__(message or f"{dependency} unavailable")
+        self.dependency = dependency
+        self.retry_after = max(1, int(retry_after))
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker around calls to one dependency.
+
+    Args:
+        name: dependency name used in errors and metrics
+        is_failure: predicate deciding whether an exception means the
+            dependency is unhealthy (application errors such as a duplicate
+            key must not trip the breaker)
+    """
+
+    def __init__(self, name, is_failure):
+        self.name = name
+        self.is_failure = is_failure
+        self.failure_threshold = int(_setting(name, "FAILURE_THRESHOLD", "5"))
+        self.reset_timeout = _setting(name, "RESET_TIMEOUT", "10")
+        self.half_open_max = int(_setting(name, "HALF_OPEN_MAX", "1"))
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trials = 0
+        BREAKER_STATE.set(0, name)
+
+    def _current_state(self):
+        # An open breaker whose reset timeout has passed admits a trial call
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return self._state
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _set_state(self, state):
+        self._state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], self.name)
+
+    def _reject(self, retry_after):
+        BREAKER_REJECTIONS.inc(self.name)
+        raise DependencyUnavailable(self.name, f"{self.name} circuit breaker is open", retry_after)
+
+    def before_call(self):
+        """Raise DependencyUnavailable if the call must not go through. Returns True for a half-open trial."""
+        with self._lock:
+            if self._state == OPEN:
+                remaining = self.reset_timeout - (time.monotonic() - self._opened_at)
+                if remaining > 0:
+                    self._reject(remaining)
+                self._set_state(HALF_OPEN)
+                self._trials = 0
+            if self._state == HALF_OPEN:
+                if self._trials >= self.half_open_max:
+                    self._reject(1)
+                self._trials += 1
+                return True
+            return False
+
+    def after_call(self, trial, failed):
+        with self._lock:
+            if trial:
+                self._trials = max(0, self._trials - 1)
+            if failed:
+                self._failures += 1
+                if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                    self._set_state(OPEN)
+                    self._opened_at = time.monotonic()
+            else:
+                self._failures = 0
+                if self._state == HALF_OPEN:
+                    self._set_state(CLOSED)
+
+    @contextmanager
+    def guard(self):
+        """Run a block against the dependency, converting dependency failures to DependencyUnavailable."""
+        trial = self.before_call()
+        try:
+            yield
+        except DependencyUnavailable:
+            self.after_call(trial, False)
+            raise
+        except Exception as e:
+            if self.is_failure(e):
+                self.after_call(trial, True)
+                raise DependencyUnavailable(self.name, f"{self.name} error: {e}", self.reset_timeout) from e
+            self.after_call(trial, False)
+            raise
+        else:
+            self.after_call(trial, False)
+
+    def status(self):
+        with self._lock:
+            return {"state": self._current_state(), "consecutive_failures": self._failures}
+
+
+def _mariadb_failure(exc):
+    import pymysql
+    # 2003 can't connect, 2006 server gone, 2013 lost connection / read timeout, 2055 lost with system error
+    if isinstance(exc, pymysql.err.InterfaceError):
+        return True
+    return isinstance(exc, pymysql.err.OperationalError) and bool(exc.args) and exc.args[0] in (2003, 2006, 2013, 2055)
+
+
+def _redis_failure(exc):
+    import redis
+    return isinstance(exc, (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError))
+
+
+def _firebase_failure(exc):
+    import requests
+    from google.api_core import exceptions as api_exceptions
+    from google.auth import exceptions as auth_exceptions
+    # Transport errors, timeouts and 5xx/429 answers; a missing blob or bad input does not count
+    return isinstance(exc, (
+        ConnectionError, TimeoutError,
+        requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+        auth_exceptions.TransportError,
+        api_exceptions.ServerError, api_exceptions.TooManyRequests, api_exceptions.RetryError,
+    ))
+
+
+mariadb_breaker = CircuitBreaker("mariadb", _mariadb_failure)
+redis_breaker = CircuitBreaker("redis", _redis_failure)
+firebase_breaker = CircuitBreaker("firebase", _firebase_failure)
+
+breakers = {b.name: b for b in (mariadb_breaker, redis_breaker, firebase_breaker)}
+
+
+class StaleCache:
+    """Small LRU of recent successful responses, served while the DB breaker is open."""
+
+    def __init__(self, max_entries, max_age):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.max_age:
+            return None
+        return entry[1]
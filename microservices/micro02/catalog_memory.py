@@ -0,0 +1,382 @@
+"""
+In-memory columnar copy of `libros` for the catalog GET endpoints.
+
+With CATALOG_MEMORY=true each process keeps the whole table in memory, one
+column per field instead of one dict per row:
+
+- integers (id) in array('q'), 8 bytes per row
+- DECIMAL (precio) as scaled integers in array('q'), so rendering gives the
+  same text as the driver's Decimal ("25.00", not "25.0")
+- DATETIME/TIMESTAMP as microseconds in array('q')
+- low-cardinality strings (formato, autor) interned, so every row points at
+  one shared string; other text in plain lists
+
+Indexes by ISBN, by format and in title order are kept beside the columns;
+the ordered ones are rebuilt lazily after a batch of changes.
+
+A background thread keeps the copy current with the delta sync queries
+(sync.changes) every CATALOG_MEMORY_REFRESH_SEC, and immediately when a
+change event arrives on the Redis stream or a write happens in this process.
+While the copy is loading, or older than CATALOG_MEMORY_MAX_STALENESS, reads
+go to MariaDB as before.
+
+Lookups, ordering and author matching compare strings the way the table's
+case- and accent-insensitive collation does (_collation_key: accents
+stripped, casefolded, trailing spaces ignored), and author names are
+matched as LIKE '%name%' patterns, so "garcia" finds "García" and the
+results do not depend on CATALOG_MEMORY.
+"""
+
+import os
+import re
+import sys
+import time
+import unicodedata
+import threading
+from array import array
+from datetime import datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+from dotenv import load_dotenv
+import db
+import sync
+import metrics
+import change_stream
+
+load_dotenv()
+
+CATALOG_MEMORY = os.getenv("CATALOG_MEMORY", "false").lower() == "true"
+CATALOG_MEMORY_REFRESH_SEC = float(os.getenv("CATALOG_MEMORY_REFRESH_SEC", "5"))
+CATALOG_MEMORY_MAX_STALENESS = float(os.getenv("CATALOG_MEMORY_MAX_STALENESS", "30"))
+
+INTERNED_COLUMNS = ("formato", "autor")
+
+CATALOG_ROWS = metrics.Gauge("catalog_memory_rows", "Books held in the in-memory catalog.")
+CATALOG_BYTES = metrics.Gauge("catalog_memory_bytes", "Approximate bytes used by the in-memory catalog.")
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+class _IntColumn:
+    def __init__(self):
+        self.values = array("q")
+
+    def accepts(self, value):
+        return type(value) is int and -2**63 <= value < 2**63
+
+    def encode(self, value):
+        return value
+
+    def decode(self, raw):
+        return raw
+
+
+class _DecimalColumn(_IntColumn):
+    """Fixed-point DECIMAL stored as an integer count of 10**-scale units."""
+
+    def __init__(self, scale):
+        super().__init__()
+        self.scale = scale
+
+    def accepts(self, value):
+        return isinstance(value, Decimal) and value.is_finite() and -value.as_tuple().exponent == self.scale
+
+    def encode(self, value):
+        return int(value.scaleb(self.scale))
+
+    def decode(self, raw):
+        return Decimal(raw).scaleb(-self.scale)
+
+
+class _DateTimeColumn(_IntColumn):
+    """Naive datetimes as microseconds since 1970-01-01 (exact round trip)."""
+
+    def accepts(self, value):
+        return type(value) is datetime and value.tzinfo is None
+
+    def encode(self, value):
+        delta = value - _EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+    def decode(self, raw):
+        return _EPOCH + timedelta(microseconds=raw)
+
+
+class _ObjectColumn:
+    def __init__(self, intern=False, values=None):
+        self.values = values if values is not None else []
+        self.intern = intern
+
+    def accepts(self, value):
+        return True
+
+    def encode(self, value):
+        return sys.intern(value) if self.intern and type(value) is str else value
+
+    def decode(self, raw):
+        return raw
+
+
+def _column_for(name, value):
+    if name in INTERNED_COLUMNS:
+        return _ObjectColumn(intern=True)
+    if type(value) is int:
+        return _IntColumn()
+    if isinstance(value, Decimal) and value.is_finite():
+        return _DecimalColumn(max(0, -value.as_tuple().exponent))
+    if type(value) is datetime and value.tzinfo is None:
+        return _DateTimeColumn()
+    return _ObjectColumn()
+
+
+def _fold(text):
+    """Accents stripped and casefolded, like the *_ci collations compare characters."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def _collation_key(value):
+    """Comparison key for a string column; trailing spaces are ignored (PAD SPACE)."""
+    return _fold(value.rstrip(" ")) if isinstance(value, str) else ""
+
+
+# Authors are few and interned, so their keys are worth caching for by_author
+_author_key = lru_cache(maxsize=65536)(_collation_key)
+
+
+def _like_pattern(pattern):
+    """Compile a SQL LIKE pattern (% and _ wildcards, backslash escape) into a regex over folded text."""
+    parts = []
+    chars = iter(pattern)
+    for c in chars:
+        if c == "\\":
+            parts.append(re.escape(_fold(next(chars, "\\"))))
+        elif c == "%":
+            parts.append(".*")
+        elif c == "_":
+            parts.append(".")
+        else:
+            parts.append(re.escape(_fold(c)))
+    return re.compile("".join(parts), re.DOTALL)
+
+
+class ColumnarCatalog:
+    """Rows of `libros` stored column by column, addressed by slot number.
+
+    Deleted slots are reused by later inserts. All methods are thread-safe.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._names = None
+        self._columns = {}
+        self._alive = array("B")
+        self._free = []
+        self._by_isbn = {}
+        self._title_order = None
+        self._format_order = None
+        self.token = None
+        self.refreshed_at = None
+
+    # --- Writes (refresh thread) ----------------------------------------------
+
+    def _demote(self, name):
+        """Switch a typed column to a plain list when a value does not fit it (e.g. NULL)."""
+        column = self._columns[name]
+        self._columns[name] = _ObjectColumn(values=[column.decode(raw) for raw in column.values])
+
+    def _write(self, slot, row):
+        for name in self._names:
+            value = row.get(name)
+            column = self._columns[name]
+            if not column.accepts(value):
+                self._demote(name)
+                column = self._columns[name]
+            raw = column.encode(value)
+            if slot == len(self._alive):
+                column.values.append(raw)
+            else:
+                column.values[slot] = raw
+
+    def _upsert(self, row):
+        if self._names is None:
+            self._names = list(row)
+            self._columns = {name: _column_for(name, row[name]) for name in self._names}
+
+        slot = self._by_isbn.get(_collation_key(row["isbn"]))
+        if slot is None:
+            slot = self._free.pop() if self._free else len(self._alive)
+        self._write(slot, row)
+        if slot == len(self._alive):
+            self._alive.append(1)
+        else:
+            self._alive[slot] = 1
+        self._by_isbn[_collation_key(row["isbn"])] = slot
+
+    def _delete(self, isbn):
+        slot = self._by_isbn.pop(_collation_key(isbn), None)
+        if slot is not None:
+            self._alive[slot] = 0
+            self._free.append(slot)
+
+    def apply(self, rows, deleted, token, reset=False):
+        """Apply one delta (or, with `reset`, a full load) and record its sync token."""
+        with self._lock:
+            if reset:
+                self._clear()
+            for row in rows:
+                self._upsert(row)
+            for isbn in deleted:
+                self._delete(isbn)
+            if rows or deleted or reset:
+                self._title_order = None
+                self._format_order = None
+            self.token = token
+            self.refreshed_at = time.monotonic()
+        CATALOG_ROWS.set(len(self._by_isbn))
+
+    # --- Reads -----------------------------------------------------------------
+
+    def _row(self, slot):
+        return {name: self._columns[name].decode(self._columns[name].values[slot]) for name in self._names}
+
+    def _ordered(self):
+        if self._title_order is None:
+            titles = self._columns["titulo"].values
+            ids = self._columns["id"].values
+            slots = sorted(self._by_isbn.values(), key=lambda s: (_collation_key(titles[s]), ids[s]))
+            formats = self._columns["formato"].values
+            by_format = {}
+            for slot in slots:
+                by_format.setdefault(_collation_key(formats[slot]), []).append(slot)
+            self._title_order, self._format_order = slots, by_format
+        return self._title_order
+
+    def all(self):
+        """Every book ordered by title."""
+        with self._lock:
+            if self._names is None:
+                return []
+            return [self._row(slot) for slot in self._ordered()]
+
+    def by_isbn(self, isbn):
+        with self._lock:
+            slot = self._by_isbn.get(_collation_key(isbn))
+            return [self._row(slot)] if slot is not None else []
+
+    def by_format(self, format_type):
+        with self._lock:
+            if self._names is None:
+                return []
+            self._ordered()
+            return [self._row(slot) for slot in self._format_order.get(_collation_key(format_type), [])]
+
+    def by_author(self, name):
+        """Books whose author matches `autor LIKE '%name%'`, ordered by title."""
+        pattern = _like_pattern(name)
+        with self._lock:
+            if self._names is None:
+                return []
+            authors = self._columns["autor"].values
+            return [self._row(slot) for slot in self._ordered()
+                    if isinstance(authors[slot], str) and pattern.search(_author_key(authors[slot]))]
+
+    def stats(self):
+        """Row count and approximate memory use per column."""
+        with self._lock:
+            columns = {}
+            for name, column in self._columns.items():
+                if isinstance(column.values, array):
+                    size = column.values.buffer_info()[1] * column.values.itemsize
+                else:
+                    # The list plus each distinct string once (interned values are shared)
+                    unique = {id(v): v for v in column.values if v is not None}
+                    size = sys.getsizeof(column.values) + sum(sys.getsizeof(v) for v in unique.values())
+                columns[name] = {"type": type(column).__name__.strip("_"), "bytes": size}
+            rows = len(self._by_isbn)
+            total = sum(c["bytes"] for c in columns.values()) + len(self._alive)
+            age = round(time.monotonic() - self.refreshed_at, 3) if self.refreshed_at else None
+        CATALOG_BYTES.set(total)
+        return {
+            "rows": rows,
+            "slots": len(self._alive),
+            "bytes": total,
+            "bytes_per_row": round(total / rows, 1) if rows else 0,
+            "columns": columns,
+            "age_sec": age,
+            "token": self.token,
+        }
+
+
+_catalog = ColumnarCatalog()
+_wake = threading.Event()
+_refresher_pid = None
+_refresher_lock = threading.Lock()
+_subscribed = False
+
+
+def refresh(catalog=_catalog):
+    """Pull changes since the catalog's token (everything on first load or after a 410)."""
+    conn = db.get_conn()
+    cursor = conn.cursor()
+    try:
+        try:
+            token, rows, deleted = sync.changes(cursor, catalog.token)
+            reset = catalog.token is None
+        except sync.TokenExpired:
+            token, rows, deleted = sync.changes(cursor, None)
+            reset = True
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    catalog.apply(rows, deleted, token, reset=reset)
+
+
+def _refresh_loop():
+    while True:
+        try:
+            refresh()
+        except Exception as e:
+            print(f"Warning: In-memory catalog refresh failed: {e}")
+        _wake.wait(CATALOG_MEMORY_REFRESH_SEC)
+        _wake.clear()
+
+
+def wake(event=None):
+    """Ask the refresh thread to pull changes now (after a write or a change event)."""
+    _wake.set()
+
+
+def ensure_started():
+    """Start the refresh thread once per process (again in each forked worker)."""
+    global _refresher_pid, _subscribed
+
+    if not CATALOG_MEMORY or _refresher_pid == os.getpid():
+        return
+    with _refresher_lock:
+        if _refresher_pid != os.getpid():
+            if not _subscribed:
+                change_stream.on_change(wake)
+                _subscribed = True
+            change_stream.ensure_listening()
+            threading.Thread(target=_refresh_loop, name="catalog-memory", daemon=True).start()
+            _refresher_pid = os.getpid()
+
+
+def get_catalog():
+    """The in-memory catalog if enabled, loaded and fresh enough; otherwise None (use MariaDB)."""
+    if not CATALOG_MEMORY:
+        return None
+    ensure_started()
+    refreshed_at = _catalog.refreshed_at
+    if refreshed_at is None or time.monotonic() - refreshed_at > CATALOG_MEMORY_MAX_STALENESS:
+        return None
+    return _catalog
+
+
+def stats():
+    return dict(_catalog.stats(), enabled=CATALOG_MEMORY)
@@ -0,0 +1,189 @@
+"""
+Catalog change stream on Redis Streams.
+
+Every successful write to `libros` (create, update, delete, image variants)
+appends a compact event to the capped stream CHANGE_STREAM_KEY after the
+commit:
+
+    op=update isbn=1234567890 ts=1760000000.123 origin=web-1:4242
+
+Publishing never fails the request: if Redis is down the event is dropped
+with a warning, and consumers that need every change fall back to
+GET /api/books/changes.
+
+In-process caches register a callback with on_change(); a daemon thread per
+process reads the stream and calls them. External consumers (indexers,
+mirrors) use a consumer group so each event is delivered to one member and
+acknowledged:
+
+    python change_stream.py consume --group indexer --consumer indexer-1
+    python change_stream.py tail
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHANGE_STREAM_ENABLED = os.getenv("CHANGE_STREAM_ENABLED", "true").lower() == "true"
+CHANGE_STREAM_KEY = os.getenv("CHANGE_STREAM_KEY", "libros:changes")
+CHANGE_STREAM_MAXLEN = int(os.getenv("CHANGE_STREAM_MAXLEN", "10000"))
+CHANGE_STREAM_BLOCK_MS = int(os.getenv("CHANGE_STREAM_BLOCK_MS", "5000"))
+
+_callbacks = []
+_listener_pid = None
+_listener_lock = threading.Lock()
+
+
+def origin():
+    """Identify the writing process (host:pid)."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def event_fields(op, isbn):
+    """Fields of one change event."""
+    return {"op": op, "isbn": isbn, "ts": f"{time.time():.3f}", "origin": origin()}
+
+
+def publish(op, isbn, client=None):
+    """Append a change event after a committed write. Never raises."""
+    if not CHANGE_STREAM_ENABLED:
+        return None
+    try:
+        if client is None:
+            from auth import r as client
+        # MAXLEN ~ lets Redis trim whole macro nodes, which is much cheaper than an exact cap
+        return client.xadd(CHANGE_STREAM_KEY, event_fields(op, isbn),
+                           maxlen=CHANGE_STREAM_MAXLEN, approximate=True)
+    except Exception as e:
+        print(f"Warning: Could not publish {op} event for ISBN {isbn}: {e}")
+        return None
+
+
+def _stream_client():
+    """Dedicated connection whose socket timeout outlasts a blocking XREAD."""
+    import redis
+    return redis.Redis(
+        host=os.getenv("REDIS_HOST", "127.0.0.1"),
+        port=int(os.getenv("REDIS_PORT", "6379")),
+        db=int(os.getenv("REDIS_DB", "0")),
+        decode_responses=True,
+        socket_connect_timeout=float(os.getenv("REDIS_CONNECT_TIMEOUT", "1")),
+        socket_timeout=CHANGE_STREAM_BLOCK_MS / 1000 + 5
+    )
+
+
+def on_change(callback):
+    """Call `callback(event)` for every change event, from any process.
+
+    `event` is the dict of stream fields plus "id". Callbacks run on the
+    listener thread and must be quick and thread-safe. Can be used as a
+    decorator.
+    """
+    _callbacks.append(callback)
+    ensure_listening()
+    return callback
+
+
+def _dispatch(event):
+    for callback in list(_callbacks):
+        try:
+            callback(event)
+        except Exception as e:
+            print(f"Warning: Change callback {getattr(callback, '__name__', callback)} failed: {e}")
+
+
+def _listen():
+    client = None
+    last_id = "$"
+    while True:
+        try:
+            if client is None:
+                client = _stream_client()
+            response = client.xread({CHANGE_STREAM_KEY: last_id}, block=CHANGE_STREAM_BLOCK_MS, count=100)
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    _dispatch(dict(fields, id=entry_id))
+        except Exception as e:
+            print(f"Warning: Change stream listener error: {e}")
+            client = None
+            time.sleep(1)
+
+
+def ensure_listening():
+    """Start the listener thread once per process (again in each forked worker)."""
+    global _listener_pid
+
+    if not CHANGE_STREAM_ENABLED or not _callbacks or _listener_pid == os.getpid():
+        return
+    with _listener_lock:
+        if _listener_pid != os.getpid():
+            threading.Thread(target=_listen, name="change-stream", daemon=True).start()
+            _listener_pid = os.getpid()
+
+
+# --- Consumer groups for external subscribers -------------------------------
+
+def create_group(client, group, start="$"):
+    """Create `group` on the stream (and the stream itself) if it does not exist."""
+    import redis
+    try:
+        client.xgroup_create(CHANGE_STREAM_KEY, group, id=start, mkstream=True)
+    except redis.exceptions.ResponseError as e:
+        if "BUSYGROUP" not in str(e):
+            raise
+
+
+def read_group(client, group, consumer, count=100, block_ms=CHANGE_STREAM_BLOCK_MS):
+    """Return this consumer's next batch as [(id, fields)]; acknowledge them with ack()."""
+    response = client.xreadgroup(group, consumer, {CHANGE_STREAM_KEY: ">"}, count=count, block=block_ms)
+    return [entry for _, entries in response or [] for entry in entries]
+
+
+def claim_abandoned(client, group, consumer, min_idle_ms=60000, count=100):
+    """Take over events another consumer read but never acknowledged (e.g. it crashed)."""
+    result = client.xautoclaim(CHANGE_STREAM_KEY, group, consumer, min_idle_ms, start_id="0-0", count=count)
+    return result[1]
+
+
+def ack(client, group, *ids):
+    if ids:
+        client.xack(CHANGE_STREAM_KEY, group, *ids)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Read the catalog change stream")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("tail", help="print new events (no consumer group)")
+    consume = sub.add_parser("consume", help="read as a consumer group member and acknowledge")
+    consume.add_argument("--group", required=True)
+    consume.add_argument("--consumer", default=origin())
+    consume.add_argument("--from-start", action="store_true", help="new group starts at the oldest event")
+    args = parser.parse_args()
+
+    client = _stream_client()
+    try:
+        if args.command == "tail":
+            last_id = "$"
+            while True:
+                for _, entries in client.xread({CHANGE_STREAM_KEY: last_id}, block=CHANGE_STREAM_BLOCK_MS) or []:
+                    for entry_id, fields in entries:
+                        last_id = entry_id
+                        print(json.dumps(dict(fields, id=entry_id)), flush=True)
+        else:
+            create_group(client, args.group, "0" if args.from_start else "$")
+            while True:
+                entries = claim_abandoned(client, args.group, args.consumer) or read_group(client, args.group, args.consumer)
+                for entry_id, fields in entries:
+                    print(json.dumps(dict(fields, id=entry_id)), flush=True)
+                ack(client, args.group, *[entry_id for entry_id, _ in entries])
+    except KeyboardInterrupt:
+        sys.exit(0)
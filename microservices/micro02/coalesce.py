@@ -0,0 +1,152 @@
+"""
+Single-flight coalescing of identical catalog reads.
+
+When several requests for the same endpoint and query parameters arrive
+while one of them is already running its query, the others wait for that
+result instead of running the same SQL and XML rendering again.
+
+Within a process this is a dict of in-flight calls. With COALESCE_REDIS=true
+the leader also takes a short Redis lock (SET NX PX) and publishes its result
+under a key tied to that lock, so requests in other workers wait for it too.
+Results are only shared with requests that arrived while the call was in
+flight; nothing is served from a previous call.
+"""
+
+import os
+import json
+import time
+import uuid
+import threading
+from urllib.parse import urlencode
+from flask import request
+from dotenv import load_dotenv
+import metrics
+
+load_dotenv()
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "true").lower() == "true"
+COALESCE_REDIS = os.getenv("COALESCE_REDIS", "false").lower() == "true"
+COALESCE_WAIT_TIMEOUT = float(os.getenv("COALESCE_WAIT_TIMEOUT", "5"))
+COALESCE_LOCK_MS = int(os.getenv("COALESCE_LOCK_MS", "3000"))
+COALESCE_RESULT_TTL_MS = int(os.getenv("COALESCE_RESULT_TTL_MS", "2000"))
+COALESCE_POLL_MS = float(os.getenv("COALESCE_POLL_MS", "10"))
+
+COALESCED = metrics.Counter(
+    "coalesced_requests_total",
+    "Catalog reads by coalescing role (leader ran the query, follower/remote reused it).",
+    ("endpoint", "role")
+)
+
+_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def request_key():
+    """Key for the current request: endpoint plus its query parameters in sorted order."""
+    args = urlencode(sorted(request.args.items(multi=True)))
+    return f"{request.endpoint}?{args}"
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Run at most one call per key at a time and share its result with concurrent callers.
+
+    Results must be JSON-serializable when the Redis layer is on, and the
+    Redis client must decode responses.
+    """
+
+    def __init__(self, redis_client=None, prefix="coalesce"):
+        self._redis = redis_client
+        self._prefix = prefix
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        if not COALESCE_ENABLED:
+            return fn()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.done.wait(COALESCE_WAIT_TIMEOUT):
+                COALESCED.inc(key.split("?", 1)[0], "follower")
+                if call.error is not None:
+                    raise call.error
+                return call.result
+            # The leader is stuck; do not make this request wait any longer
+            return fn()
+
+        try:
+            call.result = self._run(key, fn)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def _run(self, key, fn):
+        endpoint = key.split("?", 1)[0]
+        if not COALESCE_REDIS or self._redis is None:
+            COALESCED.inc(endpoint, "leader")
+            return fn()
+
+        lock_key = f"{self._prefix}:lock:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = self._redis.set(lock_key, token, nx=True, px=COALESCE_LOCK_MS)
+            if not acquired:
+                found, result = self._wait_remote(lock_key)
+                if found:
+                    COALESCED.inc(endpoint, "remote")
+                    return result
+        except Exception as e:
+            # Coalescing is an optimization; never fail a read because Redis is unhappy
+            print(f"Warning: coalescing lock unavailable for {key}: {e}")
+            acquired = False
+
+        COALESCED.inc(endpoint, "leader")
+        result = fn()
+        if acquired:
+            try:
+                self._redis.set(f"{self._prefix}:result:{token}", json.dumps(result), px=COALESCE_RESULT_TTL_MS)
+                # Release only our own lock; it may have expired and been taken by another worker
+                self._redis.eval(_RELEASE_LOCK, 1, lock_key, token)
+            except Exception as e:
+                print(f"Warning: could not publish coalesced result for {key}: {e}")
+        return result
+
+    def _wait_remote(self, lock_key):
+        """Wait for the worker holding `lock_key` to publish. Returns (found, result)."""
+        token = self._redis.get(lock_key)
+        if token is None:
+            return False, None
+        result_key = f"{self._prefix}:result:{token}"
+        deadline = time.monotonic() + min(COALESCE_WAIT_TIMEOUT, COALESCE_LOCK_MS / 1000)
+        while time.monotonic() < deadline:
+            payload = self._redis.get(result_key)
+            if payload is not None:
+                return True, json.loads(payload)
+            current = self._redis.get(lock_key)
+            if current != token:
+                # Released: the result is either there now or the leader failed
+                payload = self._redis.get(result_key)
+                return (True, json.loads(payload)) if payload is not None else (False, None)
+            time.sleep(COALESCE_POLL_MS / 1000)
+        return False, None
@@ -0,0 +1,82 @@
+"""
+Run the same Locust scenario against the sync (Flask) and async (Starlette)
+servers and print a side-by-side comparison.
+
+Start both servers first:
+    flask run -p 5000 --host=0.0.0.0
+    uvicorn async_app:app --host 0.0.0.0 --port 5001
+
+Then run:
+    python compare_modes.py -u 200 -r 20 -t 60s
+"""
+
+import argparse
+import csv
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_locust(host, users, spawn_rate, run_time, csv_prefix, user_classes, extra_args=()):
+    """Run a headless Locust test and return the rows of its stats CSV keyed by name.
+
+    `extra_args` are passed to Locust before the user classes (e.g. ["--tags", "catalog"]).
+    """
+    cmd = [
+        sys.executable, "-m", "locust",
+        "-f", os.path.join(HERE, "locustfile.py"),
+        "--host", host,
+        "--headless",
+        "-u", str(users),
+        "-r", str(spawn_rate),
+        "-t", run_time,
+        "--csv", csv_prefix,
+        "--only-summary",
+    ] + list(extra_args) + user_classes
+    print(f"Running Locust against {host} ...", flush=True)
+    subprocess.run(cmd, check=False)
+
+    with open(f"{csv_prefix}_stats.csv", newline="") as f:
+        return {row["Name"]: row for row in csv.DictReader(f)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sync-host", default="http://127.0.0.1:5000")
+    parser.add_argument("--async-host", default="http://127.0.0.1:5001")
+    parser.add_argument("-u", "--users", type=int, default=100)
+    parser.add_argument("-r", "--spawn-rate", type=int, default=10)
+    parser.add_argument("-t", "--run-time", default="60s")
+    parser.add_argument("--out-dir", default="compare_results")
+    parser.add_argument("user_classes", nargs="*", default=["BooksAPIUser"],
+                        help="Locust user classes to run (default: BooksAPIUser)")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    results = {}
+    for mode, host in (("sync", args.sync_host), ("async", args.async_host)):
+        results[mode] = run_locust(
+            host, args.users, args.spawn_rate, args.run_time,
+            os.path.join(args.out_dir, mode), args.user_classes
+        )
+
+    names = [n for n in results["sync"] if n in results["async"]]
+    header = f"{'Endpoint':<32} {'RPS sync':>9} {'RPS async':>10} {'p50 sync':>9} {'p50 async':>10} {'p95 sync':>9} {'p95 async':>10} {'fail sync':>10} {'fail async':>11}"
+    print()
+    print(header)
+    print("-" * len(header))
+    for name in names:
+        s, a = results["sync"][name], results["async"][name]
+        print(
+            f"{name[:32]:<32} "
+            f"{float(s['Requests/s']):>9.1f} {float(a['Requests/s']):>10.1f} "
+            f"{s['50%']:>9} {a['50%']:>10} "
+            f"{s['95%']:>9} {a['95%']:>10} "
+            f"{s['Failure Count']:>10} {a['Failure Count']:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,537 @@
 import os
+import re
+import time
+import logging
+import threading
+import itertools
+from collections import deque
 import pymysql
+from pymysql.constants import SERVER_STATUS
 from dotenv import load_dotenv
+import metrics
+from breaker import OPEN, CircuitBreaker, DependencyUnavailable, mariadb_breaker
 
 load_dotenv()
 
+DB_SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "100"))
+DB_QUERY_SAMPLES = int(os.getenv("DB_QUERY_SAMPLES", "512"))
+DB_EXPLAIN_INTERVAL = float(os.getenv("DB_EXPLAIN_INTERVAL_SEC", "60"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))  # 0 disables pooling
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_PING_AFTER = float(os.getenv("DB_POOL_PING_AFTER_SEC", "30"))
+DB_CONNECT_TIMEOUT = int(os.getenv("DB_CONNECT_TIMEOUT", "3"))
+DB_READ_TIMEOUT = int(os.getenv("DB_READ_TIMEOUT", "10"))
+DB_WRITE_TIMEOUT = int(os.getenv("DB_WRITE_TIMEOUT", "10"))
+# Read replicas: comma-separated host[:port]; empty sends every read to the primary (DB_HOST)
+DB_REPLICAS = [h.strip() for h in os.getenv("DB_REPLICAS", "").split(",") if h.strip()]
+DB_REPLICA_MAX_LAG_SEC = float(os.getenv("DB_REPLICA_MAX_LAG_SEC", "5"))
+DB_REPLICA_CHECK_SEC = float(os.getenv("DB_REPLICA_CHECK_SEC", "2"))
+DB_STICKY_SEC = float(os.getenv("DB_STICKY_SEC", "10"))
+
+READ_ROUTING = metrics.Counter(
+    "db_read_routing_total", "Catalog reads by the server that answered them.", ("target",)
+)
+
+slow_log = logging.getLogger("slow_query")
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_VALUE_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+def fingerprint(query):
+    """Normalize a statement so that calls differing only in literals share one key.
+
+    "SELECT * FROM libros WHERE isbn = %s" and the same query with a literal
+    ISBN both become "select * from libros where isbn = ?".
+    """
+    text = _STRING_LITERAL.sub("?", query)
+    text = _PLACEHOLDER.sub("?", text)
+    text = _NUMBER_LITERAL.sub("?", text)
+    text = _VALUE_LIST.sub("(?+)", text)
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+class QueryStats:
+    """Per-fingerprint call count, total/max time, p95 and rows, plus recent slow statements."""
+
+    def __init__(self, samples=DB_QUERY_SAMPLES, slow_entries=100):
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._fingerprints = {}
+        self._last_explain = {}
+        self._samples = samples
+        self.slow = deque(maxlen=slow_entries)
+
+    def fingerprint(self, query):
+        fp = self._fingerprints.get(query)
+        if fp is None:
+            fp = fingerprint(query)
+            if len(self._fingerprints) < 10000:
+                self._fingerprints[query] = fp
+        return fp
+
+    def record(self, fp, elapsed, rows):
+        with self._lock:
+            entry = self._stats.get(fp)
+            if entry is None:
+                entry = self._stats[fp] = {
+                    "count": 0, "total": 0.0, "max": 0.0, "rows": 0,
+                    "recent": deque(maxlen=self._samples)
+                }
+            entry["count"] += 1
+            entry["total"] += elapsed
+            entry["max"] = max(entry["max"], elapsed)
+            entry["rows"] += max(rows, 0)
+            entry["recent"].append(elapsed)
+
+    def should_explain(self, fp):
+        """Rate-limit EXPLAIN to once per DB_EXPLAIN_INTERVAL per fingerprint."""
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_explain.get(fp)
+            if last is not None and now - last < DB_EXPLAIN_INTERVAL:
+                return False
+            self._last_explain[fp] = now
+            return True
+
+    def snapshot(self):
+        """Return stats sorted by total time, slowest first."""
+        with self._lock:
+            items = [(fp, dict(e, recent=sorted(e["recent"]))) for fp, e in self._stats.items()]
+        result = []
+        for fp, e in items:
+            recent = e["recent"]
+            p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+            result.append({
+                "fingerprint": fp,
+                "count": e["count"],
+                "total_ms": round(e["total"] * 1000, 3),
+                "avg_ms": round(e["total"] * 1000 / e["count"], 3),
+                "p95_ms": round(p95 * 1000, 3),
+                "max_ms": round(e["max"] * 1000, 3),
+                "rows": e["rows"],
+                "avg_rows": round(e["rows"] / e["count"], 2),
+            })
+        return sorted(result, key=lambda r: r["total_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._last_explain.clear()
+            self.slow.clear()
+
+query_stats = QueryStats()
+
+class InstrumentedCursor(pymysql.cursors.DictCursor):
+    """DictCursor that reports statement time to the metrics registry and the query stats."""
+
+    def execute(self, query, args=None):
+        start = time.perf_counter()
+        with self.connection.breaker.guard(), metrics.track("mariadb", "query"):
+            result = super().execute(query, args)
+        elapsed = time.perf_counter() - start
+
+        fp = query_stats.fingerprint(query)
+        query_stats.record(fp, elapsed, self.rowcount)
+        if elapsed * 1000 >= DB_SLOW_QUERY_MS:
+            self._log_slow(fp, query, args, elapsed)
+        return result
+
+    def _log_slow(self, fp, query, args, elapsed):
+        plan = None
+        if query.lstrip()[:6].lower() == "select" and query_stats.should_explain(fp):
+            try:
+                # Plain cursor so the EXPLAIN itself is not recorded
+                with pymysql.cursors.DictCursor(self.connection) as cursor:
+                    cursor.execute("EXPLAIN " + query, args)
+                    plan = cursor.fetchall()
+            except pymysql.Error as e:
+                plan = [{"error": str(e)}]
+
+        entry = {
+            "at": time.time(),
+            "ms": round(elapsed * 1000, 3),
+            "rows": self.rowcount,
+            "fingerprint": fp,
+            "statement": self.mogrify(query, args)[:2000],
+            "explain": plan,
+        }
+        query_stats.slow.append(entry)
+        slow_log.warning("Slow query (%.1f ms, %d rows): %s | explain=%s",
+                         entry["ms"], entry["rows"], entry["statement"], plan)
+
+class InstrumentedConnection(pymysql.connections.Connection):
+    """Connection that reports commit time (the fsync on the server) to the metrics registry.
+
+    `breaker` is the circuit breaker of the server it is connected to.
+    """
+
+    breaker = mariadb_breaker
+
+    def commit(self):
+        with self.breaker.guard(), metrics.track("mariadb", "commit"):
+            return super().commit()
+
+class PoolTimeout(DependencyUnavailable):
+    """Raised when no pooled connection becomes free within DB_POOL_TIMEOUT."""
+
+    def __init__(self, timeout):
+        super().__init__("mariadb", f"No database connection available after {timeout}s")
+
+class PooledConnection:
+    """Proxy returned by get_conn() when pooling is on.
+
+    Behaves like the underlying connection; close() ends any open transaction
+    and hands the connection back to the pool instead of closing the socket.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of MariaDB connections."""
+
+    def __init__(self, size, timeout, connect):
+        self.size = size
+        self.timeout = timeout
+        self._connect = connect
+        self._cond = threading.Condition()
+        self._idle = []
+        self._created = 0
+        self.in_use = 0
+        self.waiting = 0
+
+    def acquire(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._created < self.size:
+                    self._created += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(self.timeout)
+                self.waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.in_use += 1
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif time.monotonic() - conn._pool_released_at > DB_POOL_PING_AFTER:
+                with conn.breaker.guard():
+                    conn.ping(reconnect=True)
+        except Exception:
+            if conn is not None:
+                # The idle connection failed its ping (or the breaker rejected it): do not leak its socket
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            with self._cond:
+                self._created -= 1
+                self.in_use -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn)
+
+    def release(self, conn):
+        try:
+            if conn.open and conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                # End the transaction so the next user does not see a stale snapshot
+                conn.rollback()
+            reusable = conn.open
+        except pymysql.Error:
+            reusable = False
+
+        with self._cond:
+            self.in_use -= 1
+            if reusable:
+                conn._pool_released_at = time.monotonic()
+                self._idle.append(conn)
+            else:
+                self._created -= 1
+                try:
+                    conn.close()
+                except pymysql.Error:
+                    pass
+            self._cond.notify()
+
+    def reset_after_fork(self):
+        """Abandon connections and lock state inherited from the parent process.
+
+        Inherited sockets are dropped, not closed: closing would send
+        COM_QUIT on a connection the parent may still be using.
+        """
+        self._cond = threading.Condition()
+        self._idle = []
+        self._created = 0
+        self.in_use = 0
+        self.waiting = 0
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "open": self._created,
+                "in_use": self.in_use,
+                "idle": len(self._idle),
+                "waiting": self.waiting,
+                "utilization": round(self.in_use / self.size, 3) if self.size else 0.0,
+            }
+
+def connect(host=None, port=None, breaker=mariadb_breaker):
+    """Open a new, unpooled database connection using environment variables.
+
+    Connects to the primary (DB_HOST) unless a replica's host, port and breaker are given.
+    """
+    with breaker.guard(), metrics.track("mariadb", "connect"):
+        conn = InstrumentedConnection(
+            host=host or os.getenv("DB_HOST", "127.0.0.1"),
+            user=os.getenv("DB_USER", "root"),
+            password=os.getenv("DB_PASS", ""),
+            database=os.getenv("DB_NAME", "Libros"),
+            port=port or int(os.getenv("DB_PORT", "3306")),
+            charset=os.getenv("DB_CHARSET", "utf8mb4"),
+            cursorclass=InstrumentedCursor,
+            connect_timeout=DB_CONNECT_TIMEOUT,
+            read_timeout=DB_READ_TIMEOUT,
+            write_timeout=DB_WRITE_TIMEOUT
+        )
+    conn.breaker = breaker
+    return conn
+
+_pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, connect) if DB_POOL_SIZE > 0 else None
+
 def get_conn():
-    """Create and return a database connection using environment variables."""
-    return pymysql.connect(
-        host=os.getenv("DB_HOST", "127.0.0.1"),
-        user=os.getenv("DB_USER", "root"),
-        password=os.getenv("DB_PASS", ""),
-        database=os.getenv("DB_NAME", "Libros"),
-        port=int(os.getenv("DB_PORT", "3306")),
-        charset=os.getenv("DB_CHARSET", "utf8mb4"),
-        cursorclass=pymysql.cursors.DictCursor
-    )
+    """Return a database connection; pooled unless DB_POOL_SIZE=0.
+
+    Callers use it exactly like a plain connection and call close() when done.
+    """
+    if _pool is None:
+        return connect()
+    return _pool.acquire()
+
+def reset_after_fork():
+    """Give a forked worker its own, empty connection pools."""
+    global _checker_pid
+    if _pool is not None:
+        _pool.reset_after_fork()
+    for replica in _replicas:
+        replica.reset_after_fork()
+    _checker_pid = None
+
+def pool_stats():
+    """Return pool usage, or None when pooling is disabled."""
+    return _pool.stats() if _pool is not None else None
+
+# --- Read replicas -------------------------------------------------------------
+
+class Replica:
+    """One read replica: its own pool and circuit breaker, plus the last lag check.
+
+    A replica is in rotation only while its last check (at most three
+    intervals old) found replication running with at most
+    DB_REPLICA_MAX_LAG_SEC of lag and its breaker is not open.
+    """
+
+    def __init__(self, index, address):
+        host, _, port = address.partition(":")
+        self.host = host
+        self.port = int(port or os.getenv("DB_PORT", "3306"))
+        self.name = f"{self.host}:{self.port}"
+        self.breaker = CircuitBreaker(f"mariadb_replica_{index}", mariadb_breaker.is_failure)
+        self.pool = ConnectionPool(DB_POOL_SIZE, DB_POOL_TIMEOUT, self.connect) if DB_POOL_SIZE > 0 else None
+        self.lag = None
+        self.error = "not checked yet"
+        self.checked_at = None
+        self._probe_conn = None
+
+    def connect(self):
+        return connect(self.host, self.port, self.breaker)
+
+    def get_conn(self):
+        return self.pool.acquire() if self.pool is not None else self.connect()
+
+    @property
+    def in_rotation(self):
+        if self.error is not None or self.checked_at is None:
+            return False
+        if time.monotonic() - self.checked_at > DB_REPLICA_CHECK_SEC * 3:
+            return False
+        return self.breaker.state != OPEN
+
+    def take_out(self, reason):
+        """Remove from rotation until the next successful check."""
+        self.error = reason
+
+    def check(self):
+        """Measure replication lag on a dedicated connection (not the request pool)."""
+        try:
+            if self._probe_conn is None or not self._probe_conn.open:
+                self._probe_conn = self.connect()
+            with self._probe_conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                cursor.execute("SHOW SLAVE STATUS")
+                status = cursor.fetchone()
+            if status is None:
+                self.lag, self.error = None, "not configured as a replica"
+            elif status["Seconds_Behind_Master"] is None:
+                self.lag, self.error = None, "replication stopped"
+            else:
+                self.lag = int(status["Seconds_Behind_Master"])
+                self.error = f"lag {self.lag}s > {DB_REPLICA_MAX_LAG_SEC:g}s" if self.lag > DB_REPLICA_MAX_LAG_SEC else None
+        except Exception as e:
+            self._probe_conn = None
+            self.lag, self.error = None, str(e)
+        self.checked_at = time.monotonic()
+
+    def reset_after_fork(self):
+        if self.pool is not None:
+            self.pool.reset_after_fork()
+        self._probe_conn = None
+
+    def stats(self):
+        return {
+            "replica": self.name,
+            "in_rotation": self.in_rotation,
+            "lag_sec": self.lag,
+            "error": self.error,
+            "circuit_breaker": self.breaker.status()["state"],
+            "pool": self.pool.stats() if self.pool is not None else None,
+        }
+
+_replicas = [Replica(i, address) for i, address in enumerate(DB_REPLICAS, 1)]
+_next_replica = itertools.count()
+_checker_pid = None
+_checker_lock = threading.Lock()
+_sticky = {}
+_sticky_swept = 0.0
+
+def _check_replicas_loop():
+    while True:
+        for replica in _replicas:
+            replica.check()
+        time.sleep(DB_REPLICA_CHECK_SEC)
+
+def ensure_replica_checker():
+    """Start the lag checker thread once per process (again in each forked worker)."""
+    global _checker_pid
+
+    if not _replicas or _checker_pid == os.getpid():
+        return
+    with _checker_lock:
+        if _checker_pid != os.getpid():
+            threading.Thread(target=_check_replicas_loop, name="replica-check", daemon=True).start()
+            _checker_pid = os.getpid()
+
+def _choose_replica():
+    """Next replica in rotation (round robin), or None."""
+    ensure_replica_checker()
+    candidates = [replica for replica in _replicas if replica.in_rotation]
+    if not candidates:
+        return None
+    return candidates[next(_next_replica) % len(candidates)]
+
+def _prune_sticky(now):
+    """Drop expired stickiness, at most once per DB_STICKY_SEC.
+
+    Sessions that never read again would otherwise stay in `_sticky`
+    forever; with a sweep per window it holds about two windows of writers.
+    """
+    global _sticky_swept
+
+    if now - _sticky_swept < DB_STICKY_SEC:
+        return
+    _sticky_swept = now
+    for session, expires in list(_sticky.items()):
+        if expires <= now:
+            _sticky.pop(session, None)
+
+def stick_to_primary(session):
+    """Send `session`'s reads to the primary for DB_STICKY_SEC after it writes.
+
+    Shared through Redis so every worker honours it; the local copy saves a
+    round trip on the worker that handled the write.
+    """
+    if not _replicas or session is None:
+        return
+    now = time.monotonic()
+    _prune_sticky(now)
+    _sticky[session] = now + DB_STICKY_SEC
+    try:
+        from auth import r
+        r.set(f"db:sticky:{session}", 1, px=int(DB_STICKY_SEC * 1000))
+    except Exception as e:
+        print(f"Warning: Could not share primary stickiness for {session}: {e}")
+
+def is_sticky(session):
+    """Whether `session` wrote recently and must read from the primary."""
+    if not _replicas or session is None:
+        return False
+    expires = _sticky.get(session)
+    if expires is not None:
+        if expires > time.monotonic():
+            return True
+        _sticky.pop(session, None)
+    try:
+        from auth import r
+        return bool(r.exists(f"db:sticky:{session}"))
+    except Exception:
+        # Without the shared marker the primary is the only safe choice
+        return True
+
+def read(fn, primary=False):
+    """Run `fn(cursor)` for a read-only query and return its result.
+
+    Goes to a replica in rotation unless `primary` is set or none is
+    available. A replica that fails is taken out of rotation and the read is
+    retried once on the primary.
+    """
+    replica = None if primary else _choose_replica()
+    if replica is not None:
+        try:
+            result = _run_read(replica.get_conn, fn)
+            READ_ROUTING.inc("replica")
+            return result
+        except DependencyUnavailable as e:
+            replica.take_out(str(e))
+    result = _run_read(get_conn, fn)
+    READ_ROUTING.inc("primary")
+    return result
+
+def _run_read(get, fn):
+    conn = get()
+    cursor = conn.cursor()
+    try:
+        return fn(cursor)
+    finally:
+        cursor.close()
+        conn.close()
 
+def replica_stats():
+    """State of each configured replica (empty list without replicas)."""
+    return [replica.stats() for replica in _replicas]
 
@@ -1,18 +1,32 @@
 import os
-import firebase_admin
-from firebase_admin import credentials, storage
 from dotenv import load_dotenv
+from metrics import timed
+from breaker import firebase_breaker
 
 load_dotenv()
 
+# Per-request timeout for Storage API calls, in seconds
+FIREBASE_TIMEOUT = float(os.getenv("FIREBASE_TIMEOUT", "10"))
+
 # Initialize Firebase Admin SDK
+# firebase_admin (and the google-cloud client stack behind it) is imported on
+# first use so that importing this module stays cheap for workers that never
+# touch Firebase.
 _firebase_app = None
 
+def _bucket():
+    """Return the default Storage bucket, importing the SDK lazily."""
+    from firebase_admin import storage
+    return storage.bucket()
+
 def get_firebase_app():
     """Initialize and return Firebase app instance."""
     global _firebase_app
     
     if _firebase_app is None:
+        import firebase_admin
+        from firebase_admin import credentials
+        
         # Check if Firebase credentials are provided via environment variable
         cred_path = os.getenv('FIREBASE_CREDENTIALS_PATH')
         
@@ -40,6 +54,24 @@ def get_firebase_app():
     
     return _firebase_app
 
+def reset_after_fork():
+    """Forget the Firebase app (and its HTTP sessions) inherited from the parent process.
+
+    The references are dropped without delete_app(), whose cleanup would close
+    sockets the parent still uses. The next call initializes a fresh app in
+    this worker.
+    """
+    global _firebase_app
+    
+    _firebase_app = None
+    import sys
+    if 'firebase_admin' not in sys.modules:
+        return
+    import firebase_admin
+    with firebase_admin._apps_lock:
+        firebase_admin._apps.clear()
+
+@timed("firebase", "get_url")
 def get_image_url(image_path):
     """
     Get a public URL for an image stored in Firebase Storage.
@@ -55,18 +87,19 @@ def get_image_url(image_path):
         if app is None:
             return None  # Firebase not configured
         
-        bucket = storage.bucket()
-        blob = bucket.blob(image_path)
-        
-        # Check if blob exists
-        if not blob.exists():
-            return None
-        
-        # Generate a signed URL that lasts for 1 year
-        url = blob.generate_signed_url(
-            expiration=31536000,  # 1 year in seconds
-            method='GET'
-        )
+        with firebase_breaker.guard():
+            bucket = _bucket()
+            blob = bucket.blob(image_path)
+            
+            # Check if blob exists
+            if not blob.exists(timeout=FIREBASE_TIMEOUT):
+                return None
+            
+            # Generate a signed URL that lasts for 1 year
+            url = blob.generate_signed_url(
+                expiration=31536000,  # 1 year in seconds
+                method='GET'
+            )
         return url
     except Exception as e:
         # Silently fail - Firebase not configured or image doesn't exist
@@ -94,6 +127,7 @@ def get_image_url_by_isbn(isbn):
     
     return None
 
+@timed("firebase", "upload")
 def upload_image(file_data, image_path, content_type='image/jpeg'):
     """
     Upload an image to Firebase Storage.
@@ -111,14 +145,46 @@ def upload_image(file_data, image_path, content_type='image/jpeg'):
         if app is None:
             return None  # Firebase not configured
         
-        bucket = storage.bucket()
-        blob = bucket.blob(image_path)
-        
-        blob.upload_from_string(file_data, content_type=content_type)
-        blob.make_public()
+        with firebase_breaker.guard():
+            bucket = _bucket()
+            blob = bucket.blob(image_path)
+            
+            blob.upload_from_string(file_data, content_type=content_type, timeout=FIREBASE_TIMEOUT)
+            blob.make_public(timeout=FIREBASE_TIMEOUT)
         
         return blob.public_url
     except Exception as e:
-        # Silently fail - Firebase not configured
+        # Silently fail - Firebase not configured, unavailable or breaker open
         return None
 
+
+@timed("firebase", "upload")
+def upload_file(local_path, image_path, content_type='image/jpeg'):
+    """
+    Upload a file from disk to Firebase Storage without reading it into memory.
+    
+    Args:
+        local_path: Path of the file on the local filesystem
+        image_path: Path where to store the image (e.g., 'books/isbn123/thumb.webp')
+        content_type: MIME type of the image
+    
+    Returns:
+        Public URL string or None if upload fails
+    """
+    try:
+        app = get_firebase_app()
+        if app is None:
+            return None  # Firebase not configured
+        
+        with firebase_breaker.guard():
+            bucket = _bucket()
+            blob = bucket.blob(image_path)
+            blob.cache_control = 'public, max-age=31536000'
+            
+            blob.upload_from_filename(local_path, content_type=content_type, timeout=FIREBASE_TIMEOUT)
+            blob.make_public(timeout=FIREBASE_TIMEOUT)
+        
+        return blob.public_url
+    except Exception as e:
+        # Silently fail - Firebase not configured, unavailable or breaker open
+        return None
@@ -0,0 +1,51 @@
+"""
+Multi-process entry point for the Flask API.
+
+    gunicorn -c gunicorn.conf.py
+
+Workers and threads come from the environment (.env): GUNICORN_WORKERS
+(default: one per CPU core) and GUNICORN_THREADS (default 4). Each worker
+opens its own Redis and MariaDB connections, so size DB_POOL_SIZE at
+GUNICORN_THREADS or more and keep GUNICORN_WORKERS * DB_POOL_SIZE under
+the server's max_connections.
+
+With preload_app (GUNICORN_PRELOAD=true) the application is imported once
+in the master and the workers share its memory copy-on-write; post_fork
+then rebuilds every client in the child (see lifecycle.py).
+"""
+
+import os
+import sys
+import multiprocessing
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Background threads must start in the workers, never in the forking master
+os.environ["DEFER_BACKGROUND_THREADS"] = "true"
+
+wsgi_app = "main:app"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS") or multiprocessing.cpu_count())
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+preload_app = os.getenv("GUNICORN_PRELOAD", "true").lower() == "true"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "30"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# Recycle workers periodically (0 = never); the jitter keeps them from restarting together
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", "0"))
+accesslog = os.getenv("GUNICORN_ACCESSLOG") or None
+
+
+def post_fork(server, worker):
+    # Without preload the app is imported after this hook, so there is nothing to reset
+    if "main" in sys.modules:
+        import lifecycle
+        lifecycle.after_fork()
+
+
+def post_worker_init(worker):
+    import lifecycle
+    lifecycle.start_background()
@@ -0,0 +1,172 @@
+import os
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from db import get_conn
+from storage_backend import get_storage
+import change_stream
+import catalog_memory
+import snapshots
+
+load_dotenv()
+
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower().replace("jpg", "jpeg")
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_MB", "5")) * 1024 * 1024
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+IMAGE_TMP_DIR = os.getenv("IMAGE_TMP_DIR") or None
+
+CHUNK_SIZE = 64 * 1024
+
+# (variant name, longest side in pixels, column on libros); None keeps the original size
+VARIANTS = (
+    ("original", None, "imagen_url"),
+    ("medium", 600, "imagen_medium_url"),
+    ("thumb", 150, "imagen_thumb_url"),
+)
+
+_ENCODERS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 85, "optimize": True, "progressive": True}),
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class ImageTooLarge(Exception):
+    """Raised when an upload exceeds IMAGE_MAX_BYTES."""
+
+
+def variant_path(isbn, variant):
+    """Return the storage path of an image variant, e.g. 'books/{isbn}/thumb.webp'."""
+    ext = "jpg" if IMAGE_FORMAT == "jpeg" else IMAGE_FORMAT
+    return f"books/{isbn}/{variant}.{ext}"
+
+
+def spool_upload(stream, max_bytes=IMAGE_MAX_BYTES):
+    """Copy a request body stream to a temporary file in fixed-size chunks.
+
+    Returns the temporary file path. The caller owns the file; it is removed
+    by the worker once the variants have been generated.
+    """
+    fd, tmp_path = tempfile.mkstemp(prefix="upload-", dir=IMAGE_TMP_DIR)
+    written = 0
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if written > max_bytes:
+                    raise ImageTooLarge(f"Image exceeds {max_bytes} bytes")
+                tmp.write(chunk)
+        if written == 0:
+            raise ValueError("Empty image body")
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=IMAGE_WORKERS,
+                    thread_name_prefix="image-ingest"
+                )
+    return _executor
+
+
+def reset_after_fork():
+    """Threads do not survive fork; start a fresh pool on the next upload."""
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+def submit_image_job(isbn, tmp_path):
+    """Queue variant generation for an uploaded image."""
+    return _get_executor().submit(process_image, isbn, tmp_path)
+
+
+def queue_depth():
+    """Number of image jobs waiting for a worker."""
+    return _executor._work_queue.qsize() if _executor is not None else 0
+
+
+def _encode_variant(img, size, out_dir, variant):
+    """Resize (if needed) and encode one variant, returning the written file path."""
+    pil_format, _, options = _ENCODERS[IMAGE_FORMAT]
+    if size is not None:
+        img = img.copy()
+        img.thumbnail((size, size))
+    if pil_format == "JPEG" and img.mode != "RGB":
+        img = img.convert("RGB")
+    out_path = os.path.join(out_dir, f"{variant}.{IMAGE_FORMAT}")
+    img.save(out_path, pil_format, **options)
+    return out_path, img
+
+
+def process_image(isbn, tmp_path):
+    """Generate, store and record the image variants for a book.
+
+    Variants are produced from largest to smallest so each resize starts from
+    the previous, already reduced, image.
+    """
+    from PIL import Image, ImageOps
+
+    out_dir = tempfile.mkdtemp(prefix="variants-", dir=IMAGE_TMP_DIR)
+    try:
+        _, content_type, _ = _ENCODERS[IMAGE_FORMAT]
+        with Image.open(tmp_path) as src:
+            img = ImageOps.exif_transpose(src)
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+
+            urls = {}
+            for variant, size, column in VARIANTS:
+                out_path, img = _encode_variant(img, size, out_dir, variant)
+                url = get_storage().put_file(out_path, variant_path(isbn, variant), content_type)
+                if url is None:
+                    print(f"Warning: Could not store {variant} image for ISBN {isbn}")
+                    return None
+                urls[column] = url
+
+        _record_variants(isbn, urls)
+        return urls
+    except Exception as e:
+        print(f"Warning: Image processing failed for ISBN {isbn}: {str(e)}")
+        return None
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+
+def _record_variants(isbn, urls):
+    """Store the variant URLs on the book row."""
+    columns = sorted(urls)
+    conn = get_conn()
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute(
+            f"UPDATE libros SET {', '.join(f'{c} = %s' for c in columns)} WHERE isbn = %s",
+            [urls[c] for c in columns] + [isbn]
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    change_stream.publish("image", isbn)
+    catalog_memory.wake()
+    snapshots.wake()
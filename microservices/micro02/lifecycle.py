@@ -0,0 +1,43 @@
+"""
+Process lifecycle for multi-worker servers (gunicorn.conf.py).
+
+With preload_app the master imports main.py once and forks the workers, so
+each worker inherits the parent's open sockets and locks. after_fork()
+makes every client start over in the child: the Redis pool, the MariaDB
+pool, the Firebase app and the image thread pool. Inherited connections
+are abandoned rather than closed, because closing them would also tear
+down the parent's (and siblings') copies.
+
+Background threads do not survive fork either. gunicorn.conf.py sets
+DEFER_BACKGROUND_THREADS=true so main.py does not start them in the master,
+and each worker calls start_background() once it is initialized.
+"""
+
+import sys
+
+
+def after_fork():
+    """Rebuild the clients this worker inherited from the master. Only touches modules already loaded."""
+    if "auth" in sys.modules:
+        sys.modules["auth"].reset_redis_after_fork()
+    if "db" in sys.modules:
+        sys.modules["db"].reset_after_fork()
+    if "firebase_storage" in sys.modules:
+        sys.modules["firebase_storage"].reset_after_fork()
+    if "image_pipeline" in sys.modules:
+        sys.modules["image_pipeline"].reset_after_fork()
+
+
+def start_background():
+    """Start this process's background threads (dependency probes, replica lag checks, in-memory catalog, snapshots)."""
+    import db
+    import readiness
+    import catalog_memory
+    import snapshots
+
+    readiness.ensure_started()
+    db.ensure_replica_checker()
+    # Load the in-memory catalog (CATALOG_MEMORY=true) before the first request needs it
+    catalog_memory.ensure_started()
+    # Write precompressed full-catalog snapshots (SNAPSHOTS=true)
+    snapshots.ensure_started()
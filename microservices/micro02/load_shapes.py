@@ -0,0 +1,88 @@
+"""
+Load profiles for Locust, selected with LOAD_SHAPE (see locustfile.py).
+
+    LOAD_SHAPE=step  locust -f locustfile.py --headless --host=http://127.0.0.1:5000
+    LOAD_SHAPE=spike locust -f locustfile.py --headless --host=http://127.0.0.1:5000
+    LOAD_SHAPE=soak  locust -f locustfile.py --headless --host=http://127.0.0.1:5000
+
+A shape replaces -u, -r and -t: it decides the user count over time and
+ends the test. Each profile reads its parameters from the environment:
+
+- step: STEP_USERS more users every STEP_SECONDS, STEP_COUNT times, to find
+  where latency starts to climb (the knee)
+- spike: SPIKE_BASE_USERS for SPIKE_WARMUP_SECONDS, a burst to
+  SPIKE_USERS (spawned at SPIKE_SPAWN_RATE) for SPIKE_SECONDS, then back to
+  the base for SPIKE_RECOVERY_SECONDS to check the system recovers
+- soak: ramp to SOAK_USERS over SOAK_RAMP_SECONDS and hold for
+  SOAK_SECONDS, to surface leaks and slow degradation
+"""
+
+import os
+from locust import LoadTestShape
+
+
+def _env(name, default):
+    return float(os.getenv(name, default))
+
+
+class StepLoadShape(LoadTestShape):
+    """Increase the user count in equal steps, then stop."""
+
+    def __init__(self):
+        super().__init__()
+        self.step_users = int(_env("STEP_USERS", "10"))
+        self.step_seconds = _env("STEP_SECONDS", "60")
+        self.step_count = int(_env("STEP_COUNT", "10"))
+        self.spawn_rate = _env("STEP_SPAWN_RATE", str(self.step_users))
+
+    def tick(self):
+        step = int(self.get_run_time() // self.step_seconds)
+        if step >= self.step_count:
+            return None
+        return (step + 1) * self.step_users, self.spawn_rate
+
+
+class SpikeLoadShape(LoadTestShape):
+    """Steady base load, a sudden burst, then the base load again."""
+
+    def __init__(self):
+        super().__init__()
+        self.base_users = int(_env("SPIKE_BASE_USERS", "10"))
+        self.spike_users = int(_env("SPIKE_USERS", "200"))
+        self.warmup = _env("SPIKE_WARMUP_SECONDS", "60")
+        self.spike = _env("SPIKE_SECONDS", "30")
+        self.recovery = _env("SPIKE_RECOVERY_SECONDS", "120")
+        self.spawn_rate = _env("SPIKE_SPAWN_RATE", "100")
+
+    def tick(self):
+        run_time = self.get_run_time()
+        if run_time < self.warmup:
+            return self.base_users, self.base_users
+        if run_time < self.warmup + self.spike:
+            return self.spike_users, self.spawn_rate
+        if run_time < self.warmup + self.spike + self.recovery:
+            # Stop the spike users as fast as they were started
+            return self.base_users, self.spawn_rate
+        return None
+
+
+class SoakLoadShape(LoadTestShape):
+    """Ramp up once and hold a constant load for a long time."""
+
+    def __init__(self):
+        super().__init__()
+        self.users = int(_env("SOAK_USERS", "50"))
+        self.ramp = _env("SOAK_RAMP_SECONDS", "300")
+        self.duration = _env("SOAK_SECONDS", "14400")
+
+    def tick(self):
+        if self.get_run_time() >= self.ramp + self.duration:
+            return None
+        return self.users, self.users / self.ramp if self.ramp > 0 else self.users
+
+
+SHAPES = {
+    "step": StepLoadShape,
+    "spike": SpikeLoadShape,
+    "soak": SoakLoadShape,
+}
@@ -2,15 +2,331 @@
 Locust load testing configuration for Books API
 Run with: locust -f locustfile.py --host=http://127.0.0.1:5000
 Access web UI at: http://localhost:8089
+
+With pre-provisioned accounts (see provision_users.py):
+    locust -f locustfile.py --host=http://127.0.0.1:5000 --user-pool users.csv
+
+Step, spike or soak profile instead of a constant user count (see load_shapes.py),
+failing the run when an objective in slo.json is missed (see slo.py):
+    LOAD_SHAPE=step locust -f locustfile.py --host=http://127.0.0.1:5000 --headless --slo slo.json
+
+Cheaper client (FastHttpUser), one master and a worker per CPU core (see run_distributed.py):
+    python run_distributed.py --fast --host=http://127.0.0.1:5000 -u 2000 -r 100 -t 5m
 """
 
-from locust import HttpUser, task, between
+from locust import HttpUser, FastHttpUser, task, tag, between, events
+from locust.runners import MasterRunner, WorkerRunner
+from xml.etree.ElementTree import XMLPullParser, ParseError
 import random
 import string
 import json
+import csv
+import re
+import time
+import base64
+import itertools
+import os
+import seed_catalog
+import load_shapes
+import slo
+
+
+# Token returned by /api/books/changes for the next incremental sync
+SYNC_TOKEN_RE = re.compile(r"<token>([^<]+)</token>")
+
+# Renew the access token this many seconds before it expires
+TOKEN_REFRESH_MARGIN = 30
+
+
+# Pre-provisioned accounts (provision_users.py) loaded from --user-pool.
+# Without a pool every simulated user registers a new account.
+user_pool = None
+
+# Size of the synthetic catalog (--seed-books); ISBN lookups sample from it
+seeded_books = 0
+
+# Objectives checked when the run ends (--slo)
+slo_spec = None
+
+# HTTP client of every user class: python-requests by default, or geventhttpclient
+# (FastHttpUser) with LOCUST_CLIENT=fast, which needs several times less CPU per
+# request so one load generator process can drive much more traffic
+ClientUser = FastHttpUser if os.getenv("LOCUST_CLIENT", "requests").lower() == "fast" else HttpUser
+
+# Load profile chosen with LOAD_SHAPE=step|spike|soak; Locust runs any shape class defined here
+if os.getenv("LOAD_SHAPE"):
+    LoadShape = load_shapes.SHAPES[os.getenv("LOAD_SHAPE")]
+
+
+def xml_has_root(body, root):
+    """Cheap check that `body` (bytes) is a complete XML document whose root element is `root`.
+
+    Only the prolog and the first start tag are parsed, and the end of the body
+    is compared with the closing tag, so validating a large catalog costs the
+    same as validating a single book.
+    """
+    parser = XMLPullParser(events=("start",))
+    try:
+        # The root tag sits within the first few hundred bytes
+        parser.feed(body[:512])
+        for _, element in parser.read_events():
+            if element.tag != root:
+                return False
+            end = body.rstrip()
+            return end.endswith(f"</{root}>".encode()) or end.endswith(b"/>")
+    except ParseError:
+        pass
+    return False
+
+
+def token_expiry(token):
+    """Return the `exp` claim of a JWT (epoch seconds), or None if it cannot be read."""
+    try:
+        payload = token.split(".")[1]
+        return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))["exp"]
+    except (AttributeError, IndexError, KeyError, ValueError):
+        return None
+
+
+@events.init_command_line_parser.add_listener
+def _add_user_pool_args(parser):
+    parser.add_argument(
+        "--user-pool", type=str, default="", env_var="LOCUST_USER_POOL",
+        help="CSV of username,password written by provision_users.py; simulated users log in with these accounts"
+    )
+
+
+@events.init_command_line_parser.add_listener
+def _add_seed_args(parser):
+    parser.add_argument(
+        "--seed-books", type=int, default=0, env_var="LOCUST_SEED_BOOKS",
+        help="Bulk-load this many synthetic books (seed_catalog.py) before the test; ISBN lookups sample from them"
+    )
+    parser.add_argument(
+        "--skip-seeding", action="store_true", default=False,
+        help="The catalog is already seeded (e.g. from another machine); only sample ISBNs from it"
+    )
+
+
+@events.init.add_listener
+def _read_seed_size(environment, **kwargs):
+    global seeded_books
+    if environment.parsed_options:
+        seeded_books = environment.parsed_options.seed_books
+
+
+@events.test_start.add_listener
+def _seed_catalog(environment, **kwargs):
+    # Seed once, from the master (or the single local process); needs the DB settings in .env
+    options = environment.parsed_options
+    if not seeded_books or options.skip_seeding or isinstance(environment.runner, WorkerRunner):
+        return
+    print(f"Seeding catalog up to {seeded_books} books ...")
+    inserted = seed_catalog.seed(seeded_books)
+    print(f"Seeding done ({inserted} new books)")
+
+
+@events.init_command_line_parser.add_listener
+def _add_slo_args(parser):
+    parser.add_argument(
+        "--slo", type=str, default="", env_var="LOCUST_SLO",
+        help="JSON file of per-request objectives (p95_ms, failure_rate, ...); the exit code is 1 if any is missed"
+    )
+
+
+@events.init.add_listener
+def _load_slo(environment, **kwargs):
+    global slo_spec
+    path = getattr(environment.parsed_options, "slo", "") if environment.parsed_options else ""
+    if path:
+        # Fail at startup, not after a long run, if the file is invalid
+        slo_spec = slo.load(path)
+
+
+@events.quitting.add_listener
+def _check_slo(environment, **kwargs):
+    # Workers only hold their own share of the statistics; the master judges the totals
+    if slo_spec is None or isinstance(environment.runner, WorkerRunner):
+        return
+    met = slo.report(slo.evaluate(slo_spec, environment.stats))
+    # With objectives defined they decide the exit code, including tolerated failures
+    environment.process_exit_code = 0 if met else 1
+
+
+@events.init.add_listener
+def _load_user_pool(environment, **kwargs):
+    global user_pool
+    path = getattr(environment.parsed_options, "user_pool", "") if environment.parsed_options else ""
+    if not path:
+        return
+    with open(path, newline="") as f:
+        accounts = list(csv.DictReader(f))
+    if not accounts:
+        raise ValueError(f"User pool {path} is empty")
+    # Each worker walks the pool in its own order so accounts are spread across the cluster
+    random.Random(getattr(environment.runner, "worker_index", 0)).shuffle(accounts)
+    user_pool = itertools.cycle(accounts)
+    print(f"Using {len(accounts)} pre-provisioned accounts from {path}")
+
+
+# Server-side phase breakdown (requires SERVER_TIMING=true on the server):
+# auth (token allowlist/blocklist), redis (other Redis calls), db, serialize, storage.
+# Durations are bucketed like Locust's own response times so memory stays
+# bounded: {request name: {phase: {rounded ms: count}}}
+server_timings = {}
+
+
+def _bucket_ms(value):
+    """Round a duration in ms to 0.1 ms below 10 ms, 1 ms below 100 ms, 10 ms above."""
+    if value < 10:
+        return round(value, 1)
+    if value < 100:
+        return round(value)
+    return round(value, -1)
+
+
+def parse_server_timing(header):
+    """Parse 'auth;dur=1.2, db;dur=3.4' into {'auth': 1.2, 'db': 3.4}."""
+    phases = {}
+    for entry in header.split(","):
+        parts = entry.strip().split(";")
+        for param in parts[1:]:
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                try:
+                    phases[parts[0].strip()] = float(value)
+                except ValueError:
+                    pass
+    return phases
+
+
+def timing_percentile(buckets, percent):
+    """Return the value at `percent` (0-1) from a {value: count} histogram."""
+    total = sum(buckets.values())
+    target = total * percent
+    seen = 0
+    for value in sorted(buckets):
+        seen += buckets[value]
+        if seen >= target:
+            return value
+    return 0
+
+
+def server_timing_rows():
+    """Yield (name, phase, count, p50, p90, p95, p99, max) rows."""
+    for name in sorted(server_timings):
+        for phase in sorted(server_timings[name]):
+            buckets = server_timings[name][phase]
+            yield (
+                name, phase, sum(buckets.values()),
+                timing_percentile(buckets, 0.50), timing_percentile(buckets, 0.90),
+                timing_percentile(buckets, 0.95), timing_percentile(buckets, 0.99),
+                max(buckets)
+            )
+
+
+@events.init_command_line_parser.add_listener
+def _add_server_timing_args(parser):
+    parser.add_argument(
+        "--server-timing-csv", type=str, default="",
+        help="Write per-phase Server-Timing percentiles to this CSV file"
+    )
+
+
+@events.request.add_listener
+def collect_server_timing(name, response=None, **kwargs):
+    # FastHttpUser responses have no headers when the connection failed
+    headers = response.headers if response is not None else None
+    header = headers.get("Server-Timing") if headers else None
+    if not header:
+        return
+    by_phase = server_timings.setdefault(name, {})
+    for phase, duration in parse_server_timing(header).items():
+        buckets = by_phase.setdefault(phase, {})
+        key = _bucket_ms(duration)
+        buckets[key] = buckets.get(key, 0) + 1
 
 
-class BooksAPIUser(HttpUser):
+# Requests reported by each worker, printed by the master at the end: {client id: count}
+worker_requests = {}
+
+
+@events.report_to_master.add_listener
+def _send_server_timing(client_id, data):
+    # Workers ship what they collected since the last report (every few seconds) and start over
+    global server_timings
+    data["server_timings"] = server_timings
+    server_timings = {}
+
+
+@events.worker_report.add_listener
+def _merge_worker_report(client_id, data):
+    worker_requests[client_id] = worker_requests.get(client_id, 0) + data["stats_total"]["num_requests"]
+    for name, phases in data.get("server_timings", {}).items():
+        by_phase = server_timings.setdefault(name, {})
+        for phase, worker_buckets in phases.items():
+            buckets = by_phase.setdefault(phase, {})
+            for key, count in worker_buckets.items():
+                buckets[key] = buckets.get(key, 0) + count
+
+
+@events.init.add_listener
+def _register_server_timing_page(environment, **kwargs):
+    if environment.web_ui is None:
+        return
+
+    @environment.web_ui.app.route("/server-timing")
+    def server_timing_page():
+        rows = "".join(
+            "<tr>" + "".join(f"<td>{v}</td>" for v in row) + "</tr>"
+            for row in server_timing_rows()
+        )
+        return (
+            "<table border='1' cellpadding='4'><tr><th>Name</th><th>Phase</th><th>Count</th>"
+            "<th>p50 ms</th><th>p90 ms</th><th>p95 ms</th><th>p99 ms</th><th>max ms</th></tr>"
+            f"{rows}</table>"
+        )
+
+
+@events.test_stop.add_listener
+def _report_server_timing_local(environment, **kwargs):
+    # Workers send their samples to the master, whose last reports arrive after test_stop
+    if not isinstance(environment.runner, (MasterRunner, WorkerRunner)):
+        report_server_timing(environment)
+
+
+@events.quitting.add_listener
+def _report_workers(environment, **kwargs):
+    if not isinstance(environment.runner, MasterRunner) or not worker_requests:
+        return
+    total = sum(worker_requests.values()) or 1
+    print()
+    print("Requests per worker")
+    for client_id, count in sorted(worker_requests.items()):
+        print(f"{client_id:<48} {count:>9} {count / total:>7.1%}")
+    report_server_timing(environment)
+
+
+def report_server_timing(environment):
+    rows = list(server_timing_rows())
+    if not rows:
+        return
+
+    print()
+    print("Server-Timing breakdown (ms)")
+    print(f"{'Name':<32} {'Phase':<10} {'Count':>7} {'p50':>8} {'p90':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for name, phase, count, p50, p90, p95, p99, peak in rows:
+        print(f"{name[:32]:<32} {phase:<10} {count:>7} {p50:>8} {p90:>8} {p95:>8} {p99:>8} {peak:>8}")
+
+    path = getattr(environment.parsed_options, "server_timing_csv", "") if environment.parsed_options else ""
+    if path:
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Name", "Phase", "Count", "p50", "p90", "p95", "p99", "max"])
+            writer.writerows(rows)
+
+
+class BooksAPIUser(ClientUser):
     """Simulates a user interacting with the Books API."""
     
     wait_time = between(1, 3)  # Wait between 1 and 3 seconds between tasks
@@ -18,83 +334,166 @@ class BooksAPIUser(HttpUser):
     def on_start(self):
         """Called when a simulated user starts. Performs login."""
         self.access_token = None
+        self.access_expires = None
         self.refresh_token = None
         self.username = None
+        self.password = None
         self.test_isbn = None
+        self.sync_token = None
         
-        # Register and login
-        self.register_and_login()
+        if user_pool is not None:
+            # Reuse a pre-provisioned account
+            account = next(user_pool)
+            self.username = account["username"]
+            self.password = account["password"]
+            self.login()
+        else:
+            # Register and login
+            self.register_and_login()
     
     def register_and_login(self):
         """Register a new user and login."""
         # Generate random username
         self.username = f"testuser_{''.join(random.choices(string.ascii_lowercase + string.digits, k=8))}"
-        password = "testpass123"
+        self.password = "testpass123"
         
         # Register
         register_response = self.client.post(
             "/auth/register",
-            json={"username": self.username, "password": password},
+            json={"username": self.username, "password": self.password},
             name="Register User"
         )
         
         if register_response.status_code in [201, 409]:  # Created or already exists
-            # Login
-            login_response = self.client.post(
-                "/auth/login",
-                json={"username": self.username, "password": password},
-                name="Login"
+            self.login()
+    
+    def login(self):
+        """Login and keep both tokens."""
+        login_response = self.client.post(
+            "/auth/login",
+            json={"username": self.username, "password": self.password},
+            name="Login"
+        )
+        
+        if login_response.status_code == 200:
+            data = login_response.json()
+            self.set_access_token(data.get("access_token"))
+            self.refresh_token = data.get("refresh_token")
+    
+    def set_access_token(self, token):
+        self.access_token = token
+        self.access_expires = token_expiry(token)
+    
+    def renew_access_token(self):
+        """Get a new access token with the refresh token, or log in again if that is rejected."""
+        if self.refresh_token:
+            response = self.client.post(
+                "/auth/refresh",
+                headers={"Authorization": f"Bearer {self.refresh_token}"},
+                name="Refresh Token"
             )
-            
-            if login_response.status_code == 200:
-                data = login_response.json()
-                self.access_token = data.get("access_token")
-                self.refresh_token = data.get("refresh_token")
+            if response.status_code == 200:
+                self.set_access_token(response.json().get("access_token"))
+                return
+        if self.password:
+            self.login()
     
+    def auth_headers(self):
+        """Authorization header, renewing the access token shortly before it expires."""
+        if self.access_expires and self.access_expires - time.time() < TOKEN_REFRESH_MARGIN:
+            self.renew_access_token()
+        return {"Authorization": f"Bearer {self.access_token}"}
+    
+    def api(self, method, path, name, xml_root=None, **kwargs):
+        """Authenticated request; on 401 renew the access token and retry once.
+        
+        With `xml_root`, a 200 response that is not a complete XML document with
+        that root element is recorded as a failure.
+        """
+        response = self.send(method, path, name, xml_root, **kwargs)
+        if response.status_code == 401:
+            self.renew_access_token()
+            response = self.send(method, path, name, xml_root, **kwargs)
+        return response
+    
+    def send(self, method, path, name, xml_root, **kwargs):
+        with self.client.request(
+            method, path, headers=self.auth_headers(), name=name, catch_response=True, **kwargs
+        ) as response:
+            if xml_root and response.status_code == 200 and not xml_has_root(response.content, xml_root):
+                response.failure(f"Response is not a complete <{xml_root}> document")
+        return response
+    
+    @tag("catalog")
     @task(3)
     def get_all_books(self):
         """Get all books - most common operation."""
         if self.access_token:
-            self.client.get(
-                "/api/books",
-                headers={"Authorization": f"Bearer {self.access_token}"},
-                name="Get All Books"
-            )
+            self.api("GET", "/api/books", "Get All Books", xml_root="libros")
     
+    @tag("catalog")
     @task(2)
     def get_book_by_isbn(self):
-        """Get a book by ISBN."""
-        if self.access_token and self.test_isbn:
-            self.client.get(
-                f"/api/books/ISBN?isbn={self.test_isbn}",
-                headers={"Authorization": f"Bearer {self.access_token}"},
-                name="Get Book by ISBN"
-            )
+        """Get a book by ISBN - a seeded one if the catalog was seeded, else this user's last book."""
+        isbn = seed_catalog.isbn_for(random.randrange(seeded_books)) if seeded_books else self.test_isbn
+        if self.access_token and isbn:
+            self.api("GET", f"/api/books/ISBN?isbn={isbn}", "Get Book by ISBN", xml_root="libros")
     
+    @tag("catalog")
     @task(2)
     def get_books_by_format(self):
         """Get books by format."""
         if self.access_token:
             formats = ["Físico", "Digital", "Audiolibro"]
             format_type = random.choice(formats)
-            self.client.get(
-                f"/api/books/format/?format={format_type}",
-                headers={"Authorization": f"Bearer {self.access_token}"},
-                name="Get Books by Format"
-            )
+            self.api("GET", f"/api/books/format/?format={format_type}", "Get Books by Format", xml_root="libros")
     
+    @tag("catalog")
     @task(1)
     def get_books_by_author(self):
         """Get books by author."""
         if self.access_token:
             authors = ["García", "Martínez", "López", "González", "Pérez"]
             author = random.choice(authors)
-            self.client.get(
-                f"/api/books/autor/?name={author}",
-                headers={"Authorization": f"Bearer {self.access_token}"},
-                name="Get Books by Author"
+            self.api("GET", f"/api/books/autor/?name={author}", "Get Books by Author", xml_root="libros")
+    
+    @tag("catalog")
+    @task(1)
+    def search_books(self):
+        """Combined search - format and price range sorted by price, first page."""
+        if self.access_token:
+            format_type = random.choice(["Físico", "Digital", "Audiolibro"])
+            min_price = random.choice([0, 10, 20, 50])
+            self.api(
+                "GET",
+                f"/api/books/search?format={format_type}&min_price={min_price}&sort=precio&limit=20",
+                "Search Books",
+                xml_root="libros"
             )
     
+    @task(1)
+    def sync_changes(self):
+        """Incremental sync - full catalog the first time, then only changes."""
+        if self.access_token:
+            path = "/api/books/changes"
+            if self.sync_token:
+                path += f"?since={self.sync_token}"
+            with self.client.get(
+                path,
+                headers=self.auth_headers(),
+                name="Sync Changes" if self.sync_token else "Sync Full",
+                catch_response=True
+            ) as response:
+                if response.status_code == 401:
+                    self.renew_access_token()
+                elif response.status_code == 200:
+                    match = SYNC_TOKEN_RE.search(response.text)
+                    self.sync_token = match.group(1) if match else None
+                elif response.status_code == 410:
+                    # Token expired: next call does a full sync
+                    self.sync_token = None
+                    response.success()
+    
     @task(1)
     def create_book(self):
         """Create a new book."""
@@ -112,12 +511,7 @@ class BooksAPIUser(HttpUser):
                 "descripcion": "Libro creado durante prueba de carga"
             }
             
-            response = self.client.post(
-                "/api/books/create",
-                json=book_data,
-                headers={"Authorization": f"Bearer {self.access_token}"},
-                name="Create Book"
-            )
+            response = self.api("POST", "/api/books/create", "Create Book", json=book_data)
             
             # If successful, we can use this ISBN for other operations
             if response.status_code == 201:
@@ -133,12 +527,7 @@ class BooksAPIUser(HttpUser):
                 "precio": round(random.uniform(10.0, 100.0), 2)
             }
             
-            self.client.put(
-                "/api/books/update",
-                json=update_data,
-                headers={"Authorization": f"Bearer {self.access_token}"},
-                name="Update Book"
-            )
+            self.api("PUT", "/api/books/update", "Update Book", json=update_data)
     
     @task(1)
     def delete_book(self):
@@ -146,25 +535,23 @@ class BooksAPIUser(HttpUser):
         if self.access_token and self.test_isbn:
             # Only delete occasionally to avoid deleting all test books
             if random.random() < 0.1:  # 10% chance
-                self.client.delete(
-                    f"/api/books/delete?isbn={self.test_isbn}",
-                    headers={"Authorization": f"Bearer {self.access_token}"},
-                    name="Delete Book"
-                )
+                self.api("DELETE", f"/api/books/delete?isbn={self.test_isbn}", "Delete Book")
                 self.test_isbn = None  # Clear ISBN after deletion
     
     @task(1)
     def refresh_token(self):
         """Refresh access token."""
         if self.refresh_token:
-            self.client.post(
+            response = self.client.post(
                 "/auth/refresh",
                 headers={"Authorization": f"Bearer {self.refresh_token}"},
                 name="Refresh Token"
             )
+            if response.status_code == 200:
+                self.set_access_token(response.json().get("access_token"))
 
 
-class UnauthenticatedUser(HttpUser):
+class UnauthenticatedUser(ClientUser):
     """Simulates unauthenticated requests (should fail)."""
     
     wait_time = between(2, 5)
@@ -1,11 +1,19 @@
-from flask import Flask
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
-from flasgger import Swagger
 import os
 from dotenv import load_dotenv
 from auth import bp as auth_bp, check_if_token_revoked
 from books import bp as books_bp
+from media import bp as media_bp
+from apispec_cache import register_cached_apispec
+import metrics
+import profiler
+import readiness
+import lifecycle
+from admin import bp as admin_bp
+from breaker import DependencyUnavailable
+from xml_utils import create_error_xml
 
 # Load environment variables
 load_dotenv()
@@ -18,12 +26,21 @@ app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET', 'your-secret-key')
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = int(os.getenv('JWT_ACCESS_MIN', 15)) * 60  # Convert to seconds
 app.config['JWT_REFRESH_TOKEN_EXPIRES'] = int(os.getenv('JWT_REFRESH_DAYS', 30)) * 24 * 60 * 60  # Convert to seconds
 
+# Let a fronting web server transfer local media files (X-Sendfile)
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', 'false').lower() == 'true'
+
 # Initialize JWT
 jwt = JWTManager(app)
 
+# Request and dependency metrics on /metrics
+metrics.init_app(app)
+
+# Opt-in per-request sampling profiler (signed X-Profile header or /admin/profile)
+profiler.init_app(app)
+
 # Configure CORS
 cors_origins = os.getenv('CORS_ORIGINS', 'http://127.0.0.1:8080,http://localhost:8080').split(',')
-CORS(app, origins=cors_origins, supports_credentials=True)
+CORS(app, origins=cors_origins, supports_credentials=True, expose_headers=['X-Next-Cursor'])
 
 # JWT blocklist loader
 @jwt.token_in_blocklist_loader
@@ -31,6 +48,10 @@ def check_if_token_in_blocklist(jwt_header, jwt_payload):
     return check_if_token_revoked(jwt_header, jwt_payload)
 
 # Configure Swagger
+# Set SWAGGER_UI=false to skip importing Flasgger; /apispec.json is then served
+# only from the prebuilt file (python apispec_cache.py)
+SWAGGER_UI = os.getenv('SWAGGER_UI', 'true').lower() == 'true'
+
 swagger_config = {
     "headers": [],
     "specs": [
@@ -78,11 +99,31 @@ swagger_template = {
     ]
 }
 
-swagger = Swagger(app, config=swagger_config, template=swagger_template)
+swagger = None
+if SWAGGER_UI:
+    from flasgger import Swagger
+    swagger = Swagger(app, config=swagger_config, template=swagger_template)
 
 # Register blueprints
 app.register_blueprint(auth_bp, url_prefix='/auth')
 app.register_blueprint(books_bp, url_prefix='/api')
+app.register_blueprint(media_bp, url_prefix='/media')
+app.register_blueprint(admin_bp, url_prefix='/admin')
+
+# Fail fast with 503 when a dependency is down or its circuit breaker is open
+@app.errorhandler(DependencyUnavailable)
+def dependency_unavailable(e):
+    message = f'Service temporarily unavailable: {e}'
+    if request.blueprint == 'auth':
+        response = jsonify({'error': message})
+    else:
+        response = Response(create_error_xml(message), mimetype='application/xml')
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+# Serve the OpenAPI spec as a cached payload with an ETag
+register_cached_apispec(app, (lambda: swagger.get_apispecs('apispec')) if swagger else None)
 
 @app.route('/')
 def health_check():
@@ -92,10 +133,21 @@ def health_check():
 def health():
     return {'status': 'healthy'}
 
+@app.route('/ready')
+def ready():
+    """Readiness for load balancers: 503 when a dependency is down or the node is saturated."""
+    report = readiness.report()
+    return report, 200 if report['status'] == 'ready' else 503
+
 @app.route('/ping')
 def ping():
     return {'status': 'pong', 'message': 'Server is alive'}
 
+# Start the background threads (readiness probes, in-memory catalog, snapshots).
+# Under gunicorn (gunicorn.conf.py) each worker starts its own after the fork instead.
+if os.getenv('DEFER_BACKGROUND_THREADS', 'false').lower() != 'true':
+    lifecycle.start_background()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
 
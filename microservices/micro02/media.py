@@ -0,0 +1,34 @@
+from flask import Blueprint, Response, send_file
+from storage_backend import get_storage, LocalStorageBackend
+from xml_utils import create_error_xml
+
+bp = Blueprint("media", __name__)
+
+@bp.route('/<path:path>', methods=['GET'])
+def get_media(path):
+    """Serve an image stored by the local storage backend.
+
+    The blob is handed to the WSGI server as a file, so servers with
+    `wsgi.file_wrapper` support (gunicorn, uWSGI) send it with sendfile.
+    Set USE_X_SENDFILE to delegate the transfer to a fronting nginx/Apache.
+    """
+    storage = get_storage()
+    resolved = None
+    if isinstance(storage, LocalStorageBackend):
+        try:
+            resolved = storage.resolve(path)
+        except ValueError:
+            resolved = None
+
+    if resolved is None:
+        error_xml = create_error_xml("Image not found")
+        return Response(error_xml, mimetype='application/xml'), 404
+
+    blob_path, content_type, digest = resolved
+    return send_file(
+        blob_path,
+        mimetype=content_type,
+        etag=digest,
+        conditional=True,
+        max_age=31536000
+    )
@@ -0,0 +1,263 @@
+"""
+In-process Prometheus metrics.
+
+Tracks per-route request counts, latency histograms and in-flight gauges, plus
+the time spent in each dependency (MariaDB, Redis, XML serialization and
+Firebase). Exposed in the Prometheus text format on /metrics.
+
+Metrics are kept per process; with several workers, scrape each one or label
+them by instance in Prometheus.
+
+With SERVER_TIMING=true each response also carries a Server-Timing header
+with the time the request spent in each phase (auth, redis, db, serialize,
+storage).
+"""
+
+import os
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from flask import Response, g, has_request_context, request
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "false").lower() == "true"
+
+# Dependency -> Server-Timing phase name. Redis time inside phase("auth") (the
+# JWT allowlist/blocklist check) is reported as "auth"; "redis" covers the rest
+# (coalescing locks, change events, read stickiness)
+PHASES = {
+    "redis": "redis",
+    "mariadb": "db",
+    "xml": "serialize",
+    "firebase": "storage",
+}
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    def set(self, value, *labelvalues):
+        with self._lock:
+            self._values[labelvalues] = value
+
+    def get(self, *labelvalues):
+        return self._values.get(labelvalues, 0)
+
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # per-bucket (non-cumulative) counts + overflow, then sum
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        for labelvalues, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, ("le", _format_value(float(bound))))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route, method and status.",
+    ("method", "endpoint", "status")
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.",
+    ("method", "endpoint")
+)
+IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Requests currently being served by route.",
+    ("endpoint",)
+)
+DEPENDENCY_LATENCY = Histogram(
+    "dependency_duration_seconds", "Time spent in MariaDB, Redis, XML serialization and Firebase.",
+    ("dependency", "operation")
+)
+DEPENDENCY_ERRORS = Counter(
+    "dependency_errors_total", "Failed dependency calls.",
+    ("dependency", "operation")
+)
+
+
+@contextmanager
+def track(dependency, operation):
+    """Time a block of work against a dependency."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        DEPENDENCY_ERRORS.inc(dependency, operation)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        DEPENDENCY_LATENCY.observe(elapsed, dependency, operation)
+        if SERVER_TIMING and has_request_context():
+            phases = g.get("_phases")
+            if phases is not None:
+                phase = g.get("_phase") or PHASES.get(dependency, dependency)
+                phases[phase] = phases.get(phase, 0.0) + elapsed
+
+
+@contextmanager
+def phase(name):
+    """Report the dependency time of a block under Server-Timing phase `name`."""
+    if not (SERVER_TIMING and has_request_context()):
+        yield
+        return
+    previous = g.get("_phase")
+    g._phase = name
+    try:
+        yield
+    finally:
+        g._phase = previous
+
+
+def timed(dependency, operation):
+    """Decorator form of track()."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with track(dependency, operation):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def server_timing_header(phases, total):
+    """Format phase durations (seconds) as a Server-Timing header value in milliseconds."""
+    entries = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in phases.items()]
+    entries.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(entries)
+
+
+def _endpoint_label():
+    rule = request.url_rule
+    return rule.rule if rule is not None else "unmatched"
+
+
+def init_app(app):
+    """Register request instrumentation and the /metrics route on a Flask app."""
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+        g._metrics_endpoint = _endpoint_label()
+        IN_FLIGHT.inc(g._metrics_endpoint)
+        if SERVER_TIMING:
+            g._phases = {}
+
+    @app.after_request
+    def _record_request(response):
+        start = g.get("_metrics_start")
+        if start is not None:
+            elapsed = time.perf_counter() - start
+            endpoint = g._metrics_endpoint
+            REQUEST_LATENCY.observe(elapsed, request.method, endpoint)
+            REQUESTS.inc(request.method, endpoint, str(response.status_code))
+            if SERVER_TIMING:
+                response.headers["Server-Timing"] = server_timing_header(g.get("_phases", {}), elapsed)
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        endpoint = g.pop("_metrics_endpoint", None)
+        if endpoint is not None:
+            IN_FLIGHT.dec(endpoint)
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
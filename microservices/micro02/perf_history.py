@@ -0,0 +1,410 @@
+"""
+Keep the results of Locust runs in a local SQLite history and compare runs.
+
+Each ingested run is keyed by git commit and scenario (a name for the test
+setup: users, spawn rate, user classes, data size...). Only compare runs of
+the same scenario.
+
+Sources:
+- the output of `locust ... --headless --json` (preferred): it carries every
+  endpoint's full response-time histogram and requests per second, so the
+  comparison tests the real distributions
+- a Locust stats CSV (`--csv run` writes run_stats.csv): only percentiles
+  are available, so the test uses a histogram rebuilt from them and its
+  p-values are approximate (marked with ~)
+
+compare prints p50, p95, p99 and RPS per endpoint, base -> candidate. An
+endpoint is flagged when a one-sided Mann-Whitney U test says the candidate
+is slower (p < --alpha) and p50, p95 or p99 grew by at least --threshold.
+The threshold matters because requests within a run are not independent and
+large runs make tiny differences "significant". RPS drops are flagged the
+same way from the per-second request counts (JSON sources only). The exit
+code is 1 if anything was flagged, so the comparison can gate CI.
+
+Run with:
+    locust -f locustfile.py --host=http://127.0.0.1:5000 --headless -u 50 -r 10 -t 2m --json --skip-log > run.json
+    python perf_history.py ingest run.json --scenario catalog-50u
+    python perf_history.py ingest compare_results/sync_stats.csv --scenario sync-100u --note "pool 20"
+    python perf_history.py list --scenario catalog-50u
+    python perf_history.py compare --scenario catalog-50u            # latest run against the one before
+    python perf_history.py compare 12 a1b2c3d --scenario catalog-50u  # run id or commit prefix
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import sqlite3
+import subprocess
+import sys
+import time
+
+DEFAULT_DB = os.getenv("PERF_HISTORY_DB", "perf_history.db")
+TOTAL_NAME = "Aggregated"
+
+# Percentile columns of Locust's stats CSV
+CSV_PERCENTILES = (
+    (0.50, "50%"), (0.66, "66%"), (0.75, "75%"), (0.80, "80%"), (0.90, "90%"), (0.95, "95%"),
+    (0.98, "98%"), (0.99, "99%"), (0.999, "99.9%"), (0.9999, "99.99%"), (1.0, "100%"),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at TEXT NOT NULL,
+    git_commit TEXT NOT NULL,
+    scenario TEXT NOT NULL,
+    source TEXT NOT NULL,
+    note TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_scenario ON runs (scenario, id);
+CREATE TABLE IF NOT EXISTS endpoints (
+    run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+    method TEXT NOT NULL,
+    name TEXT NOT NULL,
+    requests INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    rps REAL NOT NULL,
+    avg_ms REAL NOT NULL,
+    p50_ms REAL NOT NULL,
+    p95_ms REAL NOT NULL,
+    p99_ms REAL NOT NULL,
+    max_ms REAL NOT NULL,
+    response_times TEXT NOT NULL,  -- JSON [[ms, count], ...]
+    reqs_per_sec TEXT,             -- JSON [count, ...] per second, NULL for CSV sources
+    exact INTEGER NOT NULL,        -- 0 when response_times was rebuilt from percentiles
+    PRIMARY KEY (run_id, method, name)
+);
+"""
+
+
+def connect(path=DEFAULT_DB):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def current_commit():
+    """Short hash of HEAD, with -dirty if the working tree has changes; "unknown" outside git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short=12", "HEAD"],
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return commit + "-dirty" if dirty else commit
+
+
+def percentile(histogram, percent):
+    """Response time below which `percent` (0-1) of the requests finished, computed like Locust."""
+    total = sum(histogram.values())
+    processed = 0
+    for value in sorted(histogram, reverse=True):
+        processed += histogram[value]
+        if total - processed <= int(total * percent):
+            return value
+    return 0
+
+
+def _entry(method, name, requests, failures, rps, avg_ms, max_ms, histogram, reqs_per_sec, exact):
+    return {
+        "method": method, "name": name, "requests": requests, "failures": failures, "rps": rps,
+        "avg_ms": avg_ms, "max_ms": max_ms,
+        "p50_ms": percentile(histogram, 0.50), "p95_ms": percentile(histogram, 0.95),
+        "p99_ms": percentile(histogram, 0.99),
+        "histogram": histogram, "reqs_per_sec": reqs_per_sec, "exact": exact,
+    }
+
+
+def _per_second(counts):
+    """Requests in each whole second of the run; the first and last seconds are partial and dropped."""
+    if not counts:
+        return []
+    first, last = min(counts), max(counts)
+    return [counts.get(second, 0) for second in range(first + 1, last)]
+
+
+def parse_json(text):
+    """Endpoints from `locust --json` output. Other output printed before the JSON is skipped."""
+    decoder = json.JSONDecoder()
+    for match in re.finditer(r"^\[", text, re.MULTILINE):
+        try:
+            stats, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if isinstance(stats, list) and all(isinstance(s, dict) and "response_times" in s for s in stats):
+            break
+    else:
+        raise ValueError("no Locust JSON statistics found")
+    if not stats:
+        raise ValueError("the run made no requests")
+
+    start = min(s["start_time"] for s in stats)
+    end = max(s["last_request_timestamp"] or s["start_time"] for s in stats)
+    duration = end - start
+    total_histogram, total_seconds = {}, {}
+    entries = []
+    for s in stats:
+        histogram = {int(float(ms)): count for ms, count in s["response_times"].items()}
+        seconds = {int(float(sec)): count for sec, count in s["num_reqs_per_sec"].items()}
+        for ms, count in histogram.items():
+            total_histogram[ms] = total_histogram.get(ms, 0) + count
+        for sec, count in seconds.items():
+            total_seconds[sec] = total_seconds.get(sec, 0) + count
+        requests = s["num_requests"]
+        entries.append(_entry(
+            s["method"] or "", s["name"], requests, s["num_failures"],
+            requests / duration if duration > 0 else 0.0,
+            s["total_response_time"] / requests if requests else 0.0,
+            s["max_response_time"], histogram, _per_second(seconds), True
+        ))
+
+    requests = sum(e["requests"] for e in entries)
+    entries.append(_entry(
+        "", TOTAL_NAME, requests, sum(e["failures"] for e in entries),
+        requests / duration if duration > 0 else 0.0,
+        sum(s["total_response_time"] for s in stats) / requests if requests else 0.0,
+        max(e["max_ms"] for e in entries), total_histogram, _per_second(total_seconds), True
+    ))
+    return entries
+
+
+def parse_csv(path):
+    """Endpoints from a Locust stats CSV, with histograms rebuilt from the percentile columns."""
+    entries = []
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            requests = int(row["Request Count"])
+            if not requests:
+                continue
+            # Put the requests between two percentiles at the upper one
+            histogram, below = {}, 0.0
+            for percent, column in CSV_PERCENTILES:
+                value = float(row[column])
+                histogram[value] = histogram.get(value, 0.0) + (percent - below) * requests
+                below = percent
+            entry = _entry(
+                row["Type"], row["Name"], requests, int(row["Failure Count"]), float(row["Requests/s"]),
+                float(row["Average Response Time"]), float(row["Max Response Time"]), histogram, None, False
+            )
+            # Locust's own percentiles are exact, only the histogram is approximate
+            entry.update(p50_ms=float(row["50%"]), p95_ms=float(row["95%"]), p99_ms=float(row["99%"]))
+            entries.append(entry)
+    if not entries:
+        raise ValueError("the run made no requests")
+    return entries
+
+
+def load_source(source):
+    """Parse a --json output file ("-" for stdin), a stats CSV or a --csv prefix."""
+    if source == "-":
+        return parse_json(sys.stdin.read())
+    if not os.path.exists(source) and os.path.exists(f"{source}_stats.csv"):
+        source = f"{source}_stats.csv"
+    if source.endswith(".csv"):
+        return parse_csv(source)
+    with open(source) as f:
+        return parse_json(f.read())
+
+
+def ingest(conn, entries, scenario, commit, source, note=None):
+    """Store one run and return its id."""
+    with conn:
+        run_id = conn.execute(
+            "INSERT INTO runs (recorded_at, git_commit, scenario, source, note) VALUES (?, ?, ?, ?, ?)",
+            (time.strftime("%Y-%m-%d %H:%M:%S"), commit, scenario, source, note)
+        ).lastrowid
+        conn.executemany(
+            "INSERT INTO endpoints (run_id, method, name, requests, failures, rps, avg_ms, p50_ms, p95_ms, "
+            "p99_ms, max_ms, response_times, reqs_per_sec, exact) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(run_id, e["method"], e["name"], e["requests"], e["failures"], e["rps"], e["avg_ms"],
+              e["p50_ms"], e["p95_ms"], e["p99_ms"], e["max_ms"],
+              json.dumps(sorted(e["histogram"].items())),
+              json.dumps(e["reqs_per_sec"]) if e["reqs_per_sec"] is not None else None,
+              int(e["exact"])) for e in entries]
+        )
+    return run_id
+
+
+def find_run(conn, scenario, ref=None, before=None):
+    """A run by id or commit prefix (latest match) within `scenario`, or the latest one before run `before`."""
+    sql, args = "SELECT * FROM runs WHERE scenario = ?", [scenario]
+    if ref is not None and ref.isdigit():
+        sql += " AND id = ?"
+        args.append(int(ref))
+    elif ref is not None:
+        sql += " AND git_commit LIKE ?"
+        args.append(ref + "%")
+    if before is not None:
+        sql += " AND id < ?"
+        args.append(before)
+    return conn.execute(sql + " ORDER BY id DESC LIMIT 1", args).fetchone()
+
+
+def mann_whitney(lower, higher):
+    """One-sided Mann-Whitney U test on two {value: count} histograms.
+
+    Returns (p, effect): p is the probability of `higher` being shifted at
+    least this much above `lower` if both came from the same distribution
+    (normal approximation with tie correction), and effect is
+    P(higher > lower) + P(tie) / 2. Returns (None, None) if either is empty.
+    """
+    n1, n2 = sum(lower.values()), sum(higher.values())
+    if not n1 or not n2:
+        return None, None
+    u = 0.0
+    below = 0.0
+    ties = 0.0
+    for value in sorted(set(lower) | set(higher)):
+        a, b = lower.get(value, 0), higher.get(value, 0)
+        u += b * (below + a / 2)
+        below += a
+        ties += (a + b) ** 3 - (a + b)
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1)))
+    effect = u / (n1 * n2)
+    if variance <= 0:
+        # Every value is the same
+        return 1.0, effect
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2)), effect
+
+
+def _endpoints(conn, run_id):
+    rows = conn.execute("SELECT * FROM endpoints WHERE run_id = ?", (run_id,)).fetchall()
+    return {(row["method"], row["name"]): row for row in rows}
+
+
+def _histogram(row):
+    return {value: count for value, count in json.loads(row["response_times"])}
+
+
+def _counts(series):
+    histogram = {}
+    for count in series:
+        histogram[count] = histogram.get(count, 0) + 1
+    return histogram
+
+
+def _change(base, candidate):
+    return (candidate - base) / base if base else 0.0
+
+
+def compare(conn, base, candidate, alpha=0.01, threshold=0.10):
+    """Yield (method, name, base row, candidate row, p_slower, exact, verdict) per endpoint, totals last."""
+    base_endpoints, candidate_endpoints = _endpoints(conn, base["id"]), _endpoints(conn, candidate["id"])
+    keys = sorted(set(base_endpoints) | set(candidate_endpoints), key=lambda k: (k[1] == TOTAL_NAME, k[1], k[0]))
+    for key in keys:
+        old, new = base_endpoints.get(key), candidate_endpoints.get(key)
+        if old is None or new is None:
+            yield key[0], key[1], old, new, None, True, "new" if old is None else "missing"
+            continue
+
+        exact = bool(old["exact"] and new["exact"])
+        verdicts = []
+        grew = max(_change(old[p], new[p]) for p in ("p50_ms", "p95_ms", "p99_ms"))
+        shrank = min(_change(old[p], new[p]) for p in ("p50_ms", "p95_ms", "p99_ms"))
+        p_slower, effect = mann_whitney(_histogram(old), _histogram(new))
+        if p_slower is not None and p_slower < alpha and grew >= threshold:
+            verdicts.append("SLOWER")
+        elif effect is not None and effect < 0.5 and -shrank >= threshold:
+            p_faster, _ = mann_whitney(_histogram(new), _histogram(old))
+            if p_faster < alpha:
+                verdicts.append("faster")
+
+        if old["reqs_per_sec"] and new["reqs_per_sec"] and _change(old["rps"], new["rps"]) <= -threshold:
+            p_lower, _ = mann_whitney(_counts(json.loads(new["reqs_per_sec"])), _counts(json.loads(old["reqs_per_sec"])))
+            if p_lower is not None and p_lower < alpha:
+                verdicts.append("RPS DROP")
+        yield key[0], key[1], old, new, p_slower, exact, ", ".join(verdicts) or "ok"
+
+
+def _cell(old, new, fmt):
+    return f"{old:{fmt}}->{new:{fmt}} {_change(old, new):+.0%}"
+
+
+def print_comparison(base, candidate, rows):
+    """Print the comparison table and return True if a regression was flagged."""
+    for label, run in (("Base", base), ("Candidate", candidate)):
+        note = f", {run['note']}" if run["note"] else ""
+        print(f"{label + ':':<11} #{run['id']} {run['git_commit']} ({run['recorded_at']}{note})")
+    print()
+    header = (f"{'Endpoint':<34} {'p50 ms':>16} {'p95 ms':>16} {'p99 ms':>16} {'RPS':>18} "
+              f"{'p':>8}  Result")
+    print(header)
+    print("-" * len(header))
+    regressed = False
+    for method, name, old, new, p_slower, exact, verdict in rows:
+        label = f"{method} {name}".strip()[:34]
+        if old is None or new is None:
+            print(f"{label:<34} {verdict}")
+            continue
+        p = "" if p_slower is None else f"{'' if exact else '~'}{p_slower:.2g}"
+        print(
+            f"{label:<34} {_cell(old['p50_ms'], new['p50_ms'], 'g'):>16} {_cell(old['p95_ms'], new['p95_ms'], 'g'):>16} "
+            f"{_cell(old['p99_ms'], new['p99_ms'], 'g'):>16} {_cell(old['rps'], new['rps'], '.1f'):>18} {p:>8}  {verdict}"
+        )
+        regressed = regressed or "SLOWER" in verdict or "RPS DROP" in verdict
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=DEFAULT_DB, help="SQLite file (PERF_HISTORY_DB)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    ingest_cmd = commands.add_parser("ingest", help="store a run")
+    ingest_cmd.add_argument("source", help="locust --json output, a stats CSV or a --csv prefix; - for stdin")
+    ingest_cmd.add_argument("--scenario", default="default")
+    ingest_cmd.add_argument("--commit", default=None, help="git commit of the tested build (default: HEAD)")
+    ingest_cmd.add_argument("--note", default=None)
+
+    list_cmd = commands.add_parser("list", help="show stored runs")
+    list_cmd.add_argument("--scenario", default=None)
+    list_cmd.add_argument("-n", "--limit", type=int, default=20)
+
+    compare_cmd = commands.add_parser("compare", help="compare two runs of a scenario")
+    compare_cmd.add_argument("base", nargs="?", help="run id or commit prefix (default: run before candidate)")
+    compare_cmd.add_argument("candidate", nargs="?", help="run id or commit prefix (default: latest run)")
+    compare_cmd.add_argument("--scenario", default="default")
+    compare_cmd.add_argument("--alpha", type=float, default=0.01, help="significance level")
+    compare_cmd.add_argument("--threshold", type=float, default=0.10,
+                             help="smallest relative change worth flagging (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == "ingest":
+        entries = load_source(args.source)
+        run_id = ingest(conn, entries, args.scenario, args.commit or current_commit(), args.source, args.note)
+        print(f"Stored run #{run_id} ({len(entries) - 1} endpoints) for scenario '{args.scenario}'")
+
+    elif args.command == "list":
+        sql, params = "SELECT runs.*, requests, rps, p95_ms FROM runs JOIN endpoints ON run_id = runs.id " \
+                      "WHERE name = ? AND method = ''", [TOTAL_NAME]
+        if args.scenario:
+            sql += " AND scenario = ?"
+            params.append(args.scenario)
+        rows = conn.execute(sql + " ORDER BY runs.id DESC LIMIT ?", params + [args.limit]).fetchall()
+        print(f"{'Run':>5} {'Recorded':<19} {'Commit':<18} {'Scenario':<20} {'Requests':>9} {'RPS':>8} {'p95':>6}  Note")
+        for row in rows:
+            print(f"{row['id']:>5} {row['recorded_at']:<19} {row['git_commit']:<18} {row['scenario'][:20]:<20} "
+                  f"{row['requests']:>9} {row['rps']:>8.1f} {row['p95_ms']:>6g}  {row['note'] or ''}")
+
+    else:
+        candidate = find_run(conn, args.scenario, args.candidate)
+        base = candidate and find_run(conn, args.scenario, args.base, before=None if args.base else candidate["id"])
+        if not candidate or not base:
+            print(f"Need two runs of scenario '{args.scenario}' to compare", file=sys.stderr)
+            sys.exit(2)
+        rows = compare(conn, base, candidate, args.alpha, args.threshold)
+        if print_comparison(base, candidate, rows):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+"""
+On-demand sampling profiler for individual requests.
+
+A request is profiled when it carries a valid signed X-Profile header or when
+an admin has armed profiling for its route (POST /admin/profile). While the
+request runs, a helper thread samples its stack every PROFILE_INTERVAL_MS and
+the result is written to PROFILE_DIR in collapsed-stack format, ready for
+flamegraph.pl or speedscope. Total disk usage is capped at PROFILE_MAX_MB by
+deleting the oldest profiles.
+
+When nothing is armed the per-request cost is one boolean check and one
+header lookup.
+
+Sign a header for a path with: python profiler.py sign /api/books --ttl 300
+"""
+
+import os
+import re
+import sys
+import hmac
+import time
+import hashlib
+import threading
+from flask import g, request
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_BYTES = int(float(os.getenv("PROFILE_MAX_MB", "50")) * 1024 * 1024)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000
+PROFILE_SECRET = os.getenv("PROFILE_SECRET", "")
+
+HEADER = "X-Profile"
+
+_armed = False
+_armed_lock = threading.Lock()
+_armed_pattern = None
+_armed_remaining = 0
+_armed_until = 0.0
+_write_lock = threading.Lock()
+
+
+def sign(path, expires):
+    """Return the X-Profile header value for `path`, valid until `expires` (epoch seconds)."""
+    digest = hmac.new(PROFILE_SECRET.encode(), f"{expires}:{path}".encode(), hashlib.sha256).hexdigest()
+    return f"{expires}:{digest}"
+
+
+def _valid_signature(value, path):
+    if not PROFILE_SECRET:
+        return False
+    expires, _, _ = value.partition(":")
+    try:
+        if int(expires) < time.time():
+            return False
+    except ValueError:
+        return False
+    return hmac.compare_digest(value, sign(path, int(expires)))
+
+
+def arm(pattern, count=10, ttl=300):
+    """Profile the next `count` requests whose route matches the `pattern` regex within `ttl` seconds."""
+    global _armed, _armed_pattern, _armed_remaining, _armed_until
+    with _armed_lock:
+        _armed_pattern = re.compile(pattern)
+        _armed_remaining = int(count)
+        _armed_until = time.time() + float(ttl)
+        _armed = True
+
+
+def disarm():
+    global _armed, _armed_pattern, _armed_remaining
+    with _armed_lock:
+        _armed = False
+        _armed_pattern = None
+        _armed_remaining = 0
+
+
+def status():
+    """Return the admin switch state and disk usage of stored profiles."""
+    return {
+        "armed": _armed,
+        "pattern": _armed_pattern.pattern if _armed_pattern else None,
+        "remaining": _armed_remaining,
+        "expires_in": max(0, round(_armed_until - time.time())) if _armed else 0,
+        "profiles": list_profiles(),
+        "max_bytes": PROFILE_MAX_BYTES,
+    }
+
+
+def _take_armed_slot(route):
+    global _armed, _armed_remaining
+    with _armed_lock:
+        if not _armed:
+            return False
+        if time.time() > _armed_until:
+            _armed = False
+            return False
+        if not _armed_pattern.search(route):
+            return False
+        _armed_remaining -= 1
+        if _armed_remaining <= 0:
+            _armed = False
+        return True
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts."""
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._stop_event = threading.Event()
+
+    def run(self):
+        own_file = __file__
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                if code.co_filename != own_file:
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+            self.samples += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    entries = []
+    for name in os.listdir(PROFILE_DIR):
+        if name.endswith(".folded"):
+            path = os.path.join(PROFILE_DIR, name)
+            entries.append({"name": name, "bytes": os.path.getsize(path), "mtime": os.path.getmtime(path)})
+    return sorted(entries, key=lambda e: e["mtime"])
+
+
+def _enforce_disk_budget():
+    profiles = list_profiles()
+    total = sum(p["bytes"] for p in profiles)
+    for profile in profiles:
+        if total <= PROFILE_MAX_BYTES:
+            break
+        try:
+            os.unlink(os.path.join(PROFILE_DIR, profile["name"]))
+        except OSError:
+            pass
+        total -= profile["bytes"]
+
+
+def _write_profile(route, stacks):
+    lines = "".join(f"{stack} {count}\n" for stack, count in sorted(stacks.items()))
+    data = lines.encode()
+    if len(data) > PROFILE_MAX_BYTES:
+        return None
+
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", route).strip("_") or "root"
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}_{int(time.time() * 1000) % 1000:03d}_{slug}_{os.getpid()}.folded"
+    with _write_lock:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        tmp_path = os.path.join(PROFILE_DIR, f".{name}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, os.path.join(PROFILE_DIR, name))
+        _enforce_disk_budget()
+    return name
+
+
+def init_app(app):
+    """Register the profiling hooks on a Flask app."""
+
+    @app.before_request
+    def _maybe_start_profile():
+        header = request.headers.get(HEADER)
+        if not _armed and header is None:
+            return
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        if (header is not None and _valid_signature(header, request.path)) or _take_armed_slot(route):
+            sampler = StackSampler(threading.get_ident())
+            g._profile = (sampler, route)
+            sampler.start()
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.pop("_profile", None)
+        if profile is not None:
+            sampler, route = profile
+            sampler.stop()
+            name = _write_profile(route, sampler.stacks) if sampler.stacks else None
+            if name:
+                response.headers["X-Profile-Id"] = name
+        return response
+
+    @app.teardown_request
+    def _stop_orphaned_profile(exc):
+        profile = g.pop("_profile", None)
+        if profile is not None:
+            profile[0].stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sign an X-Profile header")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sign_parser = sub.add_parser("sign")
+    sign_parser.add_argument("path", help="request path, e.g. /api/books")
+    sign_parser.add_argument("--ttl", type=int, default=300, help="validity in seconds")
+    args = parser.parse_args()
+
+    if not PROFILE_SECRET:
+        parser.error("PROFILE_SECRET is not set")
+    print(f"{HEADER}: {sign(args.path, int(time.time()) + args.ttl)}")
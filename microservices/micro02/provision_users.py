@@ -0,0 +1,97 @@
+"""
+Create a pool of load-test accounts once and write their credentials to a
+CSV file that Locust reads (locustfile.py --user-pool).
+
+Usernames are deterministic (loaduser_00001, ...), so running the script
+again reuses the existing accounts instead of adding new ones.
+
+Insert directly into MariaDB using the .env settings (fast, bulk):
+    python provision_users.py -n 1000
+
+Or register through the API when the database is not reachable from here:
+    python provision_users.py -n 1000 --host http://127.0.0.1:5000
+
+Then run Locust with the pool (copy the file to every worker machine):
+    locust -f locustfile.py --host=http://127.0.0.1:5000 --user-pool users.csv
+"""
+
+import argparse
+import csv
+import hashlib
+import json
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def credentials(count, prefix, password):
+    return [(f"{prefix}_{i:05d}", password) for i in range(1, count + 1)]
+
+
+def insert_into_db(users, chunk_size=1000):
+    """Bulk INSERT IGNORE with the same SHA-256 hashing as /auth/register. Returns rows inserted."""
+    import db
+
+    conn = db.connect()
+    cursor = conn.cursor()
+    inserted = 0
+    try:
+        for start in range(0, len(users), chunk_size):
+            chunk = users[start:start + chunk_size]
+            # executemany turns this into one multi-row INSERT per chunk
+            cursor.executemany(
+                "INSERT IGNORE INTO usuarios (username, password) VALUES (%s, %s)",
+                [(username, hashlib.sha256(password.encode()).hexdigest()) for username, password in chunk]
+            )
+            inserted += cursor.rowcount
+            conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return inserted
+
+
+def register_via_api(host, users, concurrency=8):
+    """POST /auth/register for each account (409 means it already exists). Returns accounts created."""
+
+    def register(user):
+        username, password = user
+        body = json.dumps({"username": username, "password": password}).encode()
+        req = urllib.request.Request(f"{host}/auth/register", data=body,
+                                     headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req, timeout=10):
+                return 1
+        except urllib.error.HTTPError as e:
+            if e.code == 409:
+                return 0
+            raise
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return sum(pool.map(register, users))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--count", type=int, default=500)
+    parser.add_argument("--prefix", default="loaduser")
+    parser.add_argument("--password", default="testpass123")
+    parser.add_argument("-o", "--out", default="users.csv")
+    parser.add_argument("--host", help="register through this API instead of inserting into MariaDB")
+    args = parser.parse_args()
+
+    users = credentials(args.count, args.prefix, args.password)
+    if args.host:
+        created = register_via_api(args.host.rstrip("/"), users)
+    else:
+        created = insert_into_db(users)
+
+    with open(args.out, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["username", "password"])
+        writer.writerows(users)
+    print(f"{len(users)} accounts ({created} new, {len(users) - created} already existed) written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
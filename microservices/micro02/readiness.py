@@ -0,0 +1,148 @@
+"""
+Readiness reporting for load balancers.
+
+A background thread probes MariaDB and Redis every READY_PROBE_INTERVAL
+seconds and caches the results; /ready only reads the cache, so it never
+blocks on a dependency. The node reports not-ready when a dependency is
+down or its circuit breaker is open, when the cached probes are older than
+READY_MAX_PROBE_AGE, or when the connection pool, request concurrency or
+image queue exceed their thresholds.
+"""
+
+import os
+import time
+import threading
+from dotenv import load_dotenv
+import db
+import metrics
+import image_pipeline
+from breaker import OPEN, breakers
+from auth import r
+
+load_dotenv()
+
+READY_PROBE_INTERVAL = float(os.getenv("READY_PROBE_INTERVAL", "2"))
+READY_MAX_PROBE_AGE = float(os.getenv("READY_MAX_PROBE_AGE", "10"))
+READY_MAX_POOL_UTILIZATION = float(os.getenv("READY_MAX_POOL_UTILIZATION", "0.9"))
+READY_MAX_POOL_WAITING = int(os.getenv("READY_MAX_POOL_WAITING", "5"))
+READY_MAX_IN_FLIGHT = int(os.getenv("READY_MAX_IN_FLIGHT", "0"))  # 0 disables the check
+READY_MAX_IMAGE_QUEUE = int(os.getenv("READY_MAX_IMAGE_QUEUE", "100"))
+
+_probes = {}
+_probes_lock = threading.Lock()
+_prober = None
+_prober_pid = None
+_prober_lock = threading.Lock()
+
+
+def _probe_redis():
+    r.ping()
+
+
+class _DatabaseProbe:
+    """Keeps one dedicated connection so probes do not compete for the request pool.
+
+    The ping goes through the MariaDB breaker, so once its reset timeout has
+    passed a successful probe closes it even while the node gets no traffic.
+    """
+
+    def __init__(self):
+        self._conn = None
+
+    def __call__(self):
+        if self._conn is None or not self._conn.open:
+            self._conn = db.connect()
+        with self._conn.breaker.guard():
+            self._conn.ping(reconnect=True)
+
+
+def _run_probe(name, probe):
+    start = time.perf_counter()
+    try:
+        probe()
+        result = {"ok": True, "error": None}
+    except Exception as e:
+        result = {"ok": False, "error": str(e)}
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    result["checked_at"] = time.time()
+    with _probes_lock:
+        _probes[name] = result
+
+
+def _probe_loop():
+    probes = {"mariadb": _DatabaseProbe(), "redis": _probe_redis}
+    while True:
+        for name, probe in probes.items():
+            _run_probe(name, probe)
+        time.sleep(READY_PROBE_INTERVAL)
+
+
+def ensure_started():
+    """Start the probe thread once per process (again in each forked worker)."""
+    global _prober, _prober_pid
+
+    if _prober_pid == os.getpid():
+        return
+    with _prober_lock:
+        if _prober_pid != os.getpid():
+            with _probes_lock:
+                _probes.clear()
+            _prober = threading.Thread(target=_probe_loop, name="readiness-probe", daemon=True)
+            _prober.start()
+            _prober_pid = os.getpid()
+
+
+def report():
+    """Build the readiness report from cached probes and current saturation."""
+    ensure_started()
+    now = time.time()
+    reasons = []
+
+    with _probes_lock:
+        dependencies = {name: dict(result) for name, result in _probes.items()}
+    for name in ("mariadb", "redis"):
+        result = dependencies.get(name)
+        if result is None:
+            reasons.append(f"{name}: not probed yet")
+            continue
+        result["age_sec"] = round(now - result.pop("checked_at"), 2)
+        if not result["ok"]:
+            reasons.append(f"{name}: {result['error']}")
+        elif result["age_sec"] > READY_MAX_PROBE_AGE:
+            reasons.append(f"{name}: probe is {result['age_sec']}s old")
+
+    circuit_breakers = {name: breaker.status() for name, breaker in breakers.items()}
+    for name in ("mariadb", "redis"):
+        # Half-open counts as ready: the probes (or requests) run its trial call
+        if circuit_breakers[name]["state"] == OPEN:
+            reasons.append(f"{name}: circuit breaker open")
+
+    pool = db.pool_stats()
+    if pool is not None:
+        if pool["utilization"] > READY_MAX_POOL_UTILIZATION:
+            reasons.append(f"db pool: {pool['in_use']}/{pool['size']} in use")
+        if pool["waiting"] > READY_MAX_POOL_WAITING:
+            reasons.append(f"db pool: {pool['waiting']} requests waiting")
+
+    # Exclude the /ready request itself
+    in_flight = max(0, metrics.IN_FLIGHT.total() - 1)
+    if READY_MAX_IN_FLIGHT and in_flight > READY_MAX_IN_FLIGHT:
+        reasons.append(f"in-flight requests: {in_flight} > {READY_MAX_IN_FLIGHT}")
+
+    image_queue = image_pipeline.queue_depth()
+    if image_queue > READY_MAX_IMAGE_QUEUE:
+        reasons.append(f"image queue: {image_queue} > {READY_MAX_IMAGE_QUEUE}")
+
+    return {
+        "status": "not_ready" if reasons else "ready",
+        "reasons": reasons,
+        "dependencies": dependencies,
+        "circuit_breakers": circuit_breakers,
+        # Informational: a replica out of rotation only moves reads to the primary
+        "replicas": db.replica_stats(),
+        "saturation": {
+            "db_pool": pool,
+            "in_flight": in_flight,
+            "image_queue": image_queue,
+        },
+    }
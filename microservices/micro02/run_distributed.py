@@ -0,0 +1,110 @@
+"""
+Run Locust distributed on this machine: one master and several workers.
+
+A Locust process runs on a single core, so one process saturates its own
+CPU long before a multi-core server. This starts a headless master and
+--workers workers (default: one per core, leaving one for the master),
+waits for the run to end and stops the workers. The master merges what
+the workers report: Locust's request statistics (printed and written to
+--csv) and the Server-Timing breakdown and requests per worker collected
+by locustfile.py.
+
+Any other option (--slo, --user-pool, --seed-books, --tags, user classes)
+is passed to the master and every worker. The exit code is the master's,
+so SLO gating (--slo) works as with a single process. Run with:
+    python run_distributed.py --host=http://127.0.0.1:5000 -u 2000 -r 100 -t 5m
+    python run_distributed.py --fast --workers 8 -u 5000 -r 200 -t 10m --slo slo.json --user-pool users.csv
+
+--fast runs every user class on FastHttpUser (LOCUST_CLIENT=fast), which
+needs several times less CPU per request than python-requests. Keep one
+core free for the master and the OS, and watch for Locust's "CPU usage
+above 90%" warning: a busy worker reports inflated response times.
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def locust_cmd(*args):
+    return [sys.executable, "-m", "locust", "-f", os.path.join(HERE, "locustfile.py")] + list(args)
+
+
+def stop(proc, timeout=30):
+    if proc.poll() is None:
+        proc.send_signal(signal.SIGTERM)
+    try:
+        proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="http://127.0.0.1:5000")
+    parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count() - 1))
+    parser.add_argument("--fast", action="store_true", help="use FastHttpUser (geventhttpclient)")
+    parser.add_argument("-u", "--users", type=int, default=500)
+    parser.add_argument("-r", "--spawn-rate", type=int, default=50)
+    parser.add_argument("-t", "--run-time", default="60s")
+    parser.add_argument("--master-port", type=int, default=5557)
+    parser.add_argument("--out-dir", default="distributed_results")
+    args, locust_args = parser.parse_known_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    env = dict(os.environ)
+    if args.fast:
+        env["LOCUST_CLIENT"] = "fast"
+
+    master = subprocess.Popen(locust_cmd(
+        "--master", "--master-bind-port", str(args.master_port),
+        "--expect-workers", str(args.workers), "--expect-workers-max-wait", "60",
+        "--headless", "--host", args.host,
+        "-u", str(args.users), "-r", str(args.spawn_rate), "-t", args.run_time,
+        "--csv", os.path.join(args.out_dir, "run"), "--only-summary",
+        *locust_args
+    ), env=env)
+
+    workers = []
+    logs = []
+    try:
+        for i in range(args.workers):
+            # Worker output goes to a log per worker; the master prints the merged report
+            log = open(os.path.join(args.out_dir, f"worker_{i}.log"), "w")
+            logs.append(log)
+            workers.append(subprocess.Popen(locust_cmd(
+                "--worker", "--master-host", "127.0.0.1", "--master-port", str(args.master_port),
+                "--host", args.host, *locust_args
+            ), env=env, stdout=log, stderr=subprocess.STDOUT))
+        print(f"Started a master and {args.workers} workers against {args.host}", flush=True)
+        code = master.wait()
+    except KeyboardInterrupt:
+        stop(master)
+        code = 1
+    finally:
+        # Workers exit when the master quits; give them a moment before stopping them
+        deadline = time.time() + 10
+        for proc in workers:
+            try:
+                proc.wait(timeout=max(0.1, deadline - time.time()))
+            except subprocess.TimeoutExpired:
+                stop(proc)
+        for log in logs:
+            log.close()
+
+    crashed = [i for i, proc in enumerate(workers) if proc.returncode not in (0, -signal.SIGTERM)]
+    if crashed:
+        print(f"Workers {crashed} exited with an error; see {args.out_dir}/worker_<n>.log", file=sys.stderr)
+    print(f"Statistics written to {os.path.join(args.out_dir, 'run')}_stats.csv")
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
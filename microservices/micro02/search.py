@@ -0,0 +1,174 @@
+"""
+Query planner for GET /api/books/search.
+
+Filters: format (exact), author (prefix), title (prefix), min_price and
+max_price. Sort: titulo or precio, ascending or descending ("-precio").
+Results are paginated by keyset: the cursor carries the sort value and id
+of the last row, so page N costs the same as page 1.
+
+The planner picks one of the indexes below as the access path and only
+builds SQL it can serve from it:
+
+    idx_libros_titulo           (titulo, id)
+    idx_libros_precio           (precio, id)
+    idx_libros_formato_titulo   (formato, titulo, id)
+    idx_libros_formato_precio   (formato, precio, id)
+    idx_libros_autor_titulo     (autor, titulo, id)
+
+Combinations that would scan the table (a price range sorted by title with
+no author or title prefix to narrow it) are rejected with SearchError, and
+prefixes shorter than SEARCH_MIN_PREFIX are refused. `limit` is capped at
+SEARCH_MAX_LIMIT.
+"""
+
+import os
+import json
+import base64
+from decimal import ROUND_CEILING, ROUND_FLOOR, ROUND_HALF_EVEN, Decimal, InvalidOperation
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SEARCH_DEFAULT_LIMIT = int(os.getenv("SEARCH_DEFAULT_LIMIT", "20"))
+SEARCH_MAX_LIMIT = int(os.getenv("SEARCH_MAX_LIMIT", "100"))
+SEARCH_MIN_PREFIX = int(os.getenv("SEARCH_MIN_PREFIX", "3"))
+
+FORMATS = ("Físico", "Digital", "Audiolibro")
+SORT_FIELDS = ("titulo", "precio")
+
+# libros.precio is DECIMAL(10,2)
+PRICE_STEP = Decimal("0.01")
+PRICE_MAX = Decimal("99999999.99")
+
+
+class SearchError(ValueError):
+    """The request cannot be served by an index; reported as 400."""
+
+
+class Plan:
+    """SQL for one page of results and the index it is built for."""
+
+    def __init__(self, sql, params, index, sort_field, descending, limit):
+        self.sql = sql
+        self.params = params
+        self.index = index
+        self.sort_field = sort_field
+        self.descending = descending
+        self.limit = limit
+
+    def next_cursor(self, rows):
+        """Cursor for the page after `rows`, or None if this was the last page."""
+        if len(rows) <= self.limit:
+            return None
+        last = rows[self.limit - 1]
+        return encode_cursor(self.sort_field, last[self.sort_field], last["id"])
+
+
+def encode_cursor(sort_field, value, row_id):
+    raw = json.dumps([sort_field, str(value), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort_field):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        field, value, row_id = json.loads(raw)
+        row_id = int(row_id)
+    except (ValueError, TypeError):
+        raise SearchError("Invalid cursor")
+    if field != sort_field:
+        raise SearchError("Cursor belongs to a different sort order")
+    return (_decimal(value, "cursor") if field == "precio" else value), row_id
+
+
+def _decimal(value, name, rounding=ROUND_HALF_EVEN):
+    """Parse a price into the DECIMAL(10,2) range, rounding to cents with `rounding`."""
+    try:
+        price = Decimal(value)
+    except (InvalidOperation, TypeError):
+        raise SearchError(f"Invalid {name}: {value}")
+    # Decimal() also accepts NaN, Infinity and exponents far outside the column
+    if not price.is_finite() or abs(price) > PRICE_MAX:
+        raise SearchError(f"Invalid {name}: {value}")
+    return price.quantize(PRICE_STEP, rounding=rounding)
+
+
+def _prefix(value, name):
+    if len(value) < SEARCH_MIN_PREFIX:
+        raise SearchError(f"'{name}' must have at least {SEARCH_MIN_PREFIX} characters")
+    # Escape LIKE wildcards so the prefix stays a range on the index
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def plan(args):
+    """Build a Plan from request arguments (a dict-like of strings).
+
+    Raises SearchError for invalid values and for combinations no index can serve.
+    """
+    fmt = args.get("format") or None
+    author = args.get("author") or None
+    title = args.get("title") or None
+    min_price = args.get("min_price") or None
+    max_price = args.get("max_price") or None
+    sort = args.get("sort") or "titulo"
+    cursor = args.get("cursor") or None
+
+    descending = sort.startswith("-")
+    sort_field = sort.lstrip("-")
+    if sort_field not in SORT_FIELDS:
+        raise SearchError(f"sort must be one of: {', '.join(SORT_FIELDS)} (prefix '-' for descending)")
+    if fmt is not None and fmt not in FORMATS:
+        raise SearchError(f"format must be one of: {', '.join(FORMATS)}")
+
+    try:
+        limit = int(args.get("limit") or SEARCH_DEFAULT_LIMIT)
+    except ValueError:
+        raise SearchError("limit must be an integer")
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+
+    where = []
+    params = []
+    if fmt is not None:
+        where.append("formato = %s")
+        params.append(fmt)
+    if author is not None:
+        where.append("autor LIKE %s")
+        params.append(_prefix(author, "author"))
+    if title is not None:
+        where.append("titulo LIKE %s")
+        params.append(_prefix(title, "title"))
+    if min_price is not None:
+        where.append("precio >= %s")
+        params.append(_decimal(min_price, "min_price", ROUND_CEILING))
+    if max_price is not None:
+        where.append("precio <= %s")
+        params.append(_decimal(max_price, "max_price", ROUND_FLOOR))
+    has_price_range = min_price is not None or max_price is not None
+
+    # Access path: the most selective range first, otherwise an index that returns rows in sort order
+    if author is not None:
+        index = "idx_libros_autor_titulo"
+    elif title is not None:
+        index = "idx_libros_formato_titulo" if fmt is not None else "idx_libros_titulo"
+    elif sort_field == "precio":
+        index = "idx_libros_formato_precio" if fmt is not None else "idx_libros_precio"
+    elif has_price_range:
+        raise SearchError("A price range without author or title must be sorted by precio")
+    else:
+        index = "idx_libros_formato_titulo" if fmt is not None else "idx_libros_titulo"
+
+    if cursor is not None:
+        value, row_id = decode_cursor(cursor, sort_field)
+        op = "<" if descending else ">"
+        where.append(f"{sort_field} {op}= %s AND ({sort_field} {op} %s OR id {op} %s)")
+        params.extend([value, value, row_id])
+
+    direction = "DESC" if descending else "ASC"
+    sql = "SELECT * FROM libros"
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    # One extra row tells whether there is a next page
+    sql += f" ORDER BY {sort_field} {direction}, id {direction} LIMIT %s"
+    params.append(limit + 1)
+
+    return Plan(sql, params, index, sort_field, descending, limit)
@@ -0,0 +1,216 @@
+"""
+Bulk-load synthetic books for load tests at realistic catalog sizes.
+
+Books get deterministic ISBN-13s (prefix + 9-digit index + check digit),
+so load tests can sample existing ISBNs without reading them back
+(isbn_for), and seeding resumes where a previous run stopped: growing the
+catalog from 10k to 100k inserts only the 90k missing books.
+
+Seeded rows are recognized by SEED_MARKER at the start of `descripcion`,
+which the API never writes, not by their ISBN range: real 979 ISBNs and the
+random ISBNs created during load tests are never counted or deleted.
+
+Distributions:
+- authors follow a Zipf law over a fixed pool of names, so a handful of
+  authors write a large share of the catalog and most write one or two
+- formato: Físico 55%, Digital 35%, Audiolibro 10%
+- precio: log-normal around 20 (Digital cheaper, Audiolibro dearer)
+
+Run with:
+    python seed_catalog.py -n 100000
+    python seed_catalog.py --remove      # delete every seeded book (with tombstones)
+"""
+
+import argparse
+import bisect
+import itertools
+import math
+import random
+import time
+
+ISBN_PREFIX = "979"
+CHUNK_SIZE = 5000
+
+FORMATS = ("Físico", "Digital", "Audiolibro")
+FORMAT_WEIGHTS = (0.55, 0.35, 0.10)
+FORMAT_PRICE_FACTOR = {"Físico": 1.0, "Digital": 0.6, "Audiolibro": 1.2}
+AUTHOR_ZIPF_EXPONENT = 0.9
+
+# Start of `descripcion` in every seeded row
+SEED_MARKER = "[seed_catalog]"
+
+FIRST_NAMES = (
+    "Ana", "Carlos", "María", "José", "Lucía", "Miguel", "Carmen", "Javier", "Elena", "Pablo",
+    "Isabel", "Diego", "Laura", "Andrés", "Sofía", "Fernando", "Marta", "Ricardo", "Paula", "Jorge",
+)
+SURNAMES = (
+    "García", "Martínez", "López", "González", "Pérez", "Rodríguez", "Sánchez", "Ramírez", "Torres", "Flores",
+    "Rivera", "Gómez", "Díaz", "Cruz", "Morales", "Ortiz", "Gutiérrez", "Chávez", "Ramos", "Herrera",
+    "Castillo", "Vargas", "Mendoza", "Romero", "Jiménez", "Ruiz", "Aguilar", "Moreno", "Navarro", "Medina",
+)
+TITLE_NOUNS = (
+    "La sombra", "El jardín", "La ciudad", "El viaje", "La memoria", "El silencio", "La casa", "El río",
+    "La noche", "El secreto", "La isla", "El camino", "La carta", "El invierno", "La promesa", "El espejo",
+)
+TITLE_COMPLEMENTS = (
+    "del viento", "de los olvidados", "sin nombre", "de cristal", "del norte", "de las horas",
+    "de medianoche", "del último verano", "de papel", "bajo la lluvia", "de los sueños", "sin final",
+)
+
+
+def isbn_for(index, prefix=ISBN_PREFIX):
+    """ISBN-13 of the seeded book number `index` (0-based)."""
+    body = f"{prefix}{index:09d}"
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def _authors():
+    """Author names, most prolific first, with their cumulative Zipf weights."""
+    names = [f"{first} {last}" for last, first in itertools.product(SURNAMES, FIRST_NAMES)]
+    names += [f"{first} {last} {second}" for first, last, second
+              in itertools.product(FIRST_NAMES, SURNAMES, SURNAMES) if last != second]
+    random.Random(0).shuffle(names)
+    weights = itertools.accumulate(1 / (rank ** AUTHOR_ZIPF_EXPONENT) for rank in range(1, len(names) + 1))
+    return names, list(weights)
+
+
+def book_for(index, authors, cum_weights, prefix=ISBN_PREFIX):
+    """Synthetic row for book number `index`; the same index always gives the same book."""
+    rng = random.Random(index)
+    formato = rng.choices(FORMATS, FORMAT_WEIGHTS)[0]
+    author = authors[bisect.bisect_left(cum_weights, rng.random() * cum_weights[-1])]
+    price = math.exp(rng.gauss(math.log(20), 0.5)) * FORMAT_PRICE_FACTOR[formato]
+    title = f"{rng.choice(TITLE_NOUNS)} {rng.choice(TITLE_COMPLEMENTS)}"
+    if rng.random() < 0.3:
+        title += f" {rng.randint(2, 9)}"
+    return (
+        isbn_for(index, prefix),
+        title,
+        author,
+        formato,
+        f"{int(price) + 0.99:.2f}",
+        f"{SEED_MARKER} Libro sintético número {index} para pruebas de carga.",
+    )
+
+
+def _connect():
+    import db
+    return db.connect()
+
+
+def _seeded_count(cursor):
+    # Seeding always fills indexes from 0 upwards, so the count is also the next index
+    cursor.execute("SELECT COUNT(*) AS seeded FROM libros WHERE descripcion LIKE %s", (SEED_MARKER + "%",))
+    return cursor.fetchone()["seeded"]
+
+
+def catalog_size():
+    """Return (seeded books, all books) currently in `libros`."""
+    conn = _connect()
+    cursor = conn.cursor()
+    try:
+        seeded = _seeded_count(cursor)
+        cursor.execute("SELECT COUNT(*) AS total FROM libros")
+        return seeded, cursor.fetchone()["total"]
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def seed(count, prefix=ISBN_PREFIX, progress=print):
+    """Make sure books 0..count-1 exist. Returns the number inserted."""
+    authors, cum_weights = _authors()
+    conn = _connect()
+    cursor = conn.cursor()
+    inserted = 0
+    try:
+        start = _seeded_count(cursor)
+        started = time.perf_counter()
+        for chunk_start in range(start, count, CHUNK_SIZE):
+            rows = [book_for(i, authors, cum_weights, prefix)
+                    for i in range(chunk_start, min(count, chunk_start + CHUNK_SIZE))]
+            # executemany sends one multi-row INSERT per chunk
+            cursor.executemany(
+                "INSERT IGNORE INTO libros (isbn, titulo, autor, formato, precio, descripcion) "
+                "VALUES (%s, %s, %s, %s, %s, %s)",
+                rows
+            )
+            conn.commit()
+            inserted += cursor.rowcount
+            done = chunk_start + len(rows)
+            if progress and (done == count or done % (CHUNK_SIZE * 20) == 0):
+                rate = (done - start) / (time.perf_counter() - started)
+                progress(f"Seeded {done}/{count} books ({rate:.0f}/s)")
+    finally:
+        cursor.close()
+        conn.close()
+    return inserted
+
+
+def _publish_deletes(isbns):
+    """Publish a delete event per ISBN in one pipeline; never raises."""
+    import change_stream
+    if not change_stream.CHANGE_STREAM_ENABLED:
+        return
+    try:
+        from auth import r
+        with r.pipeline(transaction=False) as pipe:
+            for isbn in isbns:
+                change_stream.publish("delete", isbn, client=pipe)
+            pipe.execute()
+    except Exception as e:
+        print(f"Warning: Could not publish {len(isbns)} delete events: {e}")
+
+
+def remove():
+    """Delete every seeded book, in chunks to keep transactions short. Returns the number deleted.
+
+    Each chunk records its tombstones in the same transaction and publishes
+    delete events, so delta-sync clients and the in-memory catalog drop the
+    books without a full resync.
+    """
+    import sync
+
+    conn = _connect()
+    cursor = conn.cursor()
+    deleted = 0
+    try:
+        while True:
+            cursor.execute(
+                "SELECT isbn FROM libros WHERE descripcion LIKE %s LIMIT %s FOR UPDATE",
+                (SEED_MARKER + "%", CHUNK_SIZE)
+            )
+            isbns = [row["isbn"] for row in cursor.fetchall()]
+            if not isbns:
+                return deleted
+            cursor.execute(
+                "DELETE FROM libros WHERE isbn IN (" + ", ".join(["%s"] * len(isbns)) + ")",
+                isbns
+            )
+            sync.record_tombstones(cursor, isbns)
+            conn.commit()
+            deleted += len(isbns)
+            _publish_deletes(isbns)
+            if len(isbns) < CHUNK_SIZE:
+                return deleted
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-n", "--count", type=int, default=10000, help="catalog size to reach")
+    parser.add_argument("--prefix", default=ISBN_PREFIX, help="ISBN prefix of seeded books")
+    parser.add_argument("--remove", action="store_true", help="delete all seeded books instead")
+    args = parser.parse_args()
+
+    if args.remove:
+        print(f"Deleted {remove()} seeded books")
+    else:
+        print(f"Inserted {seed(args.count, args.prefix)} books")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Service level objectives for Locust runs (locustfile.py --slo slo.json).
+
+The SLO file maps request names (as shown in Locust's statistics) to
+thresholds. "*" applies to every request name that has no entry of its own,
+and "Aggregated" to the totals:
+
+    {
+        "*": {"p95_ms": 1000, "failure_rate": 0.01},
+        "Get All Books": {"p95_ms": 500, "p99_ms": 1500},
+        "Aggregated": {"failure_rate": 0.01, "min_rps": 20}
+    }
+
+Supported thresholds: p50_ms, p90_ms, p95_ms, p99_ms, avg_ms, max_ms,
+failure_rate (0-1) and min_rps. A threshold set to null disables the
+default for that name. When the test ends, any breach sets Locust's exit
+code to 1, so a --headless run in CI fails.
+"""
+
+import json
+
+# threshold -> (how to read it from a Locust StatsEntry, breached when value is above the limit)
+CHECKS = {
+    "p50_ms": (lambda entry: entry.get_response_time_percentile(0.50), True),
+    "p90_ms": (lambda entry: entry.get_response_time_percentile(0.90), True),
+    "p95_ms": (lambda entry: entry.get_response_time_percentile(0.95), True),
+    "p99_ms": (lambda entry: entry.get_response_time_percentile(0.99), True),
+    "avg_ms": (lambda entry: entry.avg_response_time, True),
+    "max_ms": (lambda entry: entry.max_response_time, True),
+    "failure_rate": (lambda entry: entry.fail_ratio, True),
+    "min_rps": (lambda entry: entry.total_rps, False),
+}
+
+DEFAULT_KEY = "*"
+TOTAL_KEY = "Aggregated"
+
+
+def load(path):
+    """Read and validate an SLO file. Raises ValueError on unknown thresholds."""
+    with open(path) as f:
+        spec = json.load(f)
+    for name, thresholds in spec.items():
+        unknown = set(thresholds) - set(CHECKS)
+        if unknown:
+            raise ValueError(f"SLO for '{name}': unknown thresholds {', '.join(sorted(unknown))}")
+    return spec
+
+
+def _thresholds(spec, name):
+    if name == TOTAL_KEY:
+        thresholds = spec.get(TOTAL_KEY, {})
+    else:
+        thresholds = dict(spec.get(DEFAULT_KEY, {}), **spec.get(name, {}))
+    return {key: limit for key, limit in thresholds.items() if limit is not None}
+
+
+def evaluate(spec, stats):
+    """Check Locust `stats` (RequestStats) against `spec`.
+
+    Returns one (name, threshold, limit, actual, ok) row per check. Request
+    names that were never sent are not checked.
+    """
+    entries = [(entry.name, entry) for entry in stats.entries.values() if entry.num_requests]
+    entries.sort(key=lambda item: item[0])
+    entries.append((TOTAL_KEY, stats.total))
+
+    results = []
+    for name, entry in entries:
+        for key, limit in sorted(_thresholds(spec, name).items()):
+            read, upper_bound = CHECKS[key]
+            actual = read(entry)
+            ok = actual <= limit if upper_bound else actual >= limit
+            results.append((name, key, limit, actual, ok))
+    return results
+
+
+def report(results):
+    """Print the SLO table and return True if every objective was met."""
+    print()
+    print("SLO results")
+    print(f"{'Name':<36} {'Threshold':<13} {'Limit':>10} {'Actual':>10} {'Result':>7}")
+    for name, key, limit, actual, ok in results:
+        print(f"{name[:36]:<36} {key:<13} {limit:>10g} {actual:>10.3f} {'ok' if ok else 'FAIL':>7}")
+    return all(ok for *_, ok in results)
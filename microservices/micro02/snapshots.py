@@ -0,0 +1,242 @@
+"""
+Precompressed snapshots of the full catalog for GET /api/books.
+
+With SNAPSHOTS=true a background thread writes the complete catalog XML to
+SNAPSHOT_DIR as plain, gzip and (if the brotli package is installed) brotli
+files. It rebuilds SNAPSHOT_DEBOUNCE_SEC after a change (so a burst of
+writes produces one snapshot), and at least every SNAPSHOT_MAX_AGE_SEC in
+case a change event was missed. Before rebuilding it compares a cheap
+version query (row count, newest updated_at, newest tombstone) with the
+current snapshot, so idle workers do not rewrite identical files.
+
+Every gunicorn worker runs the writer, but builds are serialized by an
+exclusive lock on SNAPSHOT_DIR/.writer.lock and the version is compared
+again once the lock is held: when several workers wake for the same
+change, the first one builds and the others find the snapshot already
+current. A worker therefore never deletes files a peer is publishing or
+replaces catalog.json with an older catalog.
+
+Every snapshot is written under content-addressed names
+(catalog-<etag>.xml.gz) and published by atomically replacing
+catalog.json, so a reader never pairs one snapshot's metadata with
+another's data. get_all_books then serves the best encoding the client
+accepts with send_file (sendfile/X-Sendfile) and a strong ETag, without
+touching MariaDB or the serializer.
+"""
+
+import os
+import json
+import gzip
+import time
+import hashlib
+import threading
+from contextlib import contextmanager
+from dotenv import load_dotenv
+import db
+import sync
+import change_stream
+from xml_utils import books_to_xml
+
+load_dotenv()
+
+SNAPSHOTS = os.getenv("SNAPSHOTS", "false").lower() == "true"
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_DEBOUNCE_SEC = float(os.getenv("SNAPSHOT_DEBOUNCE_SEC", "2"))
+SNAPSHOT_MAX_AGE_SEC = float(os.getenv("SNAPSHOT_MAX_AGE_SEC", "60"))
+
+META_FILE = "catalog.json"
+LOCK_FILE = ".writer.lock"
+# Content-Encodings in order of preference
+ENCODINGS = ("br", "gzip", "identity")
+
+_VERSION_SQL = """
+    SELECT (SELECT COUNT(*) FROM libros) AS books,
+           (SELECT MAX(updated_at) FROM libros) AS updated,
+           (SELECT MAX(deleted_at) FROM libros_tombstones) AS deleted
+"""
+# Without the tombstone table a delete still changes the row count
+_VERSION_NO_TOMBSTONES_SQL = """
+    SELECT COUNT(*) AS books, MAX(updated_at) AS updated, NULL AS deleted FROM libros
+"""
+
+_wake = threading.Event()
+_writer_pid = None
+_writer_lock = threading.Lock()
+_subscribed = False
+_meta_cache = (None, None)
+
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+
+@contextmanager
+def _build_lock():
+    """Exclusive lock shared by every process writing to SNAPSHOT_DIR (released if the holder dies)."""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    try:
+        import fcntl
+    except ImportError:
+        # No flock (Windows): a single development server is the only writer
+        yield
+        return
+    with open(os.path.join(SNAPSHOT_DIR, LOCK_FILE), "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def _catalog_version():
+    conn = db.get_conn()
+    cursor = conn.cursor()
+    try:
+        try:
+            cursor.execute(_VERSION_SQL)
+        except Exception as e:
+            if not sync.is_missing_table(e):
+                raise
+            cursor.execute(_VERSION_NO_TOMBSTONES_SQL)
+        row = cursor.fetchone()
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return f"{row['books']}:{row['updated']}:{row['deleted']}"
+
+
+def _catalog_rows():
+    # Always from MariaDB: the in-memory catalog may lag the version just read
+    conn = db.get_conn()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT * FROM libros ORDER BY titulo")
+        rows = cursor.fetchall()
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return rows
+
+
+def read_meta():
+    """Current snapshot metadata, or None. Re-read only when catalog.json changes."""
+    global _meta_cache
+    path = os.path.join(SNAPSHOT_DIR, META_FILE)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached_mtime, meta = _meta_cache
+    if cached_mtime != mtime:
+        try:
+            with open(path) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        _meta_cache = (mtime, meta)
+    return meta
+
+
+def build(force=False):
+    """Write a new snapshot if the catalog changed since the current one. Returns the metadata."""
+    with _build_lock():
+        # Read under the lock: a peer may have published this version while we waited
+        version = _catalog_version()
+        current = read_meta()
+        if not force and current is not None and current.get("version") == version:
+            return current
+        return _write_snapshot(version, current)
+
+
+def _write_snapshot(version, current):
+    xml = books_to_xml(_catalog_rows()).encode("utf-8")
+    etag = hashlib.sha256(xml).hexdigest()[:32]
+    base = f"catalog-{etag}.xml"
+
+    files = {"identity": base}
+    _write_atomic(os.path.join(SNAPSHOT_DIR, base), xml)
+    _write_atomic(os.path.join(SNAPSHOT_DIR, base + ".gz"), gzip.compress(xml, compresslevel=9, mtime=0))
+    files["gzip"] = base + ".gz"
+    brotli = _brotli()
+    if brotli is not None:
+        _write_atomic(os.path.join(SNAPSHOT_DIR, base + ".br"), brotli.compress(xml, quality=11))
+        files["br"] = base + ".br"
+
+    meta = {"version": version, "etag": etag, "files": files, "bytes": len(xml), "built_at": time.time()}
+    _write_atomic(os.path.join(SNAPSHOT_DIR, META_FILE), json.dumps(meta).encode())
+    _remove_old(files.values(), current)
+    return meta
+
+
+def _remove_old(keep, previous):
+    """Delete superseded snapshot files, sparing the previous one for readers still sending it."""
+    keep = set(keep)
+    if previous is not None:
+        keep.update(previous.get("files", {}).values())
+    for name in os.listdir(SNAPSHOT_DIR):
+        if name.startswith("catalog-") and name not in keep and not name.endswith(".tmp"):
+            try:
+                os.unlink(os.path.join(SNAPSHOT_DIR, name))
+            except OSError:
+                pass
+
+
+def choose(accept_encoding):
+    """Return (path, content_encoding, etag) for the best snapshot the client accepts, or None."""
+    meta = read_meta()
+    if meta is None:
+        return None
+    accepted = {part.split(";")[0].strip().lower() for part in (accept_encoding or "").split(",")}
+    for encoding in ENCODINGS:
+        name = meta["files"].get(encoding)
+        if name and (encoding == "identity" or encoding in accepted or "*" in accepted):
+            return os.path.join(SNAPSHOT_DIR, name), encoding, f"{meta['etag']}-{encoding}"
+    return None
+
+
+def _writer_loop():
+    while True:
+        try:
+            build()
+        except Exception as e:
+            print(f"Warning: Catalog snapshot failed: {e}")
+        if _wake.wait(SNAPSHOT_MAX_AGE_SEC):
+            # Let a burst of writes settle into one rebuild
+            time.sleep(SNAPSHOT_DEBOUNCE_SEC)
+        _wake.clear()
+
+
+def wake(event=None):
+    """Schedule a rebuild after a catalog change."""
+    _wake.set()
+
+
+def ensure_started():
+    """Start the snapshot writer once per process (again in each forked worker)."""
+    global _writer_pid, _subscribed
+
+    if not SNAPSHOTS or _writer_pid == os.getpid():
+        return
+    with _writer_lock:
+        if _writer_pid != os.getpid():
+            if not _subscribed:
+                change_stream.on_change(wake)
+                _subscribed = True
+            change_stream.ensure_listening()
+            threading.Thread(target=_writer_loop, name="catalog-snapshot", daemon=True).start()
+            _writer_pid = os.getpid()
@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+import shutil
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from dotenv import load_dotenv
+import firebase_storage
+
+load_dotenv()
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "firebase").lower()
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", "media_store")
+STORAGE_PUBLIC_URL = os.getenv("STORAGE_PUBLIC_URL", "http://127.0.0.1:5000").rstrip("/")
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+class StorageBackend(ABC):
+    """Interface shared by the image storage implementations."""
+
+    name = None
+
+    @abstractmethod
+    def put_file(self, local_path, path, content_type):
+        """Store a local file under `path` and return its public URL (or None on failure)."""
+
+    @abstractmethod
+    def url(self, path):
+        """Return the public URL for `path`, or None if nothing is stored there."""
+
+
+class FirebaseStorageBackend(StorageBackend):
+    """Stores images in the configured Firebase Storage bucket."""
+
+    name = "firebase"
+
+    def put_file(self, local_path, path, content_type):
+        return firebase_storage.upload_file(local_path, path, content_type)
+
+    def url(self, path):
+        return firebase_storage.get_image_url(path)
+
+
+class LocalStorageBackend(StorageBackend):
+    """Content-addressed storage on the local filesystem.
+
+    Every distinct blob is written once to `blobs/<aa>/<bb>/<sha256>`; logical
+    paths such as `books/{isbn}/thumb.webp` are small pointer files under
+    `refs/` holding the hash and content type. Identical covers uploaded for
+    different ISBNs therefore share a single blob.
+    """
+
+    name = "local"
+
+    def __init__(self, root, public_url):
+        self.root = os.path.abspath(root)
+        self.public_url = public_url
+        self.blobs_dir = os.path.join(self.root, "blobs")
+        self.refs_dir = os.path.join(self.root, "refs")
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.refs_dir, exist_ok=True)
+
+    def _blob_path(self, digest):
+        return os.path.join(self.blobs_dir, digest[:2], digest[2:4], digest)
+
+    def _ref_path(self, path):
+        ref = os.path.normpath(os.path.join(self.refs_dir, path))
+        if not ref.startswith(self.refs_dir + os.sep):
+            raise ValueError(f"Invalid storage path: {path}")
+        return ref
+
+    @staticmethod
+    def _file_digest(local_path):
+        digest = hashlib.sha256()
+        with open(local_path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _atomic_write(target, write):
+        """Write through a temp file in the target directory, then rename into place."""
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as tmp:
+                write(tmp)
+            os.replace(tmp_path, target)
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def put_file(self, local_path, path, content_type):
+        try:
+            digest = self._file_digest(local_path)
+            blob_path = self._blob_path(digest)
+
+            if not os.path.exists(blob_path):
+                def copy_blob(tmp):
+                    with open(local_path, "rb") as src:
+                        shutil.copyfileobj(src, tmp, HASH_CHUNK_SIZE)
+                self._atomic_write(blob_path, copy_blob)
+
+            pointer = json.dumps({"sha256": digest, "content_type": content_type}).encode()
+            self._atomic_write(self._ref_path(path), lambda tmp: tmp.write(pointer))
+            return self.url_for(path)
+        except Exception as e:
+            print(f"Warning: Could not store {path} locally: {str(e)}")
+            return None
+
+    def resolve(self, path):
+        """Return (blob path, content type, sha256) for a logical path, or None."""
+        try:
+            with open(self._ref_path(path), "rb") as f:
+                pointer = json.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        blob_path = self._blob_path(pointer["sha256"])
+        if not os.path.exists(blob_path):
+            return None
+        return blob_path, pointer["content_type"], pointer["sha256"]
+
+    def url_for(self, path):
+        return f"{self.public_url}/media/{path}"
+
+    def url(self, path):
+        return self.url_for(path) if self.resolve(path) else None
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Return the storage backend selected by STORAGE_BACKEND ('firebase' or 'local')."""
+    global _storage
+
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if STORAGE_BACKEND == "local":
+                    _storage = LocalStorageBackend(STORAGE_LOCAL_DIR, STORAGE_PUBLIC_URL)
+                else:
+                    _storage = FirebaseStorageBackend()
+    return _storage
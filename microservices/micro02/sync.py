@@ -0,0 +1,165 @@
+"""
+Delta sync for the catalog.
+
+Every row in `libros` carries `updated_at` (maintained by MariaDB with ON
+UPDATE) and deleted books leave a row in `libros_tombstones`. A sync token
+is the database time at which the previous sync ran; GET /api/books/changes
+returns rows updated and ISBNs deleted since then, plus a new token.
+
+Transactions that stamp `updated_at` before the previous sync but commit
+after it would be missed, so each sync looks back SYNC_OVERLAP_SEC seconds
+further than the token. Clients therefore receive a few rows twice and must
+apply changes idempotently (upsert by ISBN). Tombstones are purged after
+SYNC_RETENTION_DAYS; older tokens get 410 and the client must resync from
+scratch (no `since`). Malformed, non-finite or future tokens get 400.
+"""
+
+import os
+import math
+from dotenv import load_dotenv
+import pymysql
+
+load_dotenv()
+
+SYNC_OVERLAP_SEC = float(os.getenv("SYNC_OVERLAP_SEC", "5"))
+SYNC_RETENTION_DAYS = int(os.getenv("SYNC_RETENTION_DAYS", "30"))
+
+TOKEN_VERSION = "v1"
+
+NOW_SQL = "SELECT UNIX_TIMESTAMP(NOW(6)) AS now"
+ALL_SQL = "SELECT * FROM libros ORDER BY updated_at, id"
+CHANGED_SQL = "SELECT * FROM libros WHERE updated_at >= FROM_UNIXTIME(%s) ORDER BY updated_at, id"
+DELETED_SQL = "SELECT isbn FROM libros_tombstones WHERE deleted_at >= FROM_UNIXTIME(%s) ORDER BY deleted_at"
+RECORD_TOMBSTONE_SQL = """
+    INSERT INTO libros_tombstones (isbn, deleted_at) VALUES (%s, NOW(6))
+    ON DUPLICATE KEY UPDATE deleted_at = NOW(6)
+"""
+CLEAR_TOMBSTONE_SQL = "DELETE FROM libros_tombstones WHERE isbn = %s"
+PURGE_TOMBSTONES_SQL = "DELETE FROM libros_tombstones WHERE deleted_at < NOW(6) - INTERVAL %s DAY"
+
+# ER_NO_SUCH_TABLE: the tombstone table has not been created yet
+_NO_SUCH_TABLE = 1146
+
+
+class TokenExpired(Exception):
+    """The token predates the tombstone retention window; a full resync is needed."""
+
+
+class InvalidToken(ValueError):
+    """The token is malformed or does not name a past database time."""
+
+
+def encode_token(timestamp):
+    return f"{TOKEN_VERSION}.{float(timestamp):.6f}"
+
+
+def decode_token(token):
+    """Return the epoch timestamp in a sync token. Raises InvalidToken if malformed."""
+    version, _, value = token.partition(".")
+    if version != TOKEN_VERSION or not value:
+        raise InvalidToken("Invalid sync token")
+    try:
+        since = float(value)
+    except ValueError:
+        raise InvalidToken("Invalid sync token")
+    # float() also accepts inf and nan, which would reach FROM_UNIXTIME()
+    if not math.isfinite(since):
+        raise InvalidToken("Invalid sync token")
+    return since
+
+
+def window_start(since, now):
+    """Lower bound for a sync from `since`; TokenExpired if too old, InvalidToken if in the future."""
+    if since > now:
+        raise InvalidToken("Invalid sync token")
+    if now - since > SYNC_RETENTION_DAYS * 86400:
+        raise TokenExpired(f"Sync token is older than {SYNC_RETENTION_DAYS} days")
+    return max(0.0, since - SYNC_OVERLAP_SEC)
+
+
+def is_missing_table(exc):
+    return isinstance(exc, pymysql.err.ProgrammingError) and bool(exc.args) and exc.args[0] == _NO_SUCH_TABLE
+
+
+def _changes(token):
+    """Yield the (query, args) of a sync and receive each result; return what changes() returns.
+
+    Shared by the blocking and the asyncio drivers so both validate tokens
+    and build the window the same way.
+    """
+    since = decode_token(token) if token else None
+    now = float((yield NOW_SQL, None)[0]["now"])
+
+    if since is None:
+        rows = yield ALL_SQL, None
+        return encode_token(now), rows, []
+
+    start = window_start(since, now)
+    rows = yield CHANGED_SQL, (start,)
+    deleted = [row["isbn"] for row in (yield DELETED_SQL, (start,))]
+    return encode_token(now), rows, deleted
+
+
+def changes(cursor, token=None):
+    """Return (new_token, changed_rows, deleted_isbns) since `token`; everything if no token.
+
+    Raises InvalidToken or TokenExpired for a token that cannot be synced from.
+    """
+    steps = _changes(token)
+    try:
+        query, args = next(steps)
+        while True:
+            cursor.execute(query, args)
+            query, args = steps.send(cursor.fetchall())
+    except StopIteration as done:
+        return done.value
+
+
+async def changes_async(cursor, token=None):
+    """changes() for an aiomysql cursor."""
+    steps = _changes(token)
+    try:
+        query, args = next(steps)
+        while True:
+            await cursor.execute(query, args)
+            query, args = steps.send(await cursor.fetchall())
+    except StopIteration as done:
+        return done.value
+
+
+def record_tombstone(cursor, isbn):
+    """Remember a deletion (same transaction as the DELETE) and purge expired tombstones."""
+    try:
+        cursor.execute(RECORD_TOMBSTONE_SQL, (isbn,))
+        cursor.execute(PURGE_TOMBSTONES_SQL, (SYNC_RETENTION_DAYS,))
+    except pymysql.err.ProgrammingError as e:
+        if not is_missing_table(e):
+            raise
+        print("Warning: libros_tombstones table missing; deletions are not visible to delta sync")
+
+
+def record_tombstones(cursor, isbns):
+    """record_tombstone() for a batch of ISBNs deleted in the same transaction, in one INSERT."""
+    if not isbns:
+        return
+    try:
+        cursor.execute(
+            "INSERT INTO libros_tombstones (isbn, deleted_at) VALUES "
+            + ", ".join(["(%s, NOW(6))"] * len(isbns))
+            + " ON DUPLICATE KEY UPDATE deleted_at = NOW(6)",
+            list(isbns)
+        )
+        cursor.execute(PURGE_TOMBSTONES_SQL, (SYNC_RETENTION_DAYS,))
+    except pymysql.err.ProgrammingError as e:
+        if not is_missing_table(e):
+            raise
+        print("Warning: libros_tombstones table missing; deletions are not visible to delta sync")
+
+
+def clear_tombstone(cursor, isbn):
+    """Forget an earlier deletion when the ISBN is created again."""
+    try:
+        cursor.execute(CLEAR_TOMBSTONE_SQL, (isbn,))
+    except pymysql.err.ProgrammingError as e:
+        if not is_missing_table(e):
+            raise
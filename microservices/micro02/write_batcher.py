@@ -0,0 +1,166 @@
+"""
+Group commit for concurrent catalog writes.
+
+With WRITE_BATCH=true, create and update requests that arrive within
+WRITE_BATCH_WINDOW_MS of each other share one transaction and therefore
+one commit (one fsync on the server) instead of one each.
+
+The first writer becomes the leader: it waits up to the window (less if
+WRITE_BATCH_MAX writers join), then runs every queued write in order, each
+inside its own SAVEPOINT. A write that fails is rolled back to its savepoint
+and gets its own exception; the others are unaffected. After the commit
+each caller receives its own result or error, so the request handlers
+answer exactly as if they had committed alone. Writers that queued while a
+batch was committing are handed to the next leader, so no request keeps
+committing other requests' batches.
+
+If the whole transaction is lost (a deadlock rolls back every savepoint)
+the batch is replayed one write per transaction. A lost connection or a
+failed commit is reported to every write in the batch, as it would be to a
+single request.
+"""
+
+import os
+import threading
+from dotenv import load_dotenv
+import metrics
+from breaker import DependencyUnavailable
+
+load_dotenv()
+
+WRITE_BATCH = os.getenv("WRITE_BATCH", "false").lower() == "true"
+WRITE_BATCH_WINDOW_MS = float(os.getenv("WRITE_BATCH_WINDOW_MS", "2"))
+WRITE_BATCH_MAX = int(os.getenv("WRITE_BATCH_MAX", "50"))
+
+BATCH_SIZE = metrics.Histogram(
+    "write_batch_size", "Writes committed together in one transaction.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+
+
+class _TransactionLost(Exception):
+    """The server rolled back the whole transaction, savepoints included."""
+
+
+class _Write:
+    def __init__(self, fn):
+        self.fn = fn
+        self.wake = threading.Event()
+        self.finished = False
+        self.result = None
+        self.error = None
+
+    def finish(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.finished = True
+        self.wake.set()
+
+
+class WriteBatcher:
+    """Run write functions in shared transactions, one savepoint per write.
+
+    Args:
+        get_conn: returns a database connection (closed after each batch)
+        window_ms: how long the leader waits for other writers
+        max_batch: most writes per transaction
+    """
+
+    def __init__(self, get_conn, window_ms=WRITE_BATCH_WINDOW_MS, max_batch=WRITE_BATCH_MAX):
+        self._get_conn = get_conn
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._lock = threading.Lock()
+        self._full = threading.Event()
+        self._pending = []
+        self._leading = False
+
+    def submit(self, fn):
+        """Run `fn(cursor)` in a batched transaction and return its result once committed.
+
+        Exceptions raised by `fn` (e.g. IntegrityError) are re-raised to this
+        caller only; `fn` must not commit or roll back itself.
+        """
+        write = _Write(fn)
+        with self._lock:
+            self._pending.append(write)
+            lead = not self._leading
+            self._leading = True
+            if len(self._pending) >= self.max_batch:
+                self._full.set()
+        if lead:
+            # Give concurrent writers a moment to join
+            self._full.wait(self.window)
+        else:
+            write.wake.wait()
+        if not write.finished:
+            # First writer, or promoted by the previous leader: this write is in the next batch
+            self._lead()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def _lead(self):
+        with self._lock:
+            batch = self._pending[:self.max_batch]
+            del self._pending[:self.max_batch]
+            self._full.clear()
+        try:
+            self._commit(batch)
+        finally:
+            with self._lock:
+                if self._pending:
+                    self._pending[0].wake.set()
+                else:
+                    self._leading = False
+
+    def _commit(self, batch):
+        try:
+            conn = self._get_conn()
+        except Exception as e:
+            for write in batch:
+                write.finish(error=e)
+            return
+        cursor = conn.cursor()
+        lost = None
+        try:
+            outcomes = [self._apply(cursor, write) for write in batch]
+            conn.commit()
+        except _TransactionLost as e:
+            lost = e
+        except Exception as e:
+            # Connection lost or commit failed: no write in the batch is known to be stored
+            for write in batch:
+                write.finish(error=e)
+            return
+        finally:
+            cursor.close()
+            conn.close()
+
+        if lost is not None:
+            if len(batch) == 1:
+                batch[0].finish(error=lost.__cause__)
+                return
+            # Replay one write per transaction so each gets its own answer
+            for write in batch:
+                self._commit([write])
+            return
+        BATCH_SIZE.observe(len(batch))
+        for write, (result, error) in zip(batch, outcomes):
+            write.finish(result, error)
+
+    def _apply(self, cursor, write):
+        """Run one write inside a savepoint. Returns (result, error)."""
+        cursor.execute("SAVEPOINT batch_write")
+        try:
+            result = write.fn(cursor)
+        except DependencyUnavailable:
+            raise
+        except Exception as e:
+            try:
+                cursor.execute("ROLLBACK TO SAVEPOINT batch_write")
+            except Exception:
+                raise _TransactionLost() from e
+            return None, e
+        cursor.execute("RELEASE SAVEPOINT batch_write")
+        return result, None
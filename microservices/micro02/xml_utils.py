@@ -1,8 +1,77 @@
+import os
+import threading
+from collections import OrderedDict
 from xml.etree.ElementTree import Element, SubElement, tostring
 from xml.dom import minidom
+from metrics import timed
 
-def books_to_xml(rows):
-    """Convert database rows to XML format."""
+# Rendered <libro> fragments kept for reuse, keyed by book id and updated_at
+FRAGMENT_CACHE_MAX_ENTRIES = int(os.getenv("FRAGMENT_CACHE_MAX_ENTRIES", "50000"))
+
+_XML_HEADER = '<?xml version="1.0" ?>\n'
+_LIST_OPEN = "<libros>\n"
+_LIST_CLOSE = "</libros>\n"
+
+class FragmentCache:
+    """LRU of rendered <libro> fragments: id -> (updated_at, isbn, fragment).
+
+    A row whose updated_at differs from the cached one is rendered again and
+    replaces the entry, so updates invalidate themselves. Deleted books are
+    dropped with invalidate_isbn() in this process and age out of the LRU
+    elsewhere (they are never requested again).
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._ids_by_isbn = {}
+        self.hits = 0
+        self.misses = 0
+
+    def fragments(self, rows):
+        """Return the fragment for each row, rendering only missing or outdated ones."""
+        result = [None] * len(rows)
+        missing = []
+        with self._lock:
+            for i, row in enumerate(rows):
+                entry = self._entries.get(row['id'])
+                if entry is not None and entry[0] == row['updated_at']:
+                    self._entries.move_to_end(row['id'])
+                    result[i] = entry[2]
+                else:
+                    missing.append(i)
+            self.hits += len(rows) - len(missing)
+            self.misses += len(missing)
+
+        rendered = [(i, _render_fragment(rows[i])) for i in missing]
+        if rendered:
+            with self._lock:
+                for i, fragment in rendered:
+                    row = rows[i]
+                    self._entries[row['id']] = (row['updated_at'], row.get('isbn'), fragment)
+                    self._entries.move_to_end(row['id'])
+                    self._ids_by_isbn[row.get('isbn')] = row['id']
+                    result[i] = fragment
+                while len(self._entries) > self.max_entries:
+                    _, (_, isbn, _) = self._entries.popitem(last=False)
+                    self._ids_by_isbn.pop(isbn, None)
+        return result
+
+    def invalidate_isbn(self, isbn):
+        with self._lock:
+            book_id = self._ids_by_isbn.pop(isbn, None)
+            if book_id is not None:
+                self._entries.pop(book_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+fragment_cache = FragmentCache(FRAGMENT_CACHE_MAX_ENTRIES)
+
+def _render_books(rows):
+    """Serialize rows with ElementTree + minidom (the reference output)."""
     root = Element("libros")
     
     for row in rows:
@@ -19,6 +88,23 @@ def books_to_xml(rows):
     reparsed = minidom.parseString(rough_string)
     return reparsed.toprettyxml(indent="  ")
 
+def _render_fragment(row):
+    """The exact lines _render_books produces for this row inside <libros>."""
+    document = _render_books([row])
+    return document[len(_XML_HEADER) + len(_LIST_OPEN):-len(_LIST_CLOSE)]
+
+@timed("xml", "books_to_xml")
+def books_to_xml(rows):
+    """Convert database rows to XML format.
+    
+    Rows carrying id and updated_at are assembled from cached per-book
+    fragments; the output is identical to serializing the whole list.
+    """
+    if FRAGMENT_CACHE_MAX_ENTRIES <= 0 or not rows or any('id' not in row or 'updated_at' not in row for row in rows):
+        return _render_books(rows)
+    return _XML_HEADER + _LIST_OPEN + "".join(fragment_cache.fragments(rows)) + _LIST_CLOSE
+
+@timed("xml", "create_error_xml")
 def create_error_xml(message):
     """Create an error XML response."""
     root = Element("error")
@@ -27,6 +113,7 @@ def create_error_xml(message):
     reparsed = minidom.parseString(rough_string)
     return reparsed.toprettyxml(indent="  ")
 
+@timed("xml", "create_success_xml")
 def create_success_xml(message):
     """Create a success XML response."""
     root = Element("success")
@@ -35,4 +122,24 @@ def create_success_xml(message):
     reparsed = minidom.parseString(rough_string)
     return reparsed.toprettyxml(indent="  ")
 
-
+@timed("xml", "changes_to_xml")
+def changes_to_xml(token, rows, deleted_isbns):
+    """Convert a delta sync result to XML: new token, changed books and deleted ISBNs."""
+    root = Element("cambios")
+    SubElement(root, "token").text = token
+    
+    actualizados = SubElement(root, "actualizados")
+    for row in rows:
+        libro = SubElement(actualizados, "libro")
+        for key, value in row.items():
+            if value is not None:
+                field = SubElement(libro, key)
+                field.text = str(value)
+    
+    eliminados = SubElement(root, "eliminados")
+    for isbn in deleted_isbns:
+        SubElement(eliminados, "isbn").text = isbn
+    
+    rough_string = tostring(root, encoding='unicode')
+    reparsed = minidom.parseString(rough_string)
+    return reparsed.toprettyxml(indent="  ")
@@ -631,7 +631,7 @@ function displayBooks(books) {
 
   // First, display all books immediately with placeholders
   for (const book of books) {
-    const imageUrl = book.imagen_url || book.imagenUrl || "";
+    const imageUrl = book.imagen_thumb_url || book.imagen_url || book.imagenUrl || "";
     
     const bookDiv = document.createElement("div");
     bookDiv.className = "book-item";